@@ -0,0 +1,8 @@
+"""
+Código comum a inventario_v1, inventario_v2 e inventario_v3.
+
+Fica ao lado do app no projeto (DjangoProject/inventario_comum) e entra em
+INSTALLED_APPS antes dele; cada versão importa daqui em vez de manter a própria
+cópia. Nada aqui importa os models de uma versão: quem precisa de dados recebe
+o queryset ou o caminho de quem chama.
+"""
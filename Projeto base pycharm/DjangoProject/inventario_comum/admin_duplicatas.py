@@ -0,0 +1,84 @@
+"""
+Página "Possíveis duplicatas" no admin de produtos (ver duplicatas.py).
+
+O ModelAdmin de produtos de cada versão herda DuplicatasAdminMixin; a URL fica
+em admin:<app>_<modelo>_duplicatas. A página só lê o último resultado salvo. O
+botão "Recalcular" enfileira o cálculo na fila `duplicatas` de tarefas.py e
+responde na hora; catálogos acima de settings.DUPLICATAS_LIMITE_ADMIN produtos
+(padrão LIMITE_ADMIN) não recalculam pelo admin: o cálculo leva minutos e fica
+com `manage.py detectar_duplicatas` (cron ou worker).
+"""
+from django.conf import settings
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.dateparse import parse_datetime
+
+from .tarefas import duplicatas as fila_duplicatas
+
+LIMITE_ADMIN = 20_000
+
+
+def limite_admin():
+    return int(getattr(settings, "DUPLICATAS_LIMITE_ADMIN", LIMITE_ADMIN))
+
+
+class DuplicatasAdminMixin:
+    change_list_template = "admin/inventario_comum/change_list_duplicatas.html"
+    duplicatas_template = "admin/inventario_comum/duplicatas.html"
+
+    def _nome_url_duplicatas(self):
+        return f"{self.model._meta.app_label}_{self.model._meta.model_name}_duplicatas"
+
+    def get_urls(self):
+        urls = [
+            path(
+                "duplicatas/",
+                self.admin_site.admin_view(self.duplicatas_view),
+                name=self._nome_url_duplicatas(),
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def duplicatas_view(self, request):
+        """Último resultado de detectar_duplicatas; POST enfileira o recálculo (ver o docstring do módulo)."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        chave = ("duplicatas", self.model._meta.label_lower)
+        if request.method == "POST":
+            if not self.has_change_permission(request):
+                raise PermissionDenied
+            self._pedir_recalculo(request, chave)
+            return redirect(f"admin:{self._nome_url_duplicatas()}")
+
+        # duplicatas importa o NumPy: só quando o admin abre a página, não na inicialização
+        from .duplicatas import carregar_resultado
+
+        resultado = carregar_resultado(self.model)
+        contexto = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Possíveis duplicatas",
+            "resultado": resultado,
+            "gerado_em": parse_datetime(resultado["gerado_em"]) if resultado else None,
+            "recalculando": fila_duplicatas.ocupada(chave),
+            "pode_recalcular": self.has_change_permission(request),
+            "limite_admin": limite_admin(),
+        }
+        return TemplateResponse(request, self.duplicatas_template, contexto)
+
+    def _pedir_recalculo(self, request, chave):
+        total = self.model._default_manager.count()
+        if total > limite_admin():
+            messages.warning(
+                request,
+                f"Catálogo com {total} produtos: o recálculo pelo admin vai até {limite_admin()}. "
+                "Rode python manage.py detectar_duplicatas.",
+            )
+            return
+        from .duplicatas import recalcular
+
+        fila_duplicatas.enfileirar(chave, recalcular, self.model)
+        messages.info(request, "Recálculo das duplicatas enfileirado; recarregue a página em instantes.")
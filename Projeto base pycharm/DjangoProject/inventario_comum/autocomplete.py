@@ -0,0 +1,21 @@
+"""
+Campos com autocomplete em vez de <select> com todas as linhas.
+
+campo_autocomplete() devolve um TextInput ligado a um endpoint JSON
+({"resultados": [{"id", "texto"}]}, parâmetro ?q=); o valor enviado é o pk,
+validado pelo queryset do campo do formulário. O template
+inventario_comum/_autocomplete.html, incluído uma vez na página, cria o
+<datalist> de cada campo e o preenche conforme o usuário digita.
+"""
+from django import forms
+from django.urls import reverse_lazy
+
+
+def campo_autocomplete(url_name, lista_id):
+    """TextInput com <datalist> `lista_id` preenchido sob demanda pelo endpoint `url_name`."""
+    return forms.TextInput(attrs={
+        "list": lista_id,
+        "data-autocomplete-url": reverse_lazy(url_name),
+        "autocomplete": "off",
+        "placeholder": "Digite para buscar",
+    })
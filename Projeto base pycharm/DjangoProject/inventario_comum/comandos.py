@@ -0,0 +1,59 @@
+"""
+Comandos de gerenciamento compartilhados: cada versão declara o seu em
+management/commands/ herdando daqui e apontando o próprio modelo.
+"""
+import json
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+
+class DetectarDuplicatas(BaseCommand):
+    # "app_label.Modelo" dos produtos analisados
+    modelo = None
+
+    help = (
+        "Agrupa produtos quase duplicados (ex.: \"Parafuso M6\" x \"Parafuso M-6 inox\") usando um índice "
+        "invertido de trigramas do nome/descrição; ver inventario_comum/duplicatas.py.\n"
+        "O resultado fica em MEDIA_ROOT/relatorios/duplicatas_<app>.json e aparece no admin de produtos.\n"
+        "Uso: python manage.py detectar_duplicatas [--limiar 0.6] [--json] [--sem-salvar]"
+    )
+
+    def add_arguments(self, parser):
+        from inventario_comum.duplicatas import LIMIAR_PADRAO
+
+        parser.add_argument(
+            "--limiar", type=float, default=LIMIAR_PADRAO,
+            help=f"Similaridade mínima (Jaccard de trigramas) entre 0 e 1 (default: {LIMIAR_PADRAO})",
+        )
+        parser.add_argument("--json", action="store_true", help="Escreve os grupos em JSON na saída padrão")
+        parser.add_argument("--sem-salvar", action="store_true", help="Não grava o resultado para o admin")
+
+    def handle(self, *args, **options):
+        from inventario_comum.duplicatas import detectar_duplicatas, salvar_resultado
+
+        limiar = options["limiar"]
+        if not 0 < limiar <= 1:
+            raise CommandError("--limiar precisa estar entre 0 (exclusivo) e 1.")
+        modelo = apps.get_model(self.modelo)
+
+        inicio = time.perf_counter()
+        grupos = detectar_duplicatas(modelo.objects.all(), limiar=limiar)
+        duracao = time.perf_counter() - inicio
+        if not options["sem_salvar"]:
+            salvar_resultado(modelo, grupos, limiar=limiar)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(grupos, ensure_ascii=False, indent=2))
+            return
+        for numero, grupo in enumerate(grupos, start=1):
+            self.stdout.write(
+                f"Grupo {numero}: {len(grupo['produtos'])} produtos, similaridade >= {grupo['similaridade']}, "
+                f"estoque somado {grupo['quantidade_total']}"
+            )
+            for produto in grupo["produtos"]:
+                self.stdout.write(f"  #{produto['pk']} {produto['nome']} ({produto['quantidade']})")
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(grupos)} grupo(s) de possíveis duplicatas encontrados em {duracao:.1f}s.")
+        )
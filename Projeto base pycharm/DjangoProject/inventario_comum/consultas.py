@@ -0,0 +1,100 @@
+"""
+Orçamento de consultas SQL por view.
+
+Views de classe declaram `max_consultas = N` (como paginate_by); views função
+usam @orcamento_consultas(N). O orçamento também pode ser por método HTTP,
+`max_consultas = {"GET": 4}`: os métodos fora do dict ficam sem orçamento (um
+POST que grava ou gera arquivos). O OrcamentoConsultasMiddleware conta as consultas
+de cada request e, se a view passar do orçamento, registra um aviso ou levanta
+OrcamentoConsultasExcedido conforme settings.ORCAMENTO_CONSULTAS_MODO:
+
+    "log"       - logger.warning com a consulta mais repetida (padrão)
+    "erro"      - levanta a exceção (dev/testes)
+    "desligado" - não conta nada
+
+O orçamento conta o request inteiro (sessão, usuário, permissões, template) e
+não deve depender do número de linhas: um N+1 estoura o limite já na primeira
+página cheia.
+"""
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+import logging
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+MODOS = ("log", "erro", "desligado")
+
+
+class OrcamentoConsultasExcedido(Exception):
+    def __init__(self, view, maximo, consultas):
+        self.view = view
+        self.maximo = maximo
+        self.consultas = list(consultas)
+        super().__init__(
+            f"{view} fez {len(self.consultas)} consultas SQL (orçamento: {maximo}); "
+            f"mais repetida: {mais_repetida(self.consultas)}"
+        )
+
+
+def orcamento_consultas(maximo):
+    """Declara o máximo de consultas por request de uma view função (ou classe)."""
+    def decorador(view):
+        view.max_consultas = maximo
+        return view
+    return decorador
+
+
+def orcamento_da_view(view_func, metodo=None):
+    """max_consultas da view (ou da view_class) para `metodo`; None se não houver."""
+    maximo = getattr(view_func, "max_consultas", None)
+    if maximo is None:
+        maximo = getattr(getattr(view_func, "view_class", None), "max_consultas", None)
+    if isinstance(maximo, dict):
+        return maximo.get(metodo)
+    return maximo
+
+
+def mais_repetida(consultas):
+    if not consultas:
+        return ""
+    sql, vezes = Counter(consultas).most_common(1)[0]
+    return f"{vezes}x {sql}"
+
+
+class ContadorConsultas:
+    """execute_wrapper que guarda o SQL de cada consulta, em todas as conexões."""
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.consultas)
+
+    @contextmanager
+    def medindo(self):
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(self))
+            yield self
+
+
+def modo_atual():
+    modo = getattr(settings, "ORCAMENTO_CONSULTAS_MODO", "log")
+    return modo if modo in MODOS else "log"
+
+
+def verificar_orcamento(view, maximo, consultas, modo=None):
+    modo = modo or modo_atual()
+    if maximo is None or modo == "desligado" or len(consultas) <= maximo:
+        return
+    erro = OrcamentoConsultasExcedido(view, maximo, consultas)
+    if modo == "erro":
+        raise erro
+    logger.warning("%s", erro)
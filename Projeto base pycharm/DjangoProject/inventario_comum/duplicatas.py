@@ -0,0 +1,256 @@
+"""
+Detecção de produtos quase duplicados ("Parafuso M6" x "Parafuso M-6 inox").
+
+Comparar todos os pares de nomes é O(n²). Aqui cada produto vira o conjunto de
+trigramas de caracteres do nome e da descrição normalizados (sem acentos, caixa
+nem pontuação), e um índice invertido trigrama -> produtos gera candidatos só a
+partir dos trigramas raros do nome: com os trigramas de cada nome em ordem de
+frequência no catálogo, dois nomes com Jaccard >= t obrigatoriamente têm em
+comum um dos |x| - ceil(t·|x|) + 1 primeiros (filtro de prefixo). Trigramas
+comuns ("par", "ara") ficam no fim da ordem e quase nunca geram pares. Nomes com
+números diferentes ("M6" x "M8", "1m" x "2m") não são duplicatas, por mais
+parecidos que sejam: as postagens são separadas por assinatura numérica, então
+esses pares nem chegam a ser gerados.
+
+Os candidatos são pontuados em lote com NumPy: Jaccard dos trigramas do nome e,
+quando os dois produtos têm descrição, média ponderada com o Jaccard das
+descrições (PESO_DESCRICAO), em lotes de até LOTE_PARES pares (memória
+limitada mesmo com muitos candidatos). Pares acima do limiar viram grupos
+(componentes conexos). Produtos com nome e descrição normalizados idênticos
+entram juntos sem passar pelo índice.
+
+O resultado da última execução de `manage.py detectar_duplicatas` fica em
+MEDIA_ROOT/relatorios/duplicatas_<app>.json (um arquivo por modelo de produtos)
+e é mostrado no admin de produtos (DuplicatasAdminMixin, em admin_duplicatas.py).
+Os produtos vêm do queryset de quem chama: qualquer modelo com nome, descricao e
+quantidade.
+"""
+from collections import defaultdict
+import json
+from pathlib import Path
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+import numpy as np
+
+from .texto import normalizar
+
+N = 3
+LIMIAR_PADRAO = 0.6
+PESO_DESCRICAO = 0.25
+# postagens maiores que isso (prefixos inteiros de trigramas comuns) não geram pares
+LIMITE_POSTAGEM = 1000
+LOTE_PARES = 200_000
+
+
+def texto_normalizado(texto):
+    """Minúsculas, sem acentos nem pontuação ("M-6" -> "m6"), espaços simples."""
+    return " ".join(re.sub(r"[^\w\s]", "", normalizar(texto)).split())
+
+
+def numeros(texto):
+    return frozenset(re.findall(r"\d+", texto))
+
+
+def ngramas(texto, n=N):
+    if not texto:
+        return set()
+    texto = f" {texto} "
+    return {texto[i:i + n] for i in range(len(texto) - n + 1)}
+
+
+def _conjuntos(textos, vocabulario):
+    """(indptr, ids): ids de n-grama de cada texto, ordenados, no formato CSR."""
+    indptr = np.zeros(len(textos) + 1, dtype=np.int64)
+    ids = []
+    for i, texto in enumerate(textos):
+        ids.extend(sorted(vocabulario.setdefault(g, len(vocabulario)) for g in ngramas(texto)))
+        indptr[i + 1] = len(ids)
+    return indptr, np.asarray(ids, dtype=np.int64)
+
+
+def _candidatos(indptr, ids, limiar, assinaturas=None):
+    """
+    Gera lotes (a, b), a < b, de pares que compartilham um n-grama do prefixo raro
+    de ambos e têm a mesma assinatura (ids inteiros; None = todos iguais). Um par
+    pode aparecer em mais de um lote.
+    """
+    total = len(indptr) - 1
+    if assinaturas is None:
+        assinaturas = np.zeros(total, dtype=np.int64)
+    tamanhos = np.diff(indptr)
+    doc = np.repeat(np.arange(total), tamanhos)
+    frequencia = np.bincount(ids, minlength=int(ids.max()) + 1 if len(ids) else 0)
+    # n-gramas de cada documento do mais raro para o mais comum
+    ordem = np.lexsort((ids, frequencia[ids], doc))
+    posicao = np.arange(len(ids)) - indptr[doc]
+    prefixo = tamanhos - np.ceil(limiar * tamanhos).astype(np.int64) + 1
+    no_prefixo = ordem[posicao < prefixo[doc]]
+    docs, grams = doc[no_prefixo], ids[no_prefixo]
+
+    # postagens por (assinatura, n-grama)
+    sigs = assinaturas[docs]
+    por_postagem = np.lexsort((docs, grams, sigs))
+    docs, grams, sigs = docs[por_postagem], grams[por_postagem], sigs[por_postagem]
+    inicios = np.flatnonzero(np.r_[True, (grams[1:] != grams[:-1]) | (sigs[1:] != sigs[:-1])])
+    fins = np.r_[inicios[1:], len(grams)]
+    pares = []
+    acumulados = 0
+    triangulos = {}
+    for inicio, fim in zip(inicios, fins):
+        tamanho = fim - inicio
+        if tamanho < 2 or tamanho > LIMITE_POSTAGEM:
+            continue
+        if tamanho not in triangulos:
+            triangulos[tamanho] = np.triu_indices(tamanho, k=1)
+        i, j = triangulos[tamanho]
+        membros = docs[inicio:fim]
+        pares.append(membros[i] * total + membros[j])
+        acumulados += len(i)
+        if acumulados >= LOTE_PARES:
+            yield _separar(pares, total)
+            pares, acumulados = [], 0
+    if pares:
+        yield _separar(pares, total)
+
+
+def _separar(pares, total):
+    chaves = np.unique(np.concatenate(pares))
+    return chaves // total, chaves % total
+
+
+def _jaccard(indptr, ids, chaves_globais, largura, a, b):
+    """Jaccard entre os conjuntos a[k] e b[k], vetorizado (0 quando os dois são vazios)."""
+    if not len(chaves_globais):
+        return np.zeros(len(a))
+    tam_a = indptr[a + 1] - indptr[a]
+    tam_b = indptr[b + 1] - indptr[b]
+    # cada n-grama de a[k] é procurado nas chaves (doc, n-grama) de b[k]
+    par = np.repeat(np.arange(len(a)), tam_a)
+    deslocamento = np.arange(len(par)) - np.repeat(np.cumsum(tam_a) - tam_a, tam_a)
+    procuradas = b[par] * largura + ids[indptr[a][par] + deslocamento]
+    achadas = np.searchsorted(chaves_globais, procuradas)
+    achadas = np.minimum(achadas, len(chaves_globais) - 1)
+    comuns = np.bincount(par, weights=chaves_globais[achadas] == procuradas, minlength=len(a))
+    uniao = tam_a + tam_b - comuns
+    return np.divide(comuns, uniao, out=np.zeros(len(a)), where=uniao > 0)
+
+
+def _chaves_globais(indptr, ids, largura):
+    # ordenadas porque os documentos vêm em ordem e os ids de cada um já estão ordenados
+    return np.repeat(np.arange(len(indptr) - 1), np.diff(indptr)) * largura + ids
+
+
+class _Grupos:
+    def __init__(self, total):
+        self.pai = list(range(total))
+
+    def raiz(self, i):
+        while self.pai[i] != i:
+            self.pai[i] = self.pai[self.pai[i]]
+            i = self.pai[i]
+        return i
+
+    def unir(self, a, b):
+        ra, rb = self.raiz(a), self.raiz(b)
+        if ra != rb:
+            self.pai[max(ra, rb)] = min(ra, rb)
+
+
+def detectar_duplicatas(produtos_qs, limiar=LIMIAR_PADRAO):
+    """
+    Grupos de produtos quase duplicados, maiores primeiro:
+    [{"produtos": [{"pk", "nome", "quantidade"}], "quantidade_total", "similaridade"}],
+    com similaridade = menor pontuação entre os pares que formaram o grupo.
+    """
+    linhas = list(produtos_qs.order_by("pk").values_list("pk", "nome", "descricao", "quantidade").iterator())
+
+    # produtos com nome e descrição normalizados iguais viram uma entrada só
+    entradas = {}
+    membros = []
+    for indice, (_, nome, descricao, _) in enumerate(linhas):
+        chave = (texto_normalizado(nome), texto_normalizado(descricao))
+        if chave not in entradas:
+            entradas[chave] = len(membros)
+            membros.append([])
+        membros[entradas[chave]].append(indice)
+    chaves = list(entradas)
+    por_numeros = {}
+    assinaturas = np.asarray([por_numeros.setdefault(numeros(nome), len(por_numeros)) for nome, _ in chaves], dtype=np.int64)
+
+    vocabulario = {}
+    ptr_nome, ids_nome = _conjuntos([nome for nome, _ in chaves], vocabulario)
+    ptr_desc, ids_desc = _conjuntos([descricao for _, descricao in chaves], vocabulario)
+    largura = max(len(vocabulario), 1)
+    globais_nome = _chaves_globais(ptr_nome, ids_nome, largura)
+    globais_desc = _chaves_globais(ptr_desc, ids_desc, largura)
+
+    # com descrição, o nome sozinho precisa de pelo menos este Jaccard para o par passar do limiar
+    limiar_nome = max(0.0, (limiar - PESO_DESCRICAO) / (1 - PESO_DESCRICAO))
+    grupos = _Grupos(len(linhas))
+    pontuacao = {}
+    for lote_a, lote_b in _candidatos(ptr_nome, ids_nome, limiar_nome, assinaturas):
+        nome = _jaccard(ptr_nome, ids_nome, globais_nome, largura, lote_a, lote_b)
+        descricao = _jaccard(ptr_desc, ids_desc, globais_desc, largura, lote_a, lote_b)
+        com_descricao = (np.diff(ptr_desc)[lote_a] > 0) & (np.diff(ptr_desc)[lote_b] > 0)
+        nota = np.where(com_descricao, (1 - PESO_DESCRICAO) * nome + PESO_DESCRICAO * descricao, nome)
+        for k in np.flatnonzero(nota >= limiar):
+            x, y = membros[lote_a[k]][0], membros[lote_b[k]][0]
+            grupos.unir(x, y)
+            pontuacao[(x, y)] = float(nota[k])
+    for indices in membros:
+        for outro in indices[1:]:
+            grupos.unir(indices[0], outro)
+            pontuacao[(indices[0], outro)] = 1.0
+
+    por_raiz = defaultdict(list)
+    for indice in range(len(linhas)):
+        por_raiz[grupos.raiz(indice)].append(indice)
+    menor = defaultdict(lambda: 1.0)
+    for (x, _), nota in pontuacao.items():
+        raiz = grupos.raiz(x)
+        menor[raiz] = min(menor[raiz], nota)
+
+    resultado = []
+    for raiz, indices in por_raiz.items():
+        if len(indices) < 2:
+            continue
+        produtos = [{"pk": linhas[i][0], "nome": linhas[i][1], "quantidade": linhas[i][3]} for i in indices]
+        resultado.append(
+            {
+                "produtos": produtos,
+                "quantidade_total": sum(p["quantidade"] for p in produtos),
+                "similaridade": round(menor[raiz], 3),
+            }
+        )
+    resultado.sort(key=lambda g: (-len(g["produtos"]), g["produtos"][0]["nome"]))
+    return resultado
+
+
+def recalcular(modelo, limiar=LIMIAR_PADRAO):
+    """Detecta e salva as duplicatas de todos os produtos de `modelo` (tarefa do admin)."""
+    return salvar_resultado(modelo, detectar_duplicatas(modelo._default_manager.all(), limiar=limiar), limiar=limiar)
+
+
+def _arquivo_resultado(modelo):
+    if not getattr(settings, "MEDIA_ROOT", None):
+        raise ImproperlyConfigured("settings.MEDIA_ROOT precisa estar configurado para guardar relatórios.")
+    return Path(settings.MEDIA_ROOT) / "relatorios" / f"duplicatas_{modelo._meta.app_label}.json"
+
+
+def salvar_resultado(modelo, grupos, limiar=LIMIAR_PADRAO):
+    arquivo = _arquivo_resultado(modelo)
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    dados = {"gerado_em": timezone.now().isoformat(), "limiar": limiar, "grupos": grupos}
+    arquivo.write_text(json.dumps(dados, ensure_ascii=False), encoding="utf-8")
+    return arquivo
+
+
+def carregar_resultado(modelo):
+    """Último resultado salvo para `modelo` ({"gerado_em", "limiar", "grupos"}) ou None."""
+    try:
+        return json.loads(_arquivo_resultado(modelo).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
@@ -0,0 +1,38 @@
+"""
+Fragmentos das listas paginadas/filtradas.
+
+Com o cabeçalho "X-Fragmento: 1" (ou ?fragmento=1) uma view com FragmentoMixin
+renderiza só `fragmento_template_name` (tabela e paginação) em vez da página
+inteira: sem base.html, navegação, mensagens e context processors. O script de
+_fragmentos.html troca o conteúdo do contêiner [data-fragmento] e atualiza a
+URL com history.pushState, então a URL da página inteira continua sendo a do
+estado atual (favoritos e recarregar funcionam sem JavaScript).
+
+O fragmento é renderizado sem request: nada de {% csrf_token %}, request.* ou
+variáveis de context processors nos templates de fragmento.
+"""
+from django.template.response import SimpleTemplateResponse
+from django.utils.cache import patch_vary_headers
+
+CABECALHO = "X-Fragmento"
+PARAMETRO = "fragmento"
+
+
+def pede_fragmento(request):
+    return request.headers.get(CABECALHO) == "1" or request.GET.get(PARAMETRO) == "1"
+
+
+class FragmentoMixin:
+    fragmento_template_name = None
+
+    def eh_fragmento(self):
+        return self.fragmento_template_name is not None and pede_fragmento(self.request)
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.eh_fragmento():
+            response = SimpleTemplateResponse(self.fragmento_template_name, context, **response_kwargs)
+        else:
+            response = super().render_to_response(context, **response_kwargs)
+        # mesma URL, duas representações: caches intermediários precisam distinguir
+        patch_vary_headers(response, (CABECALHO,))
+        return response
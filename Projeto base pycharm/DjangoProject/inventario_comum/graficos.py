@@ -0,0 +1,304 @@
+"""
+Desenho dos gráficos de barras dos relatórios num pool de processos aquecido.
+
+Cada gráfico é descrito por um dict simples (serializável para outro processo):
+
+    {"arquivo": caminho do PNG, "titulo": str, "rotulos": [str], "valores": [número],
+     "cor": str, "tamanho": (largura, altura) em polegadas,
+     "horizontal": bool, "rotulo_eixo": str, "rotacao": graus dos rótulos do eixo x,
+     "margem": fração acima do maior valor (barras verticais), "dpi": int}
+
+e desenhado com a API orientada a objetos (Figure + FigureCanvasAgg), sem o
+estado global do pyplot. desenhar_graficos envia os gráficos de um relatório ao
+mesmo tempo para o pool: o tempo total fica perto do gráfico mais lento.
+
+Cada processo que desenha (worker do servidor web, comando, fila de tarefas)
+tem o seu pool, criado no primeiro uso e mantido entre relatórios; aquecer()
+sobe os processos e já paga o import do matplotlib e o cache de fontes, então
+quem gera o relatório o chama antes das consultas. O pool usa "spawn" (nada
+herdado das threads do processo web).
+
+O limite settings.RELATORIOS_PROCESSOS_GRAFICOS (padrão 3, um por gráfico do
+relatório) vale para a máquina inteira, não por processo: cada processo do
+pool ocupa uma vaga de inventario_comum/vagas.py, em arquivos de
+settings.RELATORIOS_PASTA_VAGAS (padrão <tmp>/inventario-graficos). Um pool é
+criado com as vagas livres naquele momento; quando não há nenhuma, quem quer
+desenhar espera a primeira que soltar. Um pool parado por
+settings.RELATORIOS_GRAFICOS_OCIOSO segundos (padrão 30) é encerrado e devolve
+as vagas, então N workers web não seguram 3N processos. O limite é relido a
+cada uso: se mudar, o pool é recriado na próxima vez que estiver parado. Com 0
+os gráficos são desenhados no próprio processo, um depois do outro.
+
+Este módulo não usa Django nos processos do pool: só desenhar() roda lá.
+
+Rasterizar com o matplotlib é a parte mais cara de um relatório. No formato
+"svg" (padrão; settings.RELATORIOS_FORMATO) os mesmos dicts viram SVG gerado
+aqui mesmo, sem importar o matplotlib nem usar o pool, com arquivos dezenas de
+vezes menores; "png" continua disponível como opção.
+"""
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from html import escape
+import logging
+import math
+import multiprocessing
+from pathlib import Path
+import tempfile
+import threading
+
+from django.conf import settings
+
+from inventario_comum import vagas
+
+logger = logging.getLogger(__name__)
+
+PROCESSOS_PADRAO = 3
+OCIOSO_PADRAO = 30
+FORMATOS = ("svg", "png")
+FORMATO_PADRAO = "svg"
+# nomes de cor do matplotlib usados nos relatórios, para o SVG
+CORES = {"tab:blue": "#1f77b4", "tab:orange": "#ff7f0e", "tab:green": "#2ca02c"}
+LIMITE_ROTULO = 32
+
+_trava = threading.Lock()
+_pool = None
+_vagas = []  # vagas ocupadas pelo pool, uma por processo
+_limite = None  # RELATORIOS_PROCESSOS_GRAFICOS quando o pool foi criado
+_em_uso = 0
+_relogio = None  # threading.Timer que encerra o pool ocioso
+
+
+def _processos():
+    return max(0, int(getattr(settings, "RELATORIOS_PROCESSOS_GRAFICOS", PROCESSOS_PADRAO)))
+
+
+def _pasta_vagas():
+    return Path(getattr(settings, "RELATORIOS_PASTA_VAGAS", None) or Path(tempfile.gettempdir()) / "inventario-graficos")
+
+
+def _preparar_processo():
+    # import do matplotlib e cache de fontes pagos uma vez por processo
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figura = Figure(figsize=(1, 1))
+    figura.add_subplot().set_title("aquecimento")
+    FigureCanvasAgg(figura).draw()
+
+
+def _nada():
+    return None
+
+
+def _encerrar_pool():
+    # chamado com _trava: as vagas só voltam depois que os processos saíram
+    global _pool, _vagas, _limite
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        vagas.liberar(_vagas)
+        _pool, _vagas, _limite = None, [], None
+
+
+def _encerrar_se_ocioso():
+    with _trava:
+        if not _em_uso:
+            _encerrar_pool()
+
+
+@contextmanager
+def _usando_pool(esperar=True):
+    """
+    O pool deste processo enquanto o bloco roda. Sem pool, ocupa as vagas livres
+    e cria um com um processo por vaga; com esperar=False e nenhuma vaga livre
+    devolve None. Ao sair, o pool fica para o próximo relatório até ficar ocioso.
+    """
+    global _pool, _vagas, _limite, _em_uso, _relogio
+    limite = _processos()
+    with _trava:
+        if _pool is not None and _limite != limite and not _em_uso:
+            _encerrar_pool()
+        if _pool is None:
+            _vagas = vagas.ocupar(_pasta_vagas(), "graficos", limite, esperar=esperar)
+            if _vagas:
+                _pool = ProcessPoolExecutor(
+                    max_workers=len(_vagas),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_preparar_processo,
+                )
+                _limite = limite
+        pool = _pool
+        _em_uso += 1
+    try:
+        yield pool
+    finally:
+        with _trava:
+            _em_uso -= 1
+            if _relogio is not None:
+                _relogio.cancel()
+            ocioso = getattr(settings, "RELATORIOS_GRAFICOS_OCIOSO", OCIOSO_PADRAO)
+            _relogio = threading.Timer(ocioso, _encerrar_se_ocioso)
+            _relogio.daemon = True
+            _relogio.start()
+
+
+def _descartar_pool(pool):
+    with _trava:
+        if _pool is pool:
+            _encerrar_pool()
+
+
+def encerrar():
+    """Encerra o pool deste processo e devolve as vagas (testes, desligamento)."""
+    with _trava:
+        if _relogio is not None:
+            _relogio.cancel()
+        _encerrar_pool()
+
+
+def aquecer():
+    """Sobe os processos do pool sem esperar por eles nem por vagas (idempotente)."""
+    if _processos():
+        with _usando_pool(esperar=False) as pool:
+            for _ in range(len(_vagas) if pool is not None else 0):
+                pool.submit(_nada)
+
+
+def desenhar(grafico):
+    """Desenha `grafico` em PNG e devolve o caminho do arquivo."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    rotulos, valores = grafico["rotulos"], grafico["valores"]
+    posicoes = range(len(rotulos))
+    figura = Figure(figsize=grafico["tamanho"])
+    FigureCanvasAgg(figura)
+    eixos = figura.add_subplot()
+    if grafico.get("horizontal"):
+        eixos.barh(posicoes, valores, color=grafico["cor"])
+        eixos.set_yticks(posicoes)
+        eixos.set_yticklabels(rotulos)
+        # primeiro item no topo
+        eixos.invert_yaxis()
+        eixos.set_xlabel(grafico.get("rotulo_eixo", ""))
+    else:
+        eixos.bar(posicoes, valores, color=grafico["cor"])
+        eixos.set_xticks(posicoes)
+        eixos.set_xticklabels(rotulos, rotation=grafico.get("rotacao", 0), ha="right" if grafico.get("rotacao") else "center")
+        eixos.set_ylabel(grafico.get("rotulo_eixo", ""))
+        if "margem" in grafico:
+            eixos.set_ylim(0, max(valores) * (1 + grafico["margem"]) if any(valores) else 1)
+    eixos.set_title(grafico["titulo"])
+    figura.tight_layout()
+    figura.savefig(grafico["arquivo"], dpi=grafico.get("dpi", 100))
+    return grafico["arquivo"]
+
+
+def desenhar_graficos(graficos):
+    """
+    Desenha todos os gráficos (em paralelo quando há pool) e devolve os caminhos na
+    mesma ordem. O primeiro erro de desenho é relançado depois que todos terminam.
+    """
+    if not _processos():
+        return [desenhar(grafico) for grafico in graficos]
+    with _usando_pool() as pool:
+        try:
+            futuros = [pool.submit(desenhar, grafico) for grafico in graficos]
+            wait(futuros)
+            return [futuro.result() for futuro in futuros]
+        except BrokenProcessPool:
+            # um processo do pool morreu (OOM, kill): o próximo relatório cria outro pool
+            logger.exception("Pool de gráficos quebrado; desenhando no próprio processo")
+            _descartar_pool(pool)
+    ocupadas = vagas.ocupar(_pasta_vagas(), "graficos", _processos(), quantas=1, esperar=True)
+    try:
+        return [desenhar(grafico) for grafico in graficos]
+    finally:
+        vagas.liberar(ocupadas)
+
+
+def formato_do_relatorio(formato=None):
+    """`formato` ou o de settings.RELATORIOS_FORMATO; ValueError se não for um de FORMATOS."""
+    formato = formato or getattr(settings, "RELATORIOS_FORMATO", FORMATO_PADRAO)
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de relatório inválido: {formato!r} (use {' ou '.join(FORMATOS)}).")
+    return formato
+
+
+def _n(valor):
+    return f"{valor:.1f}".rstrip("0").rstrip(".")
+
+
+def _rotulo(texto):
+    texto = str(texto)
+    return escape(texto if len(texto) <= LIMITE_ROTULO else texto[:LIMITE_ROTULO - 1] + "…")
+
+
+def svg(grafico):
+    """O gráfico (mesmo dict de desenhar) como SVG compacto, sem matplotlib."""
+    largura, altura = (round(medida * 100) for medida in grafico["tamanho"])
+    rotulos = grafico["rotulos"]
+    valores = [max(valor or 0, 0) for valor in grafico["valores"]]
+    maximo = max(valores, default=0) * (1 + grafico.get("margem", 0)) or 1
+    cor = escape(CORES.get(grafico["cor"], grafico["cor"]))
+    horizontal = grafico.get("horizontal")
+    rotacao = grafico.get("rotacao", 0)
+    maior_rotulo = min(max((len(str(r)) for r in rotulos), default=0), LIMITE_ROTULO)
+
+    topo, direita = 32, 40 if horizontal else 16
+    esquerda = min(largura // 2, 16 + 6 * maior_rotulo) if horizontal else 48
+    base = 36 if horizontal or not rotacao else 20 + round(6 * maior_rotulo * math.sin(math.radians(rotacao)))
+    area_l, area_a = largura - esquerda - direita, altura - topo - base
+    titulo = escape(grafico["titulo"])
+    partes = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{largura}" height="{altura}" '
+        f'viewBox="0 0 {largura} {altura}" font-family="sans-serif" font-size="11">',
+        f'<title>{titulo}</title><rect width="100%" height="100%" fill="#fff"/>',
+        f'<text x="{largura / 2:.0f}" y="20" font-size="14" text-anchor="middle">{titulo}</text>',
+    ]
+    passo = (area_a if horizontal else area_l) / max(len(rotulos), 1)
+    barra = passo * 0.7
+    for i, (rotulo, valor) in enumerate(zip(rotulos, valores)):
+        inicio = i * passo + (passo - barra) / 2
+        tamanho = valor / maximo * (area_l if horizontal else area_a)
+        if horizontal:
+            y = topo + inicio
+            partes.append(f'<rect x="{esquerda}" y="{_n(y)}" width="{_n(tamanho)}" height="{_n(barra)}" fill="{cor}"/>')
+            meio = _n(y + barra / 2 + 4)
+            partes.append(f'<text x="{esquerda - 6}" y="{meio}" text-anchor="end">{_rotulo(rotulo)}</text>')
+            partes.append(f'<text x="{_n(esquerda + tamanho + 4)}" y="{meio}">{_n(valor)}</text>')
+        else:
+            x = esquerda + inicio
+            y = topo + area_a - tamanho
+            centro = _n(x + barra / 2)
+            partes.append(f'<rect x="{_n(x)}" y="{_n(y)}" width="{_n(barra)}" height="{_n(tamanho)}" fill="{cor}"/>')
+            partes.append(f'<text x="{centro}" y="{_n(y - 3)}" text-anchor="middle">{_n(valor)}</text>')
+            y_rotulo = topo + area_a + 14
+            if rotacao:
+                partes.append(
+                    f'<text x="{centro}" y="{y_rotulo}" text-anchor="end" '
+                    f'transform="rotate(-{rotacao} {centro} {y_rotulo})">{_rotulo(rotulo)}</text>'
+                )
+            else:
+                partes.append(f'<text x="{centro}" y="{y_rotulo}" text-anchor="middle">{_rotulo(rotulo)}</text>')
+    eixo = escape(grafico.get("rotulo_eixo", ""))
+    if horizontal:
+        partes.append(f'<path d="M{esquerda} {topo}V{topo + area_a}" stroke="#333"/>')
+        if eixo:
+            partes.append(f'<text x="{_n(esquerda + area_l / 2)}" y="{altura - 8}" text-anchor="middle">{eixo}</text>')
+    else:
+        partes.append(f'<path d="M{esquerda} {topo + area_a}H{esquerda + area_l}" stroke="#333"/>')
+        if eixo:
+            meio = _n(topo + area_a / 2)
+            partes.append(f'<text x="14" y="{meio}" text-anchor="middle" transform="rotate(-90 14 {meio})">{eixo}</text>')
+    partes.append("</svg>")
+    return "".join(partes)
+
+
+def escrever_graficos(graficos, formato):
+    """Grava os gráficos em `formato` ("svg" aqui mesmo, "png" pelo pool) e devolve os caminhos."""
+    if formato == "png":
+        return desenhar_graficos(graficos)
+    for grafico in graficos:
+        Path(grafico["arquivo"]).write_text(svg(grafico), encoding="utf-8")
+    return [grafico["arquivo"] for grafico in graficos]
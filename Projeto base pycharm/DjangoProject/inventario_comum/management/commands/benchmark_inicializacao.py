@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark da inicialização: django.setup() + carga das URLs num processo novo.
+
+Cada rodada sobe um interpretador limpo (como um worker do servidor), configura
+o Django, carrega o URLconf inteiro e mede o tempo. Também confere quais
+dependências pesadas foram importadas no caminho: matplotlib, pandas e numpy só
+podem carregar dentro de quem desenha gráficos (inventario_comum/graficos.py)
+ou calcula duplicatas (inventario_comum/duplicatas.py) e nos scripts de análise,
+nunca em import de módulo de views, signals ou admin de qualquer versão. Se
+alguma aparecer o comando termina com erro.
+
+Uso:
+  python manage.py benchmark_inicializacao --repeticoes 5
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PESADOS = ("matplotlib", "pandas", "numpy")
+
+_SCRIPT = """
+import json, sys, time
+inicio = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+segundos = time.perf_counter() - inicio
+pesados = sorted({nome.split(".")[0] for nome in sys.modules} & set(sys.argv[1:]))
+print(json.dumps({"segundos": segundos, "pesados": pesados}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Mede django.setup() + URLs num processo novo e falha se matplotlib, pandas ou numpy forem importados."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeticoes", type=int, default=3, help="Processos medidos (usa a mediana).")
+
+    def handle(self, *args, **options):
+        repeticoes = max(1, options["repeticoes"])
+        ambiente = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE,
+            "PYTHONPATH": os.pathsep.join(p for p in sys.path if p),
+        }
+        tempos = []
+        pesados = set()
+        for _ in range(repeticoes):
+            processo = subprocess.run(
+                [sys.executable, "-c", _SCRIPT, *PESADOS], env=ambiente, capture_output=True, text=True
+            )
+            if processo.returncode:
+                raise CommandError(f"Falha ao inicializar o Django:\n{processo.stderr}")
+            medida = json.loads(processo.stdout.strip().splitlines()[-1])
+            tempos.append(medida["segundos"])
+            pesados.update(medida["pesados"])
+
+        self.stdout.write(
+            f"inicialização (django.setup + URLs): {statistics.median(tempos) * 1000:.1f} ms (mediana de {repeticoes})"
+        )
+        if pesados:
+            raise CommandError(f"Importados na inicialização: {', '.join(sorted(pesados))}")
+        self.stdout.write(f"nenhum de {', '.join(PESADOS)} importado")
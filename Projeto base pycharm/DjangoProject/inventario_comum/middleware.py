@@ -0,0 +1,40 @@
+"""
+Middleware do orçamento de consultas (ver consultas.py).
+
+Adicione no início da lista:
+
+    MIDDLEWARE = [
+        "inventario_comum.middleware.OrcamentoConsultasMiddleware",
+        ...
+    ]
+"""
+from .consultas import ContadorConsultas, modo_atual, orcamento_da_view, verificar_orcamento
+
+
+class OrcamentoConsultasMiddleware:
+    """
+    Confere o orçamento de consultas (max_consultas / @orcamento_consultas) da
+    view atendida; ver consultas.py. Deve ser o primeiro da lista para contar
+    também as consultas de sessão e autenticação.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        modo = modo_atual()
+        if modo == "desligado":
+            return self.get_response(request)
+        contador = ContadorConsultas()
+        with contador.medindo():
+            response = self.get_response(request)
+        orcamento = getattr(request, "_orcamento_consultas", None)
+        if orcamento is not None:
+            verificar_orcamento(orcamento[0], orcamento[1], contador.consultas, modo)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        maximo = orcamento_da_view(view_func, request.method)
+        if maximo is not None:
+            nome = getattr(request.resolver_match, "view_name", None) or view_func.__qualname__
+            request._orcamento_consultas = (nome, maximo)
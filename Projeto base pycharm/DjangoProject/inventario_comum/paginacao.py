@@ -0,0 +1,175 @@
+"""
+Paginadores que evitam o COUNT(*) do Paginator do Django a cada página.
+
+PaginadorContagemCacheada: para listas que mostram o total de páginas.
+  - lista sem filtro (Model.objects.all()): no Postgres, acima de
+    LIMITE_ESTIMATIVA linhas usa a estimativa do planejador (pg_class.reltuples);
+    nos demais casos um contador mantido no cache, contado uma vez e depois
+    ajustado +1/-1 pelos receivers do signals.py de cada app após cada commit;
+  - lista filtrada: o COUNT vai para o cache numa chave com a versão das
+    contagens e a assinatura da consulta (o SQL já inclui tabela, visibilidade e
+    filtros).
+  O total só desenha a navegação: cada página busca per_page + 1 linhas, como
+  no PaginadorSondado, e vale se tiver linhas; a linha extra decide "próxima".
+
+PaginadorSondado: para listas que só precisam de "anterior/próxima". Não conta
+nada; cada página busca per_page + 1 linhas e a linha extra diz se há próxima.
+count e num_pages ficam None.
+
+Escritas em lote (bulk_create, update, delete de queryset) não disparam signals:
+os valores do cache expiram em CONTAGEM_CACHE_TIMEOUT. Um total defasado nunca
+corta linhas: páginas além dele continuam abrindo e "próxima" continua aparecendo,
+e quando a sonda vê mais linhas que o total, o total da página sobe para o visto.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
+
+from inventario_comum.versoes import invalidar_versao, versao_atual
+
+CONTAGEM_CACHE_TIMEOUT = 5 * 60
+LIMITE_ESTIMATIVA = 100_000
+_CHAVE_VERSAO = "inventario_comum:contagens:versao"
+
+
+def _chave_contador(db_table):
+    return f"inventario_comum:contagens:tabela:{db_table}"
+
+
+def versao_dados():
+    return versao_atual(_CHAVE_VERSAO)
+
+
+def invalidar_contagens():
+    invalidar_versao(_CHAVE_VERSAO)
+
+
+def ajustar_contador(modelo, delta):
+    """+1/-1 no contador mantido da tabela do modelo (se já estiver no cache), após o commit."""
+    chave = _chave_contador(modelo._meta.db_table)
+
+    def ajustar():
+        try:
+            cache.incr(chave, delta)
+        except ValueError:
+            pass
+
+    transaction.on_commit(ajustar)
+
+
+def query_sem_pagina(params, parametro="page"):
+    """
+    Querystring atual sem o parâmetro de página (?page=, ou ?cursor= na paginação
+    por cursor) nem ?fragmento=, para os links de página preservarem filtros e busca.
+    """
+    params = params.copy()
+    params.pop(parametro, None)
+    params.pop("fragmento", None)
+    return params.urlencode()
+
+
+def _sem_filtro(qs):
+    consulta = qs.query
+    return not consulta.where and not consulta.distinct and not consulta.is_sliced and len(consulta.alias_map) <= 1
+
+
+def _estimativa_postgres(qs):
+    conexao = connections[qs.db]
+    if conexao.vendor != "postgresql":
+        return None
+    with conexao.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [qs.model._meta.db_table])
+        linha = cursor.fetchone()
+    return linha[0] if linha and linha[0] >= LIMITE_ESTIMATIVA else None
+
+
+def _numero_da_pagina(number):
+    try:
+        if isinstance(number, float) and not number.is_integer():
+            raise ValueError
+        number = int(number)
+    except (TypeError, ValueError):
+        raise PageNotAnInteger("Número de página inválido.")
+    if number < 1:
+        raise EmptyPage("Número de página menor que 1.")
+    return number
+
+
+class PaginadorContagemCacheada(Paginator):
+    # True quando count veio da estimativa do planejador (templates podem dizer "cerca de")
+    estimado = False
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not hasattr(qs, "query"):
+            return super().count
+        if _sem_filtro(qs):
+            estimativa = _estimativa_postgres(qs)
+            if estimativa is not None:
+                self.estimado = True
+                return estimativa
+            chave = _chave_contador(qs.model._meta.db_table)
+        else:
+            sql, params = qs.order_by().query.sql_with_params()
+            assinatura = hashlib.md5(repr((sql, params)).encode("utf-8")).hexdigest()
+            chave = f"inventario_comum:contagens:{versao_dados()}:{assinatura}"
+        total = cache.get(chave)
+        if total is None:
+            total = qs.count()
+            cache.add(chave, total, CONTAGEM_CACHE_TIMEOUT)
+        return total
+
+    def validate_number(self, number):
+        # não compara com num_pages: o total pode estar defasado (ver page)
+        return _numero_da_pagina(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        inicio = (number - 1) * self.per_page
+        linhas = list(self.object_list[inicio:inicio + self.per_page + 1])
+        if not linhas and number > 1:
+            raise EmptyPage("Página sem resultados.")
+        tem_proxima = len(linhas) > self.per_page
+        vistos = inicio + len(linhas)
+        if vistos > self.count:
+            # total abaixo do real: a navegação passa a ir até onde a sonda viu
+            self.__dict__["count"] = vistos
+            self.__dict__.pop("num_pages", None)
+        return PaginaSondada(linhas[:self.per_page], number, self, tem_proxima=tem_proxima)
+
+
+class PaginaSondada(Page):
+    def __init__(self, object_list, number, paginator, tem_proxima):
+        super().__init__(object_list, number, paginator)
+        self.tem_proxima = tem_proxima
+
+    def has_next(self):
+        return self.tem_proxima
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1 if self.object_list else 0
+
+
+class PaginadorSondado(Paginator):
+    count = None
+    num_pages = None
+
+    def validate_number(self, number):
+        return _numero_da_pagina(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        inicio = (number - 1) * self.per_page
+        linhas = list(self.object_list[inicio:inicio + self.per_page + 1])
+        if not linhas and number > 1:
+            raise EmptyPage("Página sem resultados.")
+        return PaginaSondada(linhas[:self.per_page], number, self, tem_proxima=len(linhas) > self.per_page)
@@ -0,0 +1,86 @@
+"""
+Tarefas em segundo plano (relatórios disparados por login ou por alterações).
+
+Gerar um relatório desenha três gráficos, o que custa centenas de
+milissegundos; os signals de cada versão só enfileiram a tarefa e respondem. Um
+único worker (thread) por processo executa as tarefas em ordem; os gráficos de
+cada relatório são desenhados em paralelo no pool de processos de graficos.py.
+
+As tarefas são agrupadas por chave. Pedir de novo uma chave que ainda espera na
+fila não cria outra execução (o mesmo usuário logando duas vezes gera um
+relatório só); pedir enquanto ela executa agenda uma única repetição ao final,
+porque a execução em andamento pode ter lido dados anteriores ao pedido.
+
+Enquanto o relatório novo não fica pronto, o anterior continua sendo servido:
+cada versão só publica o novo quando ele está completo.
+
+A fila `duplicatas` (recálculo pedido no admin de produtos) tem o próprio
+worker, para não atrasar os relatórios.
+
+Com settings.RELATORIOS_EM_SEGUNDO_PLANO = False as tarefas rodam na hora, na
+thread de quem pediu (scripts, depuração).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class FilaCoalescente:
+    def __init__(self, nome):
+        self.nome = nome
+        self._trava = threading.Lock()
+        self._livre = threading.Condition(self._trava)
+        self._pendentes = {}  # chave -> (funcao, args, kwargs) do pedido mais recente
+        self._executando = set()
+        self._executor = None
+
+    def enfileirar(self, chave, funcao, *args, **kwargs):
+        """True se criou uma execução; False se o pedido juntou-se a uma que ainda espera na fila."""
+        if not getattr(settings, "RELATORIOS_EM_SEGUNDO_PLANO", True):
+            funcao(*args, **kwargs)
+            return True
+        with self._trava:
+            nova = chave not in self._pendentes
+            self._pendentes[chave] = (funcao, args, kwargs)
+            if nova and chave not in self._executando:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.nome)
+                self._executor.submit(self._executar, chave)
+        return nova
+
+    def ocupada(self, chave):
+        """A chave tem execução em andamento ou na fila."""
+        with self._trava:
+            return chave in self._pendentes or chave in self._executando
+
+    def aguardar(self, timeout=None):
+        """Espera a fila esvaziar; False se o timeout acabar antes."""
+        with self._livre:
+            return self._livre.wait_for(lambda: not self._pendentes and not self._executando, timeout)
+
+    def _executar(self, chave):
+        while True:
+            with self._trava:
+                tarefa = self._pendentes.pop(chave, None)
+                if tarefa is None:
+                    self._executando.discard(chave)
+                    self._livre.notify_all()
+                    return
+                self._executando.add(chave)
+            funcao, args, kwargs = tarefa
+            try:
+                funcao(*args, **kwargs)
+            except Exception:
+                logger.exception("Falha na tarefa %s da fila %s", chave, self.nome)
+            finally:
+                # conexões do worker não podem ficar abertas entre tarefas
+                connections.close_all()
+
+
+relatorios = FilaCoalescente("relatorios")
+duplicatas = FilaCoalescente("duplicatas")
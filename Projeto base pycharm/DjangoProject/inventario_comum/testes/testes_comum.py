@@ -0,0 +1,159 @@
+# Testes do código comum às versões do inventário.
+from io import StringIO
+import threading
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.paginator import EmptyPage
+from django.views import View
+
+from inventario_comum import duplicatas, graficos, tarefas, vagas
+from inventario_comum.consultas import orcamento_consultas, orcamento_da_view
+from inventario_comum.paginacao import PaginadorContagemCacheada
+from inventario_comum.versoes import invalidar_versao, versao_atual
+
+
+def test_orcamento_da_view_por_metodo():
+    class SoGet(View):
+        max_consultas = {"GET": 4}
+
+    class Fixo(View):
+        max_consultas = 7
+
+    assert orcamento_da_view(SoGet.as_view(), "GET") == 4
+    assert orcamento_da_view(SoGet.as_view(), "POST") is None
+    assert orcamento_da_view(Fixo.as_view(), "POST") == 7
+    assert orcamento_da_view(orcamento_consultas(3)(lambda request: None), "GET") == 3
+    assert orcamento_da_view(lambda request: None, "GET") is None
+
+
+@pytest.mark.django_db
+def test_versao_incrementa_agora_e_apos_o_commit(django_capture_on_commit_callbacks):
+    chave = "inventario_comum:testes:versao"
+    cache.delete(chave)
+    inicial = versao_atual(chave)
+    assert versao_atual(chave) == inicial
+    assert versao_atual(chave, lida=7) == 7
+    with django_capture_on_commit_callbacks(execute=True):
+        invalidar_versao(chave)
+        assert versao_atual(chave) == inicial + 1
+    assert versao_atual(chave) == inicial + 2
+
+    cache.delete(chave)
+    invalidar_versao(chave)  # chave despejada: recomeça pelo relógio
+    assert versao_atual(chave) > inicial
+
+
+@pytest.mark.django_db
+def test_contagem_defasada_nao_esconde_paginas():
+    cache.clear()
+    User = get_user_model()
+    User.objects.bulk_create(User(username=f"pag{i:02d}") for i in range(10))
+    usuarios = User.objects.order_by("pk")
+    assert PaginadorContagemCacheada(usuarios, 5).count == 10
+
+    # bulk_create não dispara signals: o total em cache fica abaixo do real
+    User.objects.bulk_create(User(username=f"pag{i:02d}") for i in range(10, 23))
+    paginador = PaginadorContagemCacheada(usuarios, 5)
+    assert paginador.num_pages == 2
+    pagina = paginador.page(2)
+    assert pagina.has_next() and paginador.num_pages == 3
+    pagina = PaginadorContagemCacheada(usuarios, 5).page(5)
+    assert [u.username for u in pagina] == ["pag20", "pag21", "pag22"] and not pagina.has_next()
+    assert pagina.start_index() == 21 and pagina.paginator.count == 23
+    with pytest.raises(EmptyPage):
+        PaginadorContagemCacheada(usuarios, 5).page(6)
+
+    # total acima do real: a última página real não oferece "próxima"
+    User.objects.filter(username__gte="pag15").delete()
+    paginador = PaginadorContagemCacheada(usuarios, 5)
+    assert not paginador.page(3).has_next()
+    with pytest.raises(EmptyPage):
+        paginador.page(4)
+
+
+def test_duplicatas_candidatos_sem_comparar_todos_os_pares():
+    assert duplicatas.texto_normalizado("Parafuso M-6  Inóx") == "parafuso m6 inox"
+    # candidatos só de n-gramas raros: nomes distintos geram uma fração dos pares possíveis
+    silabas = [c + v for c in "bcdfglmnprstv" for v in "aeiou"]
+    textos = [" ".join(silabas[(i * k * 7919) % len(silabas)] + silabas[(i + k) % len(silabas)] for k in (1, 2, 3)) for i in range(2000)]
+    indptr, ids = duplicatas._conjuntos(textos, {})
+    pares = {(x, y) for a, b in duplicatas._candidatos(indptr, ids, duplicatas.LIMIAR_PADRAO) for x, y in zip(a, b)}
+    assert len(pares) < 2000 * 1999 // 2 // 20 and all(x < y for x, y in pares)
+
+
+def test_fila_de_tarefas_agrupa_pedidos_da_mesma_chave():
+    fila = tarefas.FilaCoalescente("teste")
+    comecou, liberar = threading.Event(), threading.Event()
+    execucoes = []
+
+    def tarefa(nome):
+        execucoes.append(nome)
+        comecou.set()
+        liberar.wait(5)
+
+    assert fila.enfileirar("a", tarefa, "a1")
+    assert comecou.wait(5)
+    # "a" executando: o próximo pedido agenda uma repetição, os seguintes juntam-se a ela
+    assert fila.enfileirar("a", tarefa, "a2")
+    assert not fila.enfileirar("a", tarefa, "a3")
+    assert fila.enfileirar("b", tarefa, "b1")
+    assert fila.ocupada("a") and fila.ocupada("b")
+    liberar.set()
+    assert fila.aguardar(5)
+    assert execucoes == ["a1", "a3", "b1"]
+    assert not fila.ocupada("a")
+
+
+def test_graficos_no_pool_com_vagas_divididas_entre_processos(settings, tmp_path):
+    def barras(nome, **extras):
+        return {
+            "arquivo": str(tmp_path / nome), "titulo": nome, "rotulos": ["a", "b"], "valores": [3, 1],
+            "cor": "#2e86c1", "tamanho": (4, 3), **extras,
+        }
+
+    pedidos = [barras("v.png", rotacao=35, margem=0.15), barras("h.png", horizontal=True), barras("z.png")]
+    settings.RELATORIOS_PASTA_VAGAS = str(tmp_path / "vagas")
+    settings.RELATORIOS_PROCESSOS_GRAFICOS = 2
+    # outro processo ocupa uma das duas vagas: este pool sobe com um processo só
+    de_outro = vagas.ocupar(tmp_path / "vagas", "graficos", 2, quantas=1)
+    try:
+        graficos.aquecer()
+        assert graficos.desenhar_graficos(pedidos) == [p["arquivo"] for p in pedidos]
+        # o pool continua vivo para o próximo relatório, dentro do limite da máquina
+        assert graficos._pool is not None and len(graficos._vagas) == 1
+        assert vagas.ocupar(tmp_path / "vagas", "graficos", 2) == []
+        for nome in ("v.png", "h.png", "z.png"):
+            assert (tmp_path / nome).read_bytes().startswith(b"\x89PNG")
+        with pytest.raises(KeyError):
+            graficos.desenhar_graficos([barras("ok.png"), {"arquivo": str(tmp_path / "sem_titulo.png")}])
+        assert (tmp_path / "ok.png").exists()
+
+        # o limite é relido: mudou, o pool parado é recriado com as vagas livres
+        vagas.liberar(de_outro)
+        settings.RELATORIOS_PROCESSOS_GRAFICOS = 3
+        graficos.desenhar_graficos(pedidos[:1])
+        assert len(graficos._vagas) == 3
+
+        # ocioso, o pool é encerrado e devolve as vagas
+        graficos._encerrar_se_ocioso()
+        assert graficos._pool is None
+        livres = vagas.ocupar(tmp_path / "vagas", "graficos", 3)
+        assert len(livres) == 3
+        vagas.liberar(livres)
+
+        settings.RELATORIOS_PROCESSOS_GRAFICOS = 0
+        (tmp_path / "v.png").unlink()
+        graficos.desenhar_graficos(pedidos[:1])
+        assert (tmp_path / "v.png").exists() and graficos._pool is None
+    finally:
+        vagas.liberar(de_outro)
+        graficos.encerrar()
+
+
+def test_inicializacao_nao_importa_dependencias_pesadas():
+    out = StringIO()
+    call_command("benchmark_inicializacao", repeticoes=1, stdout=out)
+    assert "nenhum de matplotlib, pandas, numpy importado" in out.getvalue()
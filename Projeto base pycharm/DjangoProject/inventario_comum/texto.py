@@ -0,0 +1,7 @@
+import unicodedata
+
+
+def normalizar(texto):
+    """Minúsculas e sem acentos ("Peças" -> "pecas")."""
+    decomposto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).lower()
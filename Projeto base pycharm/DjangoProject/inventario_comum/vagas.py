@@ -0,0 +1,61 @@
+"""
+Semáforo entre processos feito de arquivos travados (uma "vaga" por arquivo).
+
+Cada vaga é o arquivo <pasta>/<nome>-<i>.trava, i < limite, travado com flock
+(msvcrt.locking no Windows) enquanto o processo a ocupa. O sistema operacional
+solta a trava quando o arquivo é fechado ou o processo morre, então uma vaga
+nunca fica presa por um processo que caiu. Todos os processos que usam a mesma
+pasta (os workers do servidor web, comandos, a fila de tarefas) dividem as
+mesmas `limite` vagas.
+"""
+from pathlib import Path
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+INTERVALO_ESPERA = 0.05
+
+
+def _travar(arquivo):
+    try:
+        if fcntl is not None:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(arquivo.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def ocupar(pasta, nome, limite, quantas=None, esperar=False):
+    """
+    Ocupa até `quantas` (padrão `limite`) vagas livres e devolve os arquivos
+    abertos, a serem passados a liberar(). Com esperar=True bloqueia até
+    conseguir pelo menos uma; senão devolve [] quando todas estão ocupadas.
+    """
+    pasta = Path(pasta)
+    pasta.mkdir(parents=True, exist_ok=True)
+    quantas = min(limite, quantas or limite)
+    while True:
+        ocupadas = []
+        for i in range(limite):
+            if len(ocupadas) == quantas:
+                break
+            arquivo = open(pasta / f"{nome}-{i}.trava", "a+b")
+            if _travar(arquivo):
+                ocupadas.append(arquivo)
+            else:
+                arquivo.close()
+        if ocupadas or not esperar or not limite:
+            return ocupadas
+        time.sleep(INTERVALO_ESPERA)
+
+
+def liberar(ocupadas):
+    """Solta as vagas devolvidas por ocupar()."""
+    for arquivo in ocupadas:
+        arquivo.close()
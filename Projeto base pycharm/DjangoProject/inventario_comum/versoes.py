@@ -0,0 +1,38 @@
+"""
+Versões de dados no cache, para chaves que se invalidam sozinhas.
+
+Quem guarda um resultado no cache põe versao_atual(CHAVE) na chave dele; quem
+escreve chama invalidar_versao(CHAVE). Nada é apagado: as entradas da versão
+anterior deixam de ser lidas e expiram. Com vários processos o backend de cache
+precisa ser compartilhado (Redis/Memcached/DB).
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def versao_atual(chave, lida=None):
+    """Versão guardada em `chave` (ou `lida`, se quem chama já a trouxe num cache.get_many)."""
+    if lida is not None:
+        return lida
+    # valor inicial baseado no relógio para não colidir com entradas antigas após despejo da chave
+    cache.add(chave, time.time_ns(), None)
+    return cache.get(chave)
+
+
+def incrementar_versao(chave):
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, time.time_ns(), None)
+
+
+def invalidar_versao(chave):
+    """
+    Incrementa a versão agora (este processo não relê valores antigos) e de novo
+    após o commit (quem leu durante a transação não deixa valores velhos na
+    versão nova).
+    """
+    incrementar_versao(chave)
+    transaction.on_commit(lambda: incrementar_versao(chave))
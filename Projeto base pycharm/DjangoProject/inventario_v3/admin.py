@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Produto, Movimento, Categoria, PerfilUsuario, TabelaProdutos, AcessoTabela
+from .models import (
+    Produto, Movimento, Categoria, PerfilUsuario, TabelaProdutos, AcessoTabela, AcessoGrupoTabela, PermissaoEfetiva,
+    ArquivoRelatorio,
+)
 
 
 @admin.register(TabelaProdutos)
@@ -15,6 +18,41 @@ class AcessoTabelaAdmin(admin.ModelAdmin):
     list_filter = ("nivel",)
 
 
+@admin.register(AcessoGrupoTabela)
+class AcessoGrupoTabelaAdmin(admin.ModelAdmin):
+    list_display = ("grupo", "tabela", "nivel", "criado_em")
+    search_fields = ("grupo__name", "tabela__nome")
+    list_filter = ("nivel",)
+
+
+@admin.register(PermissaoEfetiva)
+class PermissaoEfetivaAdmin(admin.ModelAdmin):
+    # somente leitura: mantida por permissoes.recalcular_permissoes_efetivas
+    list_display = ("usuario", "tabela", "nivel")
+    search_fields = ("usuario__username", "tabela__nome")
+    list_filter = ("nivel",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArquivoRelatorio)
+class ArquivoRelatorioAdmin(admin.ModelAdmin):
+    # somente leitura: gravado por gerar_relatorio e indexar_relatorios
+    list_display = ("nome", "pasta", "dono", "escopo", "tamanho", "gerado_em")
+    search_fields = ("nome", "dono__username")
+    list_filter = ("compartilhado",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Produto)
 class ProdutoAdmin(admin.ModelAdmin):
     list_display = ('nome', 'quantidade', 'preco', 'categoria')
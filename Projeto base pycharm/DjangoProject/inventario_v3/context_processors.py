@@ -0,0 +1,7 @@
+# inventario_v3/context_processors.py
+from .contexto import contexto_do_request
+
+
+def contexto_usuario(request):
+    """Expõe `contexto_usuario` (perfil, tabela ativa, permissões) em todos os templates."""
+    return {"contexto_usuario": contexto_do_request(request)}
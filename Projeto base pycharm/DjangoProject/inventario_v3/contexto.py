@@ -0,0 +1,77 @@
+# inventario_v3/contexto.py
+"""
+Contexto do usuário por request (perfil, função, tabela ativa e permissões).
+
+ContextoUsuario é preguiçoso: nada é consultado até o primeiro acesso. O perfil é
+carregado uma única vez junto com a tabela ativa (select_related("current_tabela"))
+e também fica no cache de request.user.perfil, então views e templates que usam
+user.perfil.current_tabela não disparam consultas extras. O objeto vive em
+request.contexto_usuario (ver middleware.ContextoUsuarioMiddleware).
+"""
+from functools import cached_property
+
+from .models import PerfilUsuario
+from .permissoes import permissoes_do_request, tem_acesso_total
+
+ATTR_REQUEST = "contexto_usuario"
+
+
+class ContextoUsuario:
+    def __init__(self, request, user=None):
+        self.request = request
+        self.user = user if user is not None else getattr(request, "user", None)
+
+    @property
+    def autenticado(self):
+        return bool(self.user and getattr(self.user, "is_authenticated", False))
+
+    @cached_property
+    def perfil(self):
+        if not self.autenticado:
+            return None
+        perfil = (
+            PerfilUsuario.objects
+            .select_related("current_tabela")
+            .filter(usuario_id=self.user.pk)
+            .first()
+        )
+        if perfil is not None:
+            # preenche o cache de user.perfil (mesma instância, com current_tabela já carregada)
+            self.user.perfil = perfil
+        return perfil
+
+    @property
+    def current_tabela(self):
+        return self.perfil.current_tabela if self.perfil else None
+
+    @property
+    def funcao(self):
+        return self.perfil.funcao if self.perfil else None
+
+    @property
+    def acesso_total(self):
+        return self.autenticado and tem_acesso_total(self.user)
+
+    @property
+    def is_staff(self):
+        return self.autenticado and (self.user.is_staff or self.user.is_superuser)
+
+    @property
+    def permissoes(self):
+        return permissoes_do_request(self.request, self.user)
+
+    def tem_nivel(self, tabela, required_level="leitura"):
+        return self.autenticado and self.permissoes.tem_nivel(getattr(tabela, "pk", tabela), required_level)
+
+
+def contexto_do_request(request):
+    """
+    Retorna o ContextoUsuario do request, criando-o se o middleware não estiver
+    instalado (ou se request.user mudou, ex.: após login no próprio request).
+    """
+    user = getattr(request, "user", None)
+    contexto = getattr(request, ATTR_REQUEST, None)
+    if contexto is None or contexto.user is not user:
+        contexto = ContextoUsuario(request, user)
+        setattr(request, ATTR_REQUEST, contexto)
+    return contexto
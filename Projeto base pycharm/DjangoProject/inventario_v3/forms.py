@@ -3,7 +3,9 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.password_validation import validate_password
 
-from .models import Produto, Movimento, Categoria, TabelaProdutos, AcessoTabela, PerfilUsuario
+from inventario_comum.autocomplete import campo_autocomplete
+
+from .models import Produto, Movimento, Categoria, TabelaProdutos, AcessoTabela, AcessoGrupoTabela, PerfilUsuario
 
 Usuario = get_user_model()
 
@@ -14,10 +16,26 @@ class TabelaProdutosForm(forms.ModelForm):
         fields = ("nome", "descricao", "publico")
 
 
-class AcessoTabelaForm(forms.ModelForm):
+class AcessoTabelaForm(forms.Form):
+    """Concessão individual; a view grava com upsert (permissoes.aplicar_acessos_em_lote)."""
+    usuario = forms.ModelChoiceField(
+        queryset=Usuario.objects.all(),
+        widget=campo_autocomplete("inventario_v3:autocomplete_usuarios", "opcoes-usuario"),
+    )
+    tabela = forms.ModelChoiceField(
+        queryset=TabelaProdutos.objects.all(),
+        widget=campo_autocomplete("inventario_v3:autocomplete_tabelas", "opcoes-tabela"),
+    )
+    nivel = forms.ChoiceField(choices=AcessoTabela.Niveis.CHOICES, initial=AcessoTabela.Niveis.NENHUM)
+
+
+class AcessoGrupoTabelaForm(forms.ModelForm):
     class Meta:
-        model = AcessoTabela
-        fields = ("usuario", "tabela", "nivel")
+        model = AcessoGrupoTabela
+        fields = ("grupo", "tabela", "nivel")
+        widgets = {
+            "tabela": campo_autocomplete("inventario_v3:autocomplete_tabelas", "opcoes-tabela"),
+        }
 
 
 class CategoriaForm(forms.ModelForm):
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark do filtro de visibilidade da lista de produtos.
+
+Cria um catálogo sintético dentro de uma transação (desfeita ao final) e mede a
+consulta de ProdutosLista com o filtro EXISTS atual e com o JOIN + DISTINCT
+antigo, variando quantas tabelas cada produto possui. Com EXISTS o tempo deve
+ficar praticamente constante conforme o número de tabelas por produto cresce.
+
+Uso:
+  python manage.py benchmark_visibilidade --produtos 5000 --tabelas-por-produto 1,5,20
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from inventario_v3.models import Produto, TabelaProdutos
+from inventario_v3.permissoes import filtro_produtos_visiveis
+
+
+def _consulta_exists():
+    return Produto.objects.filter(filtro_produtos_visiveis())
+
+
+def _consulta_distinct():
+    return Produto.objects.filter(Q(tabelas__isnull=True) | Q(tabelas__publico=True)).distinct()
+
+
+class Command(BaseCommand):
+    help = "Mede a latência da lista de produtos (EXISTS x DISTINCT) conforme produtos ganham tabelas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--produtos", type=int, default=2000, help="Quantidade de produtos sintéticos.")
+        parser.add_argument(
+            "--tabelas-por-produto",
+            type=str,
+            default="1,5,20",
+            help="Lista separada por vírgulas com o número de tabelas por produto em cada rodada.",
+        )
+        parser.add_argument("--repeticoes", type=int, default=5, help="Execuções por consulta (usa a mediana).")
+
+    def handle(self, *args, **options):
+        n_produtos = options["produtos"]
+        repeticoes = max(1, options["repeticoes"])
+        try:
+            rodadas = [int(x) for x in options["tabelas_por_produto"].split(",") if x.strip()]
+        except ValueError:
+            raise CommandError("--tabelas-por-produto deve ser uma lista de inteiros, ex.: 1,5,20")
+        if n_produtos <= 0 or not rodadas or min(rodadas) <= 0:
+            raise CommandError("--produtos e --tabelas-por-produto devem ser positivos.")
+
+        self.stdout.write(f"{'tabelas/produto':>16} {'linhas':>8} {'exists (ms)':>12} {'distinct (ms)':>14}")
+        with transaction.atomic():
+            tabelas = TabelaProdutos.objects.bulk_create(
+                [TabelaProdutos(nome=f"bench_tabela_{i}", publico=(i % 2 == 0)) for i in range(max(rodadas))]
+            )
+            produtos = Produto.objects.bulk_create(
+                [Produto(nome=f"bench_produto_{i}", quantidade=0, preco="1.00") for i in range(n_produtos)]
+            )
+            Vinculo = Produto.tabelas.through
+            for k in rodadas:
+                Vinculo.objects.filter(produto__in=produtos).delete()
+                Vinculo.objects.bulk_create(
+                    [Vinculo(produto_id=p.pk, tabelaprodutos_id=t.pk) for p in produtos for t in tabelas[:k]],
+                    batch_size=1000,
+                )
+                linhas, t_exists = self._medir(_consulta_exists, repeticoes)
+                _, t_distinct = self._medir(_consulta_distinct, repeticoes)
+                self.stdout.write(f"{k:>16} {linhas:>8} {t_exists:>12.2f} {t_distinct:>14.2f}")
+            # nada do catálogo sintético permanece no banco
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _medir(fabrica_qs, repeticoes):
+        tempos = []
+        linhas = 0
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            linhas = len(list(fabrica_qs().values_list("pk", "nome")))
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        tempos.sort()
+        return linhas, tempos[len(tempos) // 2]
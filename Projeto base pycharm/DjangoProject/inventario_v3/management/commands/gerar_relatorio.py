@@ -6,23 +6,34 @@ Management command to generate inventory reports (PNGs + JSON) into an output di
 Behavioral notes / adaptations:
 - Resolves --out relative to Django settings.BASE_DIR if provided as a relative path.
 - Works even if optional models (Categoria, TabelaProdutos) are not present.
-- Uses Agg backend for matplotlib so it is safe in headless CI.
+- --format svg (default, or settings.RELATORIOS_FORMATO) writes compact SVG charts without
+  importing matplotlib; --format png draws them with matplotlib's Figure API (Agg canvas,
+  safe in headless CI), all at once in the warm process pool of inventario_comum/graficos.py.
+  The chart data is always in the JSON files.
 - Writes JSON files using UTF-8 and handles errors gracefully.
+- Aggregations run in SQL (inventario_v3/relatorios.py): memory stays O(categories + top N).
+- Files are written to a temporary folder inside --out that becomes a versioned
+  subfolder (v<timestamp>-<hex>) when complete: in --out for general reports (shared
+  with everyone), in --out/report_user<pk>/ for --usuario. Publishing swaps that
+  owner's manifest rows in one transaction and replaces its atual.json pointer with a
+  single os.replace, so readers of the manifest or of the pointer see either the
+  previous report or the new one, never a mix, and other owners' reports are left
+  alone. The previous version stays on disk until the next publication.
+- --usuario (pk ou username) restringe os agregados a Produto.objects.visiveis_para(usuario).
+- Se os dados e o escopo não mudaram desde a última publicação na mesma pasta, nada é
+  regenerado (ver inventario_v3/relatorios.py); --forcar gera de novo.
+- Os arquivos publicados são gravados no manifesto (ArquivoRelatorio) com dono, escopo,
+  tamanho e data; a página de relatórios lista o manifesto em vez da pasta.
 """
-from django.core.management.base import BaseCommand
-from django.db.models import Count, Sum
+from django.core.management.base import BaseCommand, CommandError
 from pathlib import Path
 import json
-from django.conf import settings
-
-# Force non-interactive backend for matplotlib (avoids CI/headless errors)
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+import shutil
+import tempfile
 
 
 class Command(BaseCommand):
-    help = "Generate inventory reports (PNGs + JSON) and save to results directory."
+    help = "Generate inventory reports (SVG or PNG charts + JSON) and save to results directory."
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -32,19 +43,68 @@ class Command(BaseCommand):
             help="Output folder for reports (relative to BASE_DIR when not absolute)",
         )
         parser.add_argument("--top", type=int, default=10, help="Top N products for low-stock report")
+        parser.add_argument(
+            "--usuario",
+            type=str,
+            default=None,
+            help="pk ou username: agrega apenas os produtos visíveis para este usuário",
+        )
+        parser.add_argument(
+            "--format",
+            dest="formato",
+            choices=("svg", "png"),
+            default=None,
+            help="formato dos gráficos: svg (padrão, sem matplotlib) ou png",
+        )
+        parser.add_argument(
+            "--forcar",
+            action="store_true",
+            help="gera de novo mesmo se os dados não mudaram desde o último relatório nesta pasta",
+        )
 
     def handle(self, *args, **options):
-        out_opt = options.get("out") or "resultados/reports"
-        out_path = Path(out_opt)
+        from inventario_comum.graficos import formato_do_relatorio
+        from inventario_v3.relatorios import (
+            PASTA_PADRAO, assinatura_relatorio, escopo_do_usuario, pasta_relatorios,
+            publicar_versao, registrar_publicacao, relatorio_publicado,
+        )
+
         # If relative, resolve against settings.BASE_DIR when available
-        if not out_path.is_absolute():
-            base = getattr(settings, "BASE_DIR", None)
-            if base:
-                out_path = Path(base) / out_path
-            else:
-                out_path = out_path.resolve()
+        out_path = pasta_relatorios(options.get("out") or PASTA_PADRAO)
         out_path.mkdir(parents=True, exist_ok=True)
 
+        try:
+            formato = formato_do_relatorio(options.get("formato"))
+        except ValueError as e:
+            raise CommandError(str(e))
+        usuario = self._usuario(options["usuario"]) if options.get("usuario") else None
+        # assinatura lida antes das consultas: uma escrita durante a geração a invalida
+        escopo = escopo_do_usuario(usuario)
+        assinatura = assinatura_relatorio(escopo, int(options.get("top", 10) or 10), formato)
+        if not options.get("forcar") and relatorio_publicado(out_path, assinatura, dono=usuario) is not None:
+            self.stdout.write(self.style.SUCCESS("Reports up to date (data unchanged); nothing regenerated."))
+            return
+
+        # gera numa pasta temporária e publica a versão inteira de uma vez no fim
+        pasta_temporaria = Path(tempfile.mkdtemp(prefix=".gerando-", dir=out_path))
+        try:
+            self._gerar(pasta_temporaria, options, usuario, formato)
+            publicados = publicar_versao(out_path, pasta_temporaria, dono=usuario, escopo=escopo)
+        finally:
+            shutil.rmtree(pasta_temporaria, ignore_errors=True)
+        for nome in publicados:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {out_path / nome}"))
+        registrar_publicacao(out_path, assinatura, publicados, dono=usuario)
+        self.stdout.write(self.style.SUCCESS("All reports generated."))
+
+    def _gerar(self, out_path, options, usuario=None, formato="png"):
+        from inventario_comum import graficos
+        from inventario_v3.relatorios import menor_estoque, totais_por_categoria
+
+        if formato == "png":
+            # processos do pool sobem enquanto as consultas rodam
+            graficos.aquecer()
+
         # Import models lazily so command loads even if some optional models are missing
         try:
             from inventario_v3.models import Produto
@@ -57,15 +117,16 @@ class Command(BaseCommand):
         except Exception:
             Categoria = None
 
+        produtos = Produto.objects.all()
+        if usuario is not None:
+            produtos = Produto.objects.visiveis_para(usuario)
+        desenhos = []
+
         # 1) Produtos por categoria (se Categoria disponível)
         if Categoria:
-            per_cat = (
-                Produto.objects.values("categoria__nome")
-                .annotate(products=Count("id"), stock=Sum("quantidade"))
-                .order_by("-products")
-            )
-            labels = [p["categoria__nome"] or "Sem categoria" for p in per_cat]
-            counts = [int(p["products"] or 0) for p in per_cat]
+            per_cat = totais_por_categoria(produtos)
+            labels = [categoria for categoria, _, _ in per_cat]
+            counts = [contagem for _, contagem, _ in per_cat]
 
             # JSON: produtos por categoria
             try:
@@ -77,27 +138,19 @@ class Command(BaseCommand):
                     ),
                     encoding="utf-8",
                 )
-                self.stdout.write(self.style.SUCCESS("Wrote by_category_products.json"))
             except Exception as e:
                 self.stderr.write(f"Erro escrevendo JSON by_category_products: {e}")
 
             # PNG: produtos por categoria
             if labels:
-                try:
-                    plt.figure(figsize=(8, max(4, len(labels) * 0.5)))
-                    plt.bar(labels, counts, color="tab:blue")
-                    plt.xticks(rotation=45, ha="right")
-                    plt.title("Produtos por Categoria")
-                    plt.tight_layout()
-                    path1 = out_path / "produtos_por_categoria.png"
-                    plt.savefig(path1)
-                    plt.close()
-                    self.stdout.write(self.style.SUCCESS(f"Wrote {path1}"))
-                except Exception as e:
-                    self.stderr.write(f"Erro gerando PNG produtos_por_categoria: {e}")
+                desenhos.append({
+                    "arquivo": str(out_path / f"produtos_por_categoria.{formato}"), "titulo": "Produtos por Categoria",
+                    "rotulos": labels, "valores": counts, "cor": "tab:blue",
+                    "tamanho": (8, max(4, len(labels) * 0.5)), "rotacao": 45,
+                })
 
             # estoque por categoria (JSON + PNG)
-            counts2 = [int(p["stock"] or 0) for p in per_cat]
+            counts2 = [unidades for _, _, unidades in per_cat]
             try:
                 (out_path / "stock_por_categoria.json").write_text(
                     json.dumps(
@@ -107,52 +160,50 @@ class Command(BaseCommand):
                     ),
                     encoding="utf-8",
                 )
-                self.stdout.write(self.style.SUCCESS("Wrote stock_por_categoria.json"))
             except Exception as e:
                 self.stderr.write(f"Erro escrevendo JSON stock_por_categoria: {e}")
 
             if labels:
-                try:
-                    plt.figure(figsize=(8, max(4, len(labels) * 0.5)))
-                    plt.bar(labels, counts2, color="tab:green")
-                    plt.xticks(rotation=45, ha="right")
-                    plt.title("Estoque por Categoria (unidades)")
-                    plt.tight_layout()
-                    path2 = out_path / "estoque_por_categoria.png"
-                    plt.savefig(path2)
-                    plt.close()
-                    self.stdout.write(self.style.SUCCESS(f"Wrote {path2}"))
-                except Exception as e:
-                    self.stderr.write(f"Erro gerando PNG estoque_por_categoria: {e}")
+                desenhos.append({
+                    "arquivo": str(out_path / f"estoque_por_categoria.{formato}"), "titulo": "Estoque por Categoria (unidades)",
+                    "rotulos": labels, "valores": counts2, "cor": "tab:green",
+                    "tamanho": (8, max(4, len(labels) * 0.5)), "rotacao": 45,
+                })
 
         # 2) Low stock products (top N)
         top_n = int(options.get("top", 10) or 10)
-        low_qs = Produto.objects.order_by("quantidade").values("id", "nome", "quantidade")[:top_n]
-        low_list = []
-        for item in low_qs:
-            low_list.append({"id": int(item["id"]), "nome": item["nome"], "quantidade": int(item["quantidade"] or 0)})
+        low_list = [
+            {"id": item["pk"], "nome": item["nome"], "quantidade": item["quantidade"]}
+            for item in menor_estoque(produtos, top_n)
+        ]
 
         try:
             (out_path / "low_stock.json").write_text(
                 json.dumps({"low_stock": low_list}, ensure_ascii=False, indent=2), encoding="utf-8"
             )
-            self.stdout.write(self.style.SUCCESS("Wrote low_stock.json"))
         except Exception as e:
             self.stderr.write(f"Erro escrevendo JSON low_stock: {e}")
 
         if low_list:
-            try:
-                names = [p["nome"] for p in low_list]
-                quants = [p["quantidade"] for p in low_list]
-                plt.figure(figsize=(8, max(4, len(names) * 0.4)))
-                plt.barh(names, quants, color="tab:orange")
-                plt.title(f"Produtos com menor estoque (top {top_n})")
-                plt.tight_layout()
-                path3 = out_path / "low_stock_top.png"
-                plt.savefig(path3)
-                plt.close()
-                self.stdout.write(self.style.SUCCESS(f"Wrote {path3}"))
-            except Exception as e:
-                self.stderr.write(f"Erro gerando PNG low_stock_top: {e}")
+            desenhos.append({
+                "arquivo": str(out_path / f"low_stock_top.{formato}"), "titulo": f"Produtos com menor estoque (top {top_n})",
+                "rotulos": [p["nome"] for p in low_list], "valores": [p["quantidade"] for p in low_list],
+                "cor": "tab:orange", "tamanho": (8, max(4, len(low_list) * 0.4)), "horizontal": True,
+            })
+
+        # SVG direto ou PNGs desenhados ao mesmo tempo no pool de processos (inventario_comum/graficos.py)
+        try:
+            graficos.escrever_graficos(desenhos, formato)
+        except Exception as e:
+            self.stderr.write(f"Erro gerando gráficos ({formato}): {e}")
+
+    @staticmethod
+    def _usuario(valor):
+        from django.contrib.auth import get_user_model
 
-        self.stdout.write(self.style.SUCCESS("All reports generated."))
\ No newline at end of file
+        User = get_user_model()
+        filtro = {"pk": int(valor)} if valor.isdigit() else {User.USERNAME_FIELD: valor}
+        try:
+            return User.objects.get(**filtro)
+        except User.DoesNotExist:
+            raise CommandError(f"Usuário não encontrado: {valor}")
\ No newline at end of file
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from inventario_v3.relatorios import PASTA_PADRAO, indexar_pasta, pasta_relatorios
+
+
+class Command(BaseCommand):
+    help = (
+        "Sincroniza o manifesto de relatórios (ArquivoRelatorio) com os arquivos da pasta.\n"
+        "Necessário para arquivos que não vieram de gerar_relatorio (cópias, relatórios antigos).\n"
+        "Uso: python manage.py indexar_relatorios [--out resultados/reports]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--out",
+            type=str,
+            default=PASTA_PADRAO,
+            help="Pasta dos relatórios (relativa a BASE_DIR quando não for absoluta)",
+        )
+
+    def handle(self, *args, **options):
+        pasta = pasta_relatorios(options.get("out") or PASTA_PADRAO)
+        novos, atualizados, removidos = indexar_pasta(pasta)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Manifesto de {pasta}: {novos} novo(s), {atualizados} atualizado(s), {removidos} removido(s)."
+            )
+        )
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from inventario_v3.permissoes import invalidar_permissoes, recalcular_permissoes_efetivas
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói a tabela materializada PermissaoEfetiva a partir de AcessoTabela e "
+        "AcessoGrupoTabela (normalmente mantida pelos signals; use após cargas em massa "
+        "feitas com update()/bulk_create, que não disparam signals).\n"
+        "Uso: python manage.py recalcular_permissoes"
+    )
+
+    def handle(self, *args, **options):
+        alteradas = recalcular_permissoes_efetivas()
+        invalidar_permissoes()
+        self.stdout.write(self.style.SUCCESS(f"PermissaoEfetiva recalculada: {alteradas} linha(s) alterada(s)."))
@@ -0,0 +1,16 @@
+# inventario_v3/middleware.py
+from .contexto import contexto_do_request
+
+
+class ContextoUsuarioMiddleware:
+    """
+    Anexa request.contexto_usuario (preguiçoso). Deve ficar depois do
+    AuthenticationMiddleware em settings.MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        contexto_do_request(request)
+        return self.get_response(request)
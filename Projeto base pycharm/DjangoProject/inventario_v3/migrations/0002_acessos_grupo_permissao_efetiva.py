@@ -0,0 +1,61 @@
+# Generated by Django 4.2 on 2026-10-19 04:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+ORDEM_NIVEIS = {"nenhum": 0, "leitura": 1, "escrita": 2, "administrador": 3}
+
+
+def popular_permissoes_efetivas(apps, schema_editor):
+    AcessoTabela = apps.get_model("inventario_v3", "AcessoTabela")
+    PermissaoEfetiva = apps.get_model("inventario_v3", "PermissaoEfetiva")
+    efetivas = {}
+    for usuario_id, tabela_id, nivel in AcessoTabela.objects.values_list("usuario_id", "tabela_id", "nivel"):
+        atual = efetivas.get((usuario_id, tabela_id))
+        if atual is None or ORDEM_NIVEIS.get(nivel, 0) > ORDEM_NIVEIS.get(atual, 0):
+            efetivas[(usuario_id, tabela_id)] = nivel
+    PermissaoEfetiva.objects.bulk_create(
+        [PermissaoEfetiva(usuario_id=u, tabela_id=t, nivel=n) for (u, t), n in efetivas.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('inventario_v3', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PermissaoEfetiva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nivel', models.CharField(choices=[('nenhum', 'Nenhum'), ('leitura', 'Leitura'), ('escrita', 'Escrita'), ('administrador', 'Administrador')], max_length=16)),
+                ('tabela', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='permissoes_efetivas', to='inventario_v3.tabelaprodutos')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='permissoes_efetivas', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AcessoGrupoTabela',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nivel', models.CharField(choices=[('nenhum', 'Nenhum'), ('leitura', 'Leitura'), ('escrita', 'Escrita'), ('administrador', 'Administrador')], default='leitura', max_length=16)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('grupo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='acessos_tabela', to='auth.group')),
+                ('tabela', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='acessos_grupo', to='inventario_v3.tabelaprodutos')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='permissaoefetiva',
+            constraint=models.UniqueConstraint(fields=('usuario', 'tabela'), name='permissao_efetiva_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='acessogrupotabela',
+            constraint=models.UniqueConstraint(fields=('grupo', 'tabela'), name='acesso_grupo_tabela_unico'),
+        ),
+        migrations.RunPython(popular_permissoes_efetivas, migrations.RunPython.noop),
+    ]
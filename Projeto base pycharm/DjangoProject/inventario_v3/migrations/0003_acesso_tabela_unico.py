@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-19 04:12
+
+from django.db import migrations, models
+
+ORDEM_NIVEIS = {"nenhum": 0, "leitura": 1, "escrita": 2, "administrador": 3}
+
+
+def remover_acessos_duplicados(apps, schema_editor):
+    """Mantém, para cada (usuario, tabela), só o AcessoTabela de maior nível (mesmo efeito de antes)."""
+    AcessoTabela = apps.get_model("inventario_v3", "AcessoTabela")
+    manter = {}
+    remover = []
+    for pk, usuario_id, tabela_id, nivel in AcessoTabela.objects.order_by("pk").values_list(
+        "pk", "usuario_id", "tabela_id", "nivel"
+    ):
+        par = (usuario_id, tabela_id)
+        atual = manter.get(par)
+        if atual is None:
+            manter[par] = (pk, nivel)
+        elif ORDEM_NIVEIS.get(nivel, 0) > ORDEM_NIVEIS.get(atual[1], 0):
+            remover.append(atual[0])
+            manter[par] = (pk, nivel)
+        else:
+            remover.append(pk)
+    if remover:
+        AcessoTabela.objects.filter(pk__in=remover).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario_v3', '0002_acessos_grupo_permissao_efetiva'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_acessos_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='acessotabela',
+            constraint=models.UniqueConstraint(fields=('usuario', 'tabela'), name='acesso_tabela_unico'),
+        ),
+    ]
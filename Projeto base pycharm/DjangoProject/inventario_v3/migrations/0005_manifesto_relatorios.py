@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-19 05:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('inventario_v3', '0004_produto_indices_ordenacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArquivoRelatorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pasta', models.CharField(max_length=500)),
+                ('nome', models.CharField(max_length=255)),
+                ('escopo', models.TextField(blank=True)),
+                ('compartilhado', models.BooleanField(default=False)),
+                ('tamanho', models.PositiveBigIntegerField(default=0)),
+                ('gerado_em', models.DateTimeField()),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('dono', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='arquivos_relatorio', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='arquivorelatorio',
+            index=models.Index(fields=['pasta', '-gerado_em', 'nome'], name='arquivo_relatorio_recentes_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='arquivorelatorio',
+            constraint=models.UniqueConstraint(fields=('pasta', 'nome'), name='arquivo_relatorio_unico'),
+        ),
+    ]
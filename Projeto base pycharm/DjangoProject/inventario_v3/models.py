@@ -4,9 +4,11 @@ import logging
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
+from django.db.models import Count, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Q, Sum
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -25,6 +27,98 @@ class Categoria(models.Model):
         return self.nome
 
 
+def usuario_tem_acesso_total(user):
+    """
+    Superuser ou perfil com is_admin(): enxerga e administra todas as tabelas.
+    Staff não entra aqui: só dispensa as checagens de escrita/administração nas views.
+    """
+    if getattr(user, "is_superuser", False):
+        return True
+    # allow custom profile helper if present (sem carregar o perfil quando o model não o define)
+    if hasattr(PerfilUsuario, "is_admin"):
+        profile = getattr(user, "perfil", None)
+        if profile and profile.is_admin():
+            return True
+    return False
+
+
+def _autenticado(user):
+    return bool(user and getattr(user, "is_authenticated", False))
+
+
+class TabelaProdutosQuerySet(models.QuerySet):
+    def visiveis_para(self, user, nivel="leitura"):
+        """
+        Tabelas em que `user` tem pelo menos `nivel`: PermissaoEfetiva com o nível
+        ou, para leitura, tabela pública sem PermissaoEfetiva do usuário.
+        """
+        if not _autenticado(user):
+            return self.none()
+        if usuario_tem_acesso_total(user):
+            return self.all()
+        minha = PermissaoEfetiva.objects.filter(tabela_id=OuterRef("pk"), usuario=user)
+        predicado = Q(Exists(minha.filter(nivel__in=AcessoTabela.Niveis.pelo_menos(nivel))))
+        if nivel == AcessoTabela.Niveis.LEITURA:
+            predicado |= Q(publico=True) & ~Q(Exists(minha))
+        return self.filter(predicado)
+
+
+class ProdutoQuerySet(models.QuerySet):
+    @staticmethod
+    def predicado_visibilidade(user, nivel="leitura"):
+        """
+        Q (EXISTS correlacionados, sem JOIN/DISTINCT) para produtos que `user` pode
+        acessar com pelo menos `nivel`; None quando não há restrição.
+
+        Regras (as mesmas de views.product_has_table_with_access):
+        - produto sem tabelas: liberado;
+        - alguma tabela do produto com PermissaoEfetiva >= nivel;
+        - leitura: alguma tabela pública do produto sem PermissaoEfetiva do usuário;
+        - superuser/admin do perfil: tudo.
+        """
+        if not _autenticado(user):
+            return Q(pk__in=[])
+        if usuario_tem_acesso_total(user):
+            return None
+        vinculos = Produto.tabelas.through.objects.filter(produto_id=OuterRef("pk"))
+        minha = PermissaoEfetiva.objects.filter(tabela_id=OuterRef("tabelaprodutos_id"), usuario=user)
+        predicado = ~Q(Exists(vinculos)) | Q(Exists(
+            vinculos.filter(Exists(minha.filter(nivel__in=AcessoTabela.Niveis.pelo_menos(nivel))))
+        ))
+        if nivel == AcessoTabela.Niveis.LEITURA:
+            predicado |= Q(Exists(vinculos.filter(tabelaprodutos__publico=True).exclude(Exists(minha))))
+        return predicado
+
+    def visiveis_para(self, user, nivel="leitura"):
+        """Produtos que `user` pode acessar com pelo menos `nivel` (um único predicado SQL)."""
+        predicado = self.predicado_visibilidade(user, nivel)
+        return self.all() if predicado is None else self.filter(predicado)
+
+    def na_tabela(self, tabela):
+        """Produtos vinculados a `tabela` (instância ou pk), via EXISTS."""
+        vinculos = Produto.tabelas.through.objects.filter(
+            produto_id=OuterRef("pk"), tabelaprodutos_id=getattr(tabela, "pk", tabela)
+        )
+        return self.filter(Exists(vinculos))
+
+    def totais_por(self, campo):
+        """
+        {valor de `campo`: {"produtos", "unidades", "valor"}} numa consulta agrupada,
+        com valor = Sum(quantidade * preco). `campo` pode atravessar relações
+        ("categoria", "tabelas"); grupos sem produtos não aparecem.
+        """
+        valor = ExpressionWrapper(F("quantidade") * F("preco"), output_field=DecimalField(max_digits=20, decimal_places=2))
+        linhas = self.order_by().values(campo).annotate(
+            produtos=Count("pk"), unidades=Sum("quantidade"), valor=Sum(valor)
+        )
+        totais = {}
+        for linha in linhas:
+            # o SQLite devolve a soma sem as casas decimais
+            linha["valor"] = (linha["valor"] or Decimal("0")).quantize(Decimal("0.01"))
+            totais[linha.pop(campo)] = linha
+        return totais
+
+
 class TabelaProdutos(models.Model):
     nome = models.CharField(max_length=200)
     descricao = models.TextField(blank=True)
@@ -34,6 +128,8 @@ class TabelaProdutos(models.Model):
         settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL
     )
 
+    objects = TabelaProdutosQuerySet.as_manager()
+
     def __str__(self):
         return self.nome
 
@@ -47,6 +143,17 @@ class Produto(models.Model):
     tabelas = models.ManyToManyField(TabelaProdutos, related_name="produtos", blank=True)
     criado_em = models.DateTimeField(auto_now_add=True)
 
+    objects = ProdutoQuerySet.as_manager()
+
+    class Meta:
+        # ordenações da lista de produtos: keyset (campo, id) em paginacao.PaginadorCursor
+        indexes = [
+            models.Index(fields=["nome", "id"], name="produto_nome_id_idx"),
+            models.Index(fields=["quantidade", "id"], name="produto_quantidade_id_idx"),
+            models.Index(fields=["preco", "id"], name="produto_preco_id_idx"),
+            models.Index(fields=["criado_em", "id"], name="produto_criado_em_id_idx"),
+        ]
+
     def __str__(self):
         # keep a useful representation used in logs/tests
         return f"{self.nome} ({self.quantidade})"
@@ -104,15 +211,68 @@ class AcessoTabela(models.Model):
             (ADMINISTRADOR, "Administrador"),
         )
 
+        # do menor para o maior
+        ORDEM = (NENHUM, LEITURA, ESCRITA, ADMINISTRADOR)
+
+        @classmethod
+        def pelo_menos(cls, nivel):
+            """Níveis iguais ou superiores a `nivel` (nível desconhecido conta como nenhum)."""
+            inicio = cls.ORDEM.index(nivel) if nivel in cls.ORDEM else 0
+            return list(cls.ORDEM[inicio:])
+
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="acessos")
     tabela = models.ForeignKey(TabelaProdutos, on_delete=models.CASCADE, related_name="acessos")
     nivel = models.CharField(max_length=16, choices=Niveis.CHOICES, default=Niveis.NENHUM)
     criado_em = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["usuario", "tabela"], name="acesso_tabela_unico"),
+        ]
+
     def __str__(self):
         return f"{self.usuario.get_username()} -> {self.tabela.nome} ({self.nivel})"
 
 
+class AcessoGrupoTabela(models.Model):
+    """
+    Concessão por grupo (django.contrib.auth Group): todos os membros do grupo
+    recebem `nivel` na tabela. Combinada com AcessoTabela em PermissaoEfetiva.
+    """
+    grupo = models.ForeignKey(Group, on_delete=models.CASCADE, related_name="acessos_tabela")
+    tabela = models.ForeignKey(TabelaProdutos, on_delete=models.CASCADE, related_name="acessos_grupo")
+    nivel = models.CharField(max_length=16, choices=AcessoTabela.Niveis.CHOICES, default=AcessoTabela.Niveis.LEITURA)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["grupo", "tabela"], name="acesso_grupo_tabela_unico"),
+        ]
+
+    def __str__(self):
+        return f"{self.grupo.name} -> {self.tabela.nome} ({self.nivel})"
+
+
+class PermissaoEfetiva(models.Model):
+    """
+    Tabela materializada (usuario, tabela) -> maior nível entre AcessoTabela e os
+    AcessoGrupoTabela dos grupos do usuário. Mantida incrementalmente pelos
+    receivers em signals.py (ver permissoes.recalcular_permissoes_efetivas);
+    não deve ser editada à mão.
+    """
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="permissoes_efetivas")
+    tabela = models.ForeignKey(TabelaProdutos, on_delete=models.CASCADE, related_name="permissoes_efetivas")
+    nivel = models.CharField(max_length=16, choices=AcessoTabela.Niveis.CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["usuario", "tabela"], name="permissao_efetiva_unica"),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario_id} -> {self.tabela_id} ({self.nivel})"
+
+
 class Movimento(models.Model):
     MOV_ENT = "ENTRADA"
     MOV_SAI = "SAIDA"
@@ -179,6 +339,54 @@ class Movimento(models.Model):
         return self
 
 
+
+class ArquivoRelatorioQuerySet(models.QuerySet):
+    def visiveis_para(self, user):
+        """Staff vê todos; os demais, os próprios relatórios e os compartilhados."""
+        if user.is_staff or user.is_superuser:
+            return self
+        return self.filter(Q(dono=user) | Q(compartilhado=True))
+
+
+class ArquivoRelatorio(models.Model):
+    """
+    Manifesto dos arquivos publicados por `manage.py gerar_relatorio`: uma linha
+    por arquivo (pasta, nome), gravada quando o relatório termina (ver
+    relatorios.publicar_versao; `nome` inclui a subpasta da versão). A página de relatórios consulta só esta
+    tabela; arquivos copiados à mão entram com `manage.py indexar_relatorios`.
+    """
+    pasta = models.CharField(max_length=500)
+    nome = models.CharField(max_length=255)
+    dono = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="arquivos_relatorio"
+    )
+    # "todos" ou pks das tabelas lidas, separados por vírgula; vazio quando desconhecido
+    escopo = models.TextField(blank=True)
+    compartilhado = models.BooleanField(default=False)
+    tamanho = models.PositiveBigIntegerField(default=0)
+    gerado_em = models.DateTimeField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    objects = ArquivoRelatorioQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["pasta", "nome"], name="arquivo_relatorio_unico"),
+        ]
+        # listagem da página: pasta, mais recentes primeiro
+        indexes = [
+            models.Index(fields=["pasta", "-gerado_em", "nome"], name="arquivo_relatorio_recentes_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.pasta}/{self.nome}"
+
+    @property
+    def arquivo(self):
+        """Nome do arquivo sem a subpasta da versão ("<versao>/low_stock.json" -> "low_stock.json")."""
+        return self.nome.rsplit("/", 1)[-1]
+
+
 # Signal: criar PerfilUsuario automaticamente ao criar um User
 @receiver(post_save, sender=User)
 def create_profile_for_user(sender, instance=None, created=False, **kwargs):
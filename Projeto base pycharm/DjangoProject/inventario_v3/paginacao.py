@@ -0,0 +1,129 @@
+# inventario_v3/paginacao.py
+"""
+Paginação por cursor (keyset) para listas grandes ordenadas no servidor.
+
+Em vez de OFFSET (que lê e descarta todas as linhas anteriores), a próxima página
+é pedida "depois de" (valor do campo de ordenação, pk) da última linha mostrada:
+
+    WHERE campo >= v AND (campo > v OR id > pk) ORDER BY campo, id LIMIT n + 1
+
+Com um índice em (campo, id) a primeira página e a milésima custam o mesmo, e
+nenhuma faz COUNT: a linha extra diz se há próxima página. A página anterior é
+lida na ordem inversa a partir da primeira linha mostrada.
+
+O cursor vai na URL (?cursor=) como JSON em base64; cursor inválido ou de outra
+ordenação volta à primeira página.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date
+from decimal import Decimal
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def codificar_cursor(campo, valor, pk, antes=False):
+    if isinstance(valor, date):
+        # isoformat completo: o DjangoJSONEncoder corta os microssegundos
+        valor = valor.isoformat()
+    elif isinstance(valor, Decimal):
+        valor = str(valor)
+    dados = json.dumps([campo, valor, pk, antes], separators=(",", ":"))
+    return urlsafe_b64encode(dados.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(token):
+    """(campo, valor, pk, antes) ou None se o token não for um cursor válido."""
+    try:
+        campo, valor, pk, antes = json.loads(urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(campo, str) or not isinstance(pk, int) or not isinstance(antes, bool):
+        return None
+    return campo, valor, pk, antes
+
+
+class PaginaCursor:
+    """Página de PaginadorCursor; mesma interface de navegação de Page, sem números."""
+
+    def __init__(self, object_list, cursor_proximo=None, cursor_anterior=None):
+        self.object_list = object_list
+        self.cursor_proximo = cursor_proximo
+        self.cursor_anterior = cursor_anterior
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.cursor_proximo is not None
+
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class PaginadorCursor:
+    """
+    Pagina `queryset` por `campo` (com o pk como desempate), `por_pagina` linhas
+    por vez. `campo` precisa ser não nulo e, para listas grandes, indexado junto
+    com o id.
+    """
+
+    def __init__(self, queryset, campo, por_pagina, descendente=False):
+        self.queryset = queryset
+        self.campo = campo
+        self.por_pagina = por_pagina
+        self.descendente = descendente
+
+    def _posicao(self, token):
+        cursor = decodificar_cursor(token) if token else None
+        if cursor is None or cursor[0] != self.campo:
+            return None
+        _, valor, pk, antes = cursor
+        try:
+            valor = self.queryset.model._meta.get_field(self.campo).to_python(valor)
+        except ValidationError:
+            return None
+        return None if valor is None else (valor, pk, antes)
+
+    def pagina(self, token=None):
+        posicao = self._posicao(token)
+        antes = posicao is not None and posicao[2]
+        # a página anterior é lida na ordem inversa e desvirada no fim
+        descendente = self.descendente != antes
+        qs = self.queryset
+        if posicao is not None:
+            valor, pk, _ = posicao
+            op = "lt" if descendente else "gt"
+            qs = qs.filter(
+                Q(**{f"{self.campo}__{op}e": valor}),
+                Q(**{f"{self.campo}__{op}": valor}) | Q(**{f"pk__{op}": pk}),
+            )
+        sinal = "-" if descendente else ""
+        linhas = list(qs.order_by(f"{sinal}{self.campo}", f"{sinal}pk")[:self.por_pagina + 1])
+        mais = len(linhas) > self.por_pagina
+        linhas = linhas[:self.por_pagina]
+        if antes:
+            linhas.reverse()
+        if not linhas:
+            return PaginaCursor(linhas)
+
+        tem_proxima = True if antes else mais
+        tem_anterior = mais if antes else posicao is not None
+        primeira, ultima = linhas[0], linhas[-1]
+        return PaginaCursor(
+            linhas,
+            cursor_proximo=(
+                codificar_cursor(self.campo, getattr(ultima, self.campo), ultima.pk) if tem_proxima else None
+            ),
+            cursor_anterior=(
+                codificar_cursor(self.campo, getattr(primeira, self.campo), primeira.pk, antes=True)
+                if tem_anterior else None
+            ),
+        )
@@ -0,0 +1,389 @@
+# inventario_v3/permissoes.py
+"""
+Resolução de permissões por tabela (PermissaoEfetiva + tabelas públicas).
+
+PermissaoEfetiva materializa, por (usuario, tabela), o maior nível entre o
+AcessoTabela direto e os AcessoGrupoTabela dos grupos do usuário; é mantida por
+recalcular_permissoes_efetivas a partir dos receivers em signals.py.
+
+O mapa {tabela_id: nivel} do usuário é carregado numa única consulta e memoizado
+no request, de modo que os helpers de views.py custam O(1) consultas por request,
+independentemente de quantas tabelas/produtos forem verificados.
+
+Entre requests o mapa fica no cache do Django, numa chave que inclui uma versão
+global (tabelas públicas) e uma versão por usuário (PermissaoEfetiva). Os receivers em
+signals.py incrementam essas versões a cada alteração, então concessões valem na
+hora sem apagar entradas antigas (elas apenas expiram). Em produção com vários
+processos o backend de cache precisa ser compartilhado (Redis/Memcached/DB).
+"""
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BooleanField, Exists, ExpressionWrapper, FilteredRelation, OuterRef, Q, Value
+
+from inventario_comum.versoes import incrementar_versao, versao_atual
+
+from .models import (
+    AcessoGrupoTabela, AcessoTabela, PermissaoEfetiva, Produto, TabelaProdutos, usuario_tem_acesso_total
+)
+
+# ordem dos níveis: nenhum < leitura < escrita < administrador
+ORDEM_NIVEIS = {
+    AcessoTabela.Niveis.NENHUM: 0,
+    AcessoTabela.Niveis.LEITURA: 1,
+    AcessoTabela.Niveis.ESCRITA: 2,
+    AcessoTabela.Niveis.ADMINISTRADOR: 3,
+}
+
+_ATTR_REQUEST = "_inventario_v3_permissoes"
+
+PERMISSOES_CACHE_TIMEOUT = 60 * 60
+_CHAVE_VERSAO_GLOBAL = "inventario_v3:permissoes:versao"
+
+
+def nivel_valor(nivel):
+    return ORDEM_NIVEIS.get(nivel, 0)
+
+
+def _chave_versao_usuario(user_pk):
+    return f"{_CHAVE_VERSAO_GLOBAL}:u{user_pk}"
+
+
+def invalidar_permissoes(user_pk=None):
+    """
+    Incrementa a versão das permissões de um usuário (user_pk) ou de todos (None).
+    """
+    chave = _CHAVE_VERSAO_GLOBAL if user_pk is None else _chave_versao_usuario(user_pk)
+    incrementar_versao(chave)
+
+
+# superuser ou perfil admin: todas as tabelas liberadas (mesma regra dos managers)
+tem_acesso_total = usuario_tem_acesso_total
+
+
+_estado = threading.local()
+
+
+@contextmanager
+def recalculo_adiado():
+    """
+    Dentro do bloco os receivers de AcessoTabela não recalculam PermissaoEfetiva;
+    quem abriu o bloco recalcula uma vez no final (ver aplicar_acessos_em_lote).
+    """
+    anterior = getattr(_estado, "adiado", False)
+    _estado.adiado = True
+    try:
+        yield
+    finally:
+        _estado.adiado = anterior
+
+
+def recalculo_esta_adiado():
+    return getattr(_estado, "adiado", False)
+
+
+@transaction.atomic
+def recalcular_permissoes_efetivas(usuario_ids=None, tabela_ids=None):
+    """
+    Recalcula PermissaoEfetiva no escopo informado (None = sem restrição naquela
+    dimensão): maior nível entre AcessoTabela e AcessoGrupoTabela dos grupos de cada
+    usuário. Só grava as linhas que mudaram e invalida o cache dos usuários afetados.
+    Retorna o número de linhas criadas, alteradas ou removidas.
+    """
+    if usuario_ids is not None:
+        usuario_ids = set(usuario_ids)
+        if not usuario_ids:
+            return 0
+    if tabela_ids is not None:
+        tabela_ids = set(tabela_ids)
+        if not tabela_ids:
+            return 0
+
+    diretos = AcessoTabela.objects.all()
+    # um único filter() sobre grupo__user: dois criariam dois JOINs em auth_user_groups
+    # e multiplicariam as linhas de cada grupo pelo número de membros
+    if usuario_ids is not None:
+        por_grupo = AcessoGrupoTabela.objects.filter(grupo__user__in=usuario_ids)
+    else:
+        por_grupo = AcessoGrupoTabela.objects.filter(grupo__user__isnull=False)
+    atuais = PermissaoEfetiva.objects.all()
+    if usuario_ids is not None:
+        diretos = diretos.filter(usuario_id__in=usuario_ids)
+        atuais = atuais.filter(usuario_id__in=usuario_ids)
+    if tabela_ids is not None:
+        diretos = diretos.filter(tabela_id__in=tabela_ids)
+        por_grupo = por_grupo.filter(tabela_id__in=tabela_ids)
+        atuais = atuais.filter(tabela_id__in=tabela_ids)
+
+    esperado = {}
+    fontes = (
+        diretos.values_list("usuario_id", "tabela_id", "nivel"),
+        por_grupo.values_list("grupo__user__id", "tabela_id", "nivel"),
+    )
+    for linhas in fontes:
+        for usuario_id, tabela_id, nivel in linhas:
+            chave = (usuario_id, tabela_id)
+            if chave not in esperado or nivel_valor(nivel) > nivel_valor(esperado[chave]):
+                esperado[chave] = nivel
+
+    remover, alterar, afetados = [], [], set()
+    for perm in atuais.only("pk", "usuario_id", "tabela_id", "nivel"):
+        chave = (perm.usuario_id, perm.tabela_id)
+        nivel = esperado.pop(chave, None)
+        if nivel is None:
+            remover.append(perm.pk)
+        elif nivel != perm.nivel:
+            perm.nivel = nivel
+            alterar.append(perm)
+        else:
+            continue
+        afetados.add(perm.usuario_id)
+
+    if remover:
+        PermissaoEfetiva.objects.filter(pk__in=remover).delete()
+    if alterar:
+        PermissaoEfetiva.objects.bulk_update(alterar, ["nivel"])
+    if esperado:
+        PermissaoEfetiva.objects.bulk_create([
+            PermissaoEfetiva(usuario_id=usuario_id, tabela_id=tabela_id, nivel=nivel)
+            for (usuario_id, tabela_id), nivel in esperado.items()
+        ])
+        afetados.update(usuario_id for usuario_id, _ in esperado)
+
+    for usuario_id in afetados:
+        invalidar_permissoes(usuario_id)
+    # de novo após o commit: um request concorrente pode ter cacheado o estado anterior
+    if afetados:
+        transaction.on_commit(lambda: [invalidar_permissoes(pk) for pk in afetados])
+    return len(remover) + len(alterar) + len(esperado)
+
+
+@transaction.atomic
+def aplicar_acessos_em_lote(concessoes=(), revogacoes=()):
+    """
+    Aplica muitas alterações de AcessoTabela numa única transação.
+
+    concessoes: iterável de (usuario_id, tabela_id, nivel), com upsert do nível;
+    revogacoes: iterável de (usuario_id, tabela_id). Um par presente nos dois é
+    tratado como concessão. Usa bulk_update/bulk_create(update_conflicts)/delete e
+    recalcula PermissaoEfetiva uma vez para todos os pares afetados.
+
+    Retorna {"criados": n, "alterados": n, "revogados": n}.
+    """
+    desejado = {(usuario_id, tabela_id): nivel for usuario_id, tabela_id, nivel in concessoes}
+    revogar = {(usuario_id, tabela_id) for usuario_id, tabela_id in revogacoes} - set(desejado)
+    resultado = {"criados": 0, "alterados": 0, "revogados": 0}
+    pares = set(desejado) | revogar
+    if not pares:
+        return resultado
+    usuarios = {usuario_id for usuario_id, _ in pares}
+    tabelas = {tabela_id for _, tabela_id in pares}
+
+    existentes = {
+        (acesso.usuario_id, acesso.tabela_id): acesso
+        for acesso in AcessoTabela.objects.select_for_update()
+        .filter(usuario_id__in=usuarios, tabela_id__in=tabelas)
+        .only("pk", "usuario_id", "tabela_id", "nivel")
+        if (acesso.usuario_id, acesso.tabela_id) in pares
+    }
+    alterar, criar = [], []
+    for (usuario_id, tabela_id), nivel in desejado.items():
+        acesso = existentes.get((usuario_id, tabela_id))
+        if acesso is None:
+            criar.append(AcessoTabela(usuario_id=usuario_id, tabela_id=tabela_id, nivel=nivel))
+        elif acesso.nivel != nivel:
+            acesso.nivel = nivel
+            alterar.append(acesso)
+    remover = [existentes[par].pk for par in revogar if par in existentes]
+
+    with recalculo_adiado():
+        if alterar:
+            AcessoTabela.objects.bulk_update(alterar, ["nivel"], batch_size=500)
+        criados = 0
+        if criar:
+            # par criado em paralelo por outro request: o upsert aplica o nível pedido em vez de falhar
+            AcessoTabela.objects.bulk_create(
+                criar,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=["usuario", "tabela"],
+                update_fields=["nivel"],
+            )
+            criados = _inseridos(criar)
+        if remover:
+            AcessoTabela.objects.filter(pk__in=remover).delete()
+    recalcular_permissoes_efetivas(usuario_ids=usuarios, tabela_ids=tabelas)
+
+    resultado.update(criados=criados, alterados=len(alterar) + len(criar) - criados, revogados=len(remover))
+    return resultado
+
+
+def _inseridos(acessos):
+    """Quantos de `acessos` (recém enviados ao upsert) foram inseridos: o upsert não altera criado_em."""
+    usuarios = {acesso.usuario_id for acesso in acessos}
+    tabelas = {acesso.tabela_id for acesso in acessos}
+    gravados = dict(
+        ((usuario_id, tabela_id), criado_em)
+        for usuario_id, tabela_id, criado_em in AcessoTabela.objects.filter(
+            usuario_id__in=usuarios, tabela_id__in=tabelas
+        ).values_list("usuario_id", "tabela_id", "criado_em")
+    )
+    return sum(gravados.get((acesso.usuario_id, acesso.tabela_id)) == acesso.criado_em for acesso in acessos)
+
+
+class MapaPermissoes:
+    """
+    Permissões efetivas de um usuário sobre as tabelas de produtos.
+
+    - acesso_total: superuser (ou perfil com is_admin()) — tudo liberado
+    - niveis: {tabela_id: nivel} vindos de PermissaoEfetiva (têm precedência)
+    - publicas: ids das tabelas públicas (leitura quando não há AcessoTabela)
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._carregado = False
+        self.acesso_total = False
+        self.niveis = {}
+        self.publicas = set()
+
+    def _carregar(self):
+        if self._carregado:
+            return
+        self._carregado = True
+        user = self.user
+        if not user or not user.is_authenticated:
+            return
+        if tem_acesso_total(user):
+            self.acesso_total = True
+            return
+
+        chave_usuario = _chave_versao_usuario(user.pk)
+        versoes = cache.get_many([_CHAVE_VERSAO_GLOBAL, chave_usuario])
+        chave = "inventario_v3:permissoes:{}:{}:{}".format(
+            user.pk,
+            versao_atual(_CHAVE_VERSAO_GLOBAL, versoes.get(_CHAVE_VERSAO_GLOBAL)),
+            versao_atual(chave_usuario, versoes.get(chave_usuario)),
+        )
+        em_cache = cache.get(chave)
+        if em_cache is not None:
+            self.niveis = dict(em_cache["niveis"])
+            self.publicas = set(em_cache["publicas"])
+            return
+
+        self._consultar()
+        cache.set(chave, {"niveis": self.niveis, "publicas": list(self.publicas)}, PERMISSOES_CACHE_TIMEOUT)
+
+    def _consultar(self):
+        # uma única consulta: tabelas públicas + linhas de PermissaoEfetiva do usuário (LEFT JOIN filtrado)
+        linhas = (
+            TabelaProdutos.objects
+            .alias(meu_acesso=FilteredRelation(
+                "permissoes_efetivas", condition=Q(permissoes_efetivas__usuario=self.user)
+            ))
+            .filter(Q(publico=True) | Q(meu_acesso__isnull=False))
+            .values_list("pk", "publico", "meu_acesso__nivel")
+        )
+        for pk, publico, nivel in linhas:
+            if publico:
+                self.publicas.add(pk)
+            if nivel is not None:
+                self.niveis[pk] = nivel
+
+    def nivel(self, tabela_id):
+        """Nível efetivo do usuário na tabela (string de AcessoTabela.Niveis)."""
+        self._carregar()
+        if self.acesso_total:
+            return AcessoTabela.Niveis.ADMINISTRADOR
+        if tabela_id in self.niveis:
+            return self.niveis[tabela_id]
+        # fallback: public tabelas allow leitura
+        if tabela_id in self.publicas:
+            return AcessoTabela.Niveis.LEITURA
+        return AcessoTabela.Niveis.NENHUM
+
+    def tem_nivel(self, tabela_id, required_level="leitura"):
+        self._carregar()
+        if not self.user or not self.user.is_authenticated:
+            return False
+        if self.acesso_total:
+            return True
+        if tabela_id in self.niveis:
+            return nivel_valor(self.niveis[tabela_id]) >= nivel_valor(required_level)
+        return tabela_id in self.publicas and required_level == AcessoTabela.Niveis.LEITURA
+
+    def algum_com_nivel(self, tabela_ids, required_level="leitura"):
+        return any(self.tem_nivel(pk, required_level) for pk in tabela_ids)
+
+    def tabelas_visiveis(self):
+        """
+        frozenset das tabelas com leitura (o mesmo conjunto de
+        TabelaProdutos.objects.visiveis_para) ou None com acesso total.
+        """
+        self._carregar()
+        if self.acesso_total:
+            return None
+        visiveis = {pk for pk, nivel in self.niveis.items() if nivel_valor(nivel) >= nivel_valor("leitura")}
+        return frozenset(visiveis | (self.publicas - set(self.niveis)))
+
+
+def permissoes_do_request(request, user=None):
+    """
+    Retorna o MapaPermissoes de request.user, criando-o na primeira chamada e
+    reaproveitando-o no resto do request. Sem request, devolve um mapa avulso.
+    """
+    if request is None:
+        return MapaPermissoes(user)
+    user = user if user is not None else getattr(request, "user", None)
+    mapa = getattr(request, _ATTR_REQUEST, None)
+    if mapa is None or mapa.user is not user:
+        mapa = MapaPermissoes(user)
+        setattr(request, _ATTR_REQUEST, mapa)
+    return mapa
+
+
+# ----- filtros de visibilidade (EXISTS correlacionado, sem JOIN + DISTINCT) -----
+def _vinculos_do_produto():
+    return Produto.tabelas.through.objects.filter(produto_id=OuterRef("pk"))
+
+
+def filtro_produtos_visiveis(tabela=None):
+    """
+    Q para Produto.objects.filter(): produtos da `tabela` informada ou, sem tabela,
+    produtos sem nenhuma tabela ou presentes em alguma tabela pública.
+
+    Usa EXISTS sobre a tabela intermediária, então cada produto aparece uma única
+    vez sem DISTINCT, independentemente de quantas tabelas possua.
+    """
+    vinculos = _vinculos_do_produto()
+    if tabela is not None:
+        return Q(Exists(vinculos.filter(tabelaprodutos_id=getattr(tabela, "pk", tabela))))
+    return ~Q(Exists(vinculos)) | Q(Exists(vinculos.filter(tabelaprodutos__publico=True)))
+
+
+# ----- capacidades por linha (anotadas na mesma consulta da lista) -----
+CAPACIDADES = {
+    "can_read": AcessoTabela.Niveis.LEITURA,
+    "can_write": AcessoTabela.Niveis.ESCRITA,
+    "can_admin": AcessoTabela.Niveis.ADMINISTRADOR,
+}
+
+
+def anotar_capacidades(qs, user):
+    """
+    Anota um queryset de Produto com can_read/can_write/can_admin usando o mesmo
+    predicado de Produto.objects.visiveis_para (produto sem tabelas, PermissaoEfetiva
+    com o nível, tabela pública só para leitura, acesso total para superuser/staff).
+
+    Tudo vira subconsultas EXISTS na consulta da lista, sem consultas por linha.
+    """
+    anotacoes = {}
+    for nome, nivel in CAPACIDADES.items():
+        predicado = Produto.objects.predicado_visibilidade(user, nivel)
+        if predicado is None:
+            anotacoes[nome] = Value(True, output_field=BooleanField())
+        else:
+            anotacoes[nome] = ExpressionWrapper(predicado, output_field=BooleanField())
+    return qs.annotate(**anotacoes)
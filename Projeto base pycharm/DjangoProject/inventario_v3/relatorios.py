@@ -0,0 +1,295 @@
+# inventario_v3/relatorios.py
+"""
+Dados e cache dos relatórios de `manage.py gerar_relatorio`.
+
+Os agregados saem do banco: totais_por_categoria (uma consulta agrupada) e
+menor_estoque (ORDER BY quantidade LIMIT n). Nenhum produto é carregado em
+memória, que fica O(categorias + n) qualquer que seja o tamanho do catálogo.
+
+O comando gera cada relatório numa subpasta versionada (v<data>-<hex>) e o
+publica de uma vez (publicar_versao): as linhas do manifesto trocam numa
+transação e o ponteiro atual.json é substituído com um único os.replace. Quem
+lê pelo manifesto ou pelo ponteiro vê o relatório anterior inteiro ou o novo
+inteiro, nunca uma mistura; a versão anterior fica no disco até a próxima
+publicação para quem ainda está lendo. Os relatórios gerais (sem --usuario,
+compartilhados com todos) ficam direto em --out; os de cada usuário em
+--out/report_user<pk>/, com versões e ponteiro próprios, então publicar o
+relatório de um usuário não tira o de outro da página. Cada dono de cada pasta
+guarda no cache a assinatura da última publicação: versão dos dados, produtos visíveis
+(conjunto de tabelas de leitura, ou "todos") e parâmetros. Se a assinatura
+atual for a mesma e os arquivos ainda existirem, o relatório publicado já está
+em dia e nada é consultado nem desenhado.
+
+A versão dos dados é um contador no cache incrementado pelos receivers em
+signals.py a cada escrita em produtos, categorias, tabelas, vínculos produto x
+tabela e movimentos. Escritas em lote (bulk_create, update de queryset) não
+disparam signals: a assinatura vale no máximo RELATORIOS_CACHE_TIMEOUT. Com
+vários processos o backend de cache precisa ser compartilhado.
+
+Cada publicação também grava os arquivos no manifesto (models.ArquivoRelatorio):
+dono, escopo, tamanho e data de cada arquivo. A página de relatórios lista o
+manifesto com uma consulta paginada e não lê a pasta. Arquivos que chegam à
+pasta por outro caminho (cópia, versões antigas) entram com
+`manage.py indexar_relatorios`, que também remove do manifesto o que sumiu.
+"""
+from datetime import datetime, timezone as dt_timezone
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import secrets
+import shutil
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from inventario_comum.versoes import invalidar_versao, versao_atual
+
+from .models import ArquivoRelatorio
+from .permissoes import MapaPermissoes
+
+RELATORIOS_CACHE_TIMEOUT = 60 * 60
+_CHAVE_VERSAO = "inventario_v3:relatorios:versao"
+SEM_CATEGORIA = "Sem categoria"
+PASTA_PADRAO = "resultados/reports"
+EXTENSOES = (".html", ".svg", ".png", ".jpg", ".jpeg", ".json")
+# nomes antigos: report_user<pk>_* é do usuário, os demais report_* são de todos
+_NOME_DO_USUARIO = re.compile(r"^report_user(\d+)[_/]")
+_PASTA_DO_USUARIO = re.compile(r"^report_user(\d+)$")
+ARQUIVO_ATUAL = "atual.json"
+_VERSAO = re.compile(r"^v\d{8}T\d{12}-[0-9a-f]{8}$")
+
+
+def totais_por_categoria(produtos_qs):
+    """
+    [(nome da categoria, produtos, unidades em estoque)] a partir de
+    ProdutoQuerySet.totais_por("categoria__nome") (uma consulta agrupada),
+    categorias com mais produtos primeiro. Categorias de mesmo nome somam juntas.
+    """
+    totais = produtos_qs.totais_por("categoria__nome")
+    ordem = sorted(totais, key=lambda nome: (-totais[nome]["produtos"], nome or ""))
+    return [(nome or SEM_CATEGORIA, totais[nome]["produtos"], totais[nome]["unidades"] or 0) for nome in ordem]
+
+
+def menor_estoque(produtos_qs, n=10):
+    """Os n produtos com menor quantidade ({"pk", "nome", "quantidade", "categoria"}), via ORDER BY ... LIMIT."""
+    linhas = produtos_qs.order_by("quantidade", "pk").values("pk", "nome", "quantidade", "categoria__nome")[:n]
+    return [
+        {
+            "pk": linha["pk"],
+            "nome": linha["nome"],
+            "quantidade": linha["quantidade"] or 0,
+            "categoria": linha["categoria__nome"] or SEM_CATEGORIA,
+        }
+        for linha in linhas
+    ]
+
+
+def versao_dados():
+    return versao_atual(_CHAVE_VERSAO)
+
+
+def invalidar_relatorios():
+    invalidar_versao(_CHAVE_VERSAO)
+
+
+def escopo_do_usuario(user):
+    """Tabelas que `user` lê, em ordem, ou "todos" (sem usuário ou com acesso total)."""
+    if user is None:
+        return "todos"
+    visiveis = MapaPermissoes(user).tabelas_visiveis()
+    return "todos" if visiveis is None else tuple(sorted(visiveis))
+
+
+def assinatura_relatorio(*partes):
+    """Assinatura de um relatório na versão atual dos dados; leia antes das consultas do relatório."""
+    return hashlib.md5(repr((versao_dados(),) + partes).encode("utf-8")).hexdigest()
+
+
+def prefixo_do_dono(dono):
+    """Subpasta dos relatórios de `dono` (User ou pk) dentro da pasta do manifesto; "" para os gerais."""
+    return "" if dono is None else f"report_user{getattr(dono, 'pk', dono)}/"
+
+
+def _chave_pasta(pasta, dono=None):
+    pasta = Path(pasta) / prefixo_do_dono(dono)
+    return "inventario_v3:relatorios:pasta:" + hashlib.md5(str(pasta).encode("utf-8")).hexdigest()
+
+
+def relatorio_publicado(pasta, assinatura, dono=None):
+    """Caminhos dos arquivos de `dono` publicados em `pasta` se vieram de `assinatura` e ainda existem; senão None."""
+    publicado = cache.get(_chave_pasta(pasta, dono))
+    if not publicado or publicado["assinatura"] != assinatura:
+        return None
+    arquivos = [Path(pasta) / nome for nome in publicado["arquivos"]]
+    return arquivos if all(arquivo.is_file() for arquivo in arquivos) else None
+
+
+def registrar_publicacao(pasta, assinatura, nomes, dono=None):
+    cache.set(_chave_pasta(pasta, dono), {"assinatura": assinatura, "arquivos": list(nomes)}, RELATORIOS_CACHE_TIMEOUT)
+
+
+def pasta_relatorios(pasta=PASTA_PADRAO):
+    """`pasta` absoluta (relativa a settings.BASE_DIR quando não for), como é guardada no manifesto."""
+    pasta = Path(pasta)
+    if not pasta.is_absolute():
+        base = getattr(settings, "BASE_DIR", None)
+        pasta = Path(base) / pasta if base else pasta
+    return pasta.resolve()
+
+
+def texto_escopo(escopo):
+    """escopo_do_usuario() como texto do manifesto: "todos" ou "1,2,3"."""
+    return escopo if isinstance(escopo, str) else ",".join(str(pk) for pk in escopo)
+
+
+def _modificado_em(info):
+    return datetime.fromtimestamp(info.st_mtime, tz=dt_timezone.utc)
+
+
+def registrar_arquivos(pasta, nomes, dono=None, escopo="", removidos=()):
+    """
+    Grava no manifesto os arquivos `nomes` recém-publicados em `pasta` (tamanho e
+    data lidos do disco, dono e escopo da geração) e apaga as linhas de `removidos`.
+    Sem dono o relatório é geral e fica compartilhado com todos.
+    """
+    pasta = pasta_relatorios(pasta)
+    linhas = []
+    for nome in nomes:
+        info = (pasta / nome).stat()
+        linhas.append(
+            ArquivoRelatorio(
+                pasta=str(pasta), nome=nome, dono=dono, escopo=texto_escopo(escopo), compartilhado=dono is None,
+                tamanho=info.st_size, gerado_em=_modificado_em(info),
+            )
+        )
+    with transaction.atomic():
+        if removidos:
+            ArquivoRelatorio.objects.filter(pasta=str(pasta), nome__in=list(removidos)).delete()
+        ArquivoRelatorio.objects.bulk_create(
+            linhas,
+            update_conflicts=True,
+            unique_fields=["pasta", "nome"],
+            update_fields=["dono", "escopo", "compartilhado", "tamanho", "gerado_em"],
+        )
+
+
+def versao_publicada(pasta, dono=None):
+    """Conteúdo do ponteiro atual.json de `dono` em `pasta` ({"versao", "arquivos"}) ou None."""
+    try:
+        atual = json.loads((Path(pasta) / prefixo_do_dono(dono) / ARQUIVO_ATUAL).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return atual if isinstance(atual, dict) and _VERSAO.match(str(atual.get("versao", ""))) else None
+
+
+def arquivo_publicado(pasta, nome, dono=None):
+    """Caminho de `nome` na versão de `dono` publicada em `pasta`, ou None se ela não o tem."""
+    atual = versao_publicada(pasta, dono)
+    if atual is None or nome not in atual.get("arquivos", ()):
+        return None
+    return Path(pasta) / prefixo_do_dono(dono) / atual["versao"] / nome
+
+
+def publicar_versao(pasta, gerada, dono=None, escopo=""):
+    """
+    Publica de uma vez os arquivos gerados em `gerada` (pasta temporária dentro de
+    `pasta`) como o relatório de `dono` (geral quando None): ela vira a subpasta
+    da nova versão na pasta do dono (prefixo_do_dono), o manifesto troca as
+    linhas da versão anterior desse dono pelas novas numa transação e o
+    atual.json do dono passa a apontar para ela. Arquivos soltos de mesmo
+    nome-base (publicações antigas, sem versão, ou outro formato de gráfico) saem
+    da pasta e do manifesto. A versão anterior fica no disco para quem a está
+    lendo; as mais antigas do mesmo dono são apagadas. Os relatórios dos outros
+    donos não são tocados. Devolve os nomes publicados
+    ("[report_user<pk>/]<versao>/<arquivo>"), como ficam no manifesto.
+    """
+    pasta = pasta_relatorios(pasta)
+    prefixo = prefixo_do_dono(dono)
+    destino = pasta / prefixo
+    destino.mkdir(parents=True, exist_ok=True)
+    anterior = versao_publicada(destino)
+    versao = f"v{timezone.now():%Y%m%dT%H%M%S%f}-{secrets.token_hex(4)}"
+    os.replace(gerada, destino / versao)
+    arquivos = sorted(arquivo.name for arquivo in (destino / versao).iterdir())
+    nomes = [f"{prefixo}{versao}/{arquivo}" for arquivo in arquivos]
+    bases = {Path(arquivo).stem for arquivo in arquivos}
+    soltos = [
+        arquivo.name for arquivo in destino.iterdir()
+        if arquivo.is_file() and arquivo.stem in bases and arquivo.suffix.lower() in EXTENSOES
+        and arquivo.name != ARQUIVO_ATUAL
+    ]
+    with transaction.atomic():
+        ArquivoRelatorio.objects.filter(pasta=str(pasta), nome__regex=rf"^{re.escape(prefixo)}v\d{{8}}T").delete()
+        registrar_arquivos(pasta, nomes, dono=dono, escopo=escopo, removidos=[prefixo + nome for nome in soltos])
+
+    ponteiro = destino / f".{ARQUIVO_ATUAL}.{versao}"
+    ponteiro.write_text(json.dumps({"versao": versao, "arquivos": arquivos}), encoding="utf-8")
+    os.replace(ponteiro, destino / ARQUIVO_ATUAL)
+
+    for nome in soltos:
+        (destino / nome).unlink(missing_ok=True)
+    # relê o ponteiro: uma publicação concorrente pode já ter trocado a versão
+    manter = {versao, (anterior or {}).get("versao"), (versao_publicada(destino) or {}).get("versao")}
+    for subpasta in destino.iterdir():
+        if subpasta.is_dir() and _VERSAO.match(subpasta.name) and subpasta.name not in manter:
+            shutil.rmtree(subpasta, ignore_errors=True)
+    return nomes
+
+
+def indexar_pasta(pasta):
+    """
+    Sincroniza o manifesto com o conteúdo de `pasta`: arquivos soltos e os das
+    versões publicadas (atual.json da pasta e de cada report_user<pk>/) que são
+    novos entram (dono pelo nome report_user<pk>_* ou pela pasta), os conhecidos
+    têm tamanho e data atualizados e os que sumiram saem. Devolve (novos,
+    atualizados, removidos).
+    """
+    from django.contrib.auth import get_user_model
+
+    pasta = pasta_relatorios(pasta)
+    no_disco = {}
+    if pasta.is_dir():
+        for arquivo in pasta.iterdir():
+            if arquivo.is_file() and arquivo.suffix.lower() in EXTENSOES and arquivo.name != ARQUIVO_ATUAL:
+                no_disco[arquivo.name] = arquivo.stat()
+        prefixos = [""] + [
+            f"{sub.name}/" for sub in pasta.iterdir() if sub.is_dir() and _PASTA_DO_USUARIO.match(sub.name)
+        ]
+        for prefixo in prefixos:
+            atual = versao_publicada(pasta / prefixo)
+            for nome in (atual or {}).get("arquivos", ()):
+                arquivo = pasta / prefixo / atual["versao"] / nome
+                if arquivo.is_file():
+                    no_disco[f"{prefixo}{atual['versao']}/{nome}"] = arquivo.stat()
+    conhecidos = {a.nome: a for a in ArquivoRelatorio.objects.filter(pasta=str(pasta))}
+    pks_donos = {int(m.group(1)) for m in map(_NOME_DO_USUARIO.match, no_disco) if m}
+    donos = set(get_user_model().objects.filter(pk__in=pks_donos).values_list("pk", flat=True))
+
+    novos, atualizados = [], []
+    for nome, info in no_disco.items():
+        if nome in conhecidos:
+            arquivo = conhecidos[nome]
+            arquivo.tamanho, arquivo.gerado_em = info.st_size, _modificado_em(info)
+            atualizados.append(arquivo)
+            continue
+        dono = _NOME_DO_USUARIO.match(nome)
+        dono_id = int(dono.group(1)) if dono and int(dono.group(1)) in donos else None
+        novos.append(
+            ArquivoRelatorio(
+                pasta=str(pasta), nome=nome, dono_id=dono_id,
+                # sem dono no nome: relatórios report_* antigos e versões gerais são de todos
+                compartilhado=dono is None
+                and (nome.startswith("report_") or bool(_VERSAO.match(nome.split("/")[0]))),
+                tamanho=info.st_size, gerado_em=_modificado_em(info),
+            )
+        )
+    sumidos = [nome for nome in conhecidos if nome not in no_disco]
+    with transaction.atomic():
+        ArquivoRelatorio.objects.filter(pasta=str(pasta), nome__in=sumidos).delete()
+        ArquivoRelatorio.objects.bulk_create(novos)
+        ArquivoRelatorio.objects.bulk_update(atualizados, ["tamanho", "gerado_em"])
+    return len(novos), len(atualizados), len(sumidos)
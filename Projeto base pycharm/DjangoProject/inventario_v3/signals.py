@@ -1,46 +1,57 @@
 # inventario_v3/signals.py
+from io import StringIO
 import logging
 from pathlib import Path
 from django.conf import settings
 from django.dispatch import receiver
 from django.contrib.auth.signals import user_logged_in
-from django.db.models.signals import m2m_changed, pre_delete
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, pre_delete, pre_save, post_save, post_delete
 from django.core.management import call_command
 
-from .models import TabelaProdutos, AcessoTabela, Produto, Movimento
+from inventario_comum.tarefas import relatorios
+
+from .models import TabelaProdutos, AcessoTabela, AcessoGrupoTabela, Categoria, Produto, Movimento
+from .permissoes import invalidar_permissoes, recalcular_permissoes_efetivas, recalculo_esta_adiado
+from .relatorios import invalidar_relatorios
 
 logger = logging.getLogger(__name__)
 
 
+def gerar_relatorio_do_usuario(usuario_pk):
+    out_dir = Path(getattr(settings, "BASE_DIR", Path.cwd())) / "resultados" / "reports"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    call_command("gerar_relatorio", out=str(out_dir), usuario=str(usuario_pk), stdout=StringIO())
+    logger.info("Relatório gerado para o user %s", usuario_pk)
+
+
+def chave_relatorio(usuario_pk):
+    # cada usuário publica o próprio relatório (report_user<pk>/): logins repetidos
+    # do mesmo usuário viram uma geração só, os de usuários diferentes não se juntam
+    return ("login", usuario_pk)
+
+
 @receiver(user_logged_in)
 def gerar_relatorio_no_login(sender, user, request, **kwargs):
     """
-    Ao logar, gera um relatório (HTML+PNGs+JSON) para o usuário contendo apenas as tabelas
-    que ele tem acesso (ou todas se staff/superuser).
-
-    Nota: o comando 'gerar_relatorio' aceita somente --out (e --top). Não passamos
-    opções não suportadas (tabelas/usuario) para evitar TypeError.
+    Ao logar, enfileira um relatório (HTML+PNGs+JSON) com apenas os produtos que o
+    usuário pode ver (Produto.objects.visiveis_para, via --usuario). A geração roda
+    no worker de inventario_comum/tarefas.py depois do commit; o login não espera
+    os gráficos.
     """
     try:
-        if getattr(user, "is_superuser", False) or getattr(user, "is_staff", False):
-            pks = list(TabelaProdutos.objects.values_list("pk", flat=True))
-        else:
-            public_pks = list(TabelaProdutos.objects.filter(publico=True).values_list("pk", flat=True))
-            acesso_pks = list(AcessoTabela.objects.filter(usuario=user).values_list("tabela__pk", flat=True))
-            pks = list({*public_pks, *acesso_pks})
+        pks = list(TabelaProdutos.objects.visiveis_para(user).values_list("pk", flat=True))
 
         if not pks:
             logger.debug("Usuario %s não tem tabelas para gerar relatório.", getattr(user, "pk", "<unknown>"))
             return
 
-        out_dir = Path(getattr(settings, "BASE_DIR", Path.cwd())) / "resultados" / "reports"
-        out_dir.mkdir(parents=True, exist_ok=True)
-
-        # Chama o comando apenas com opções suportadas
-        call_command("gerar_relatorio", out=str(out_dir))
-        logger.info("Relatório gerado no login do user %s (tabelas: %s)", getattr(user, "pk", ""), ",".join(map(str, pks)))
+        chave = chave_relatorio(user.pk)
+        transaction.on_commit(lambda: relatorios.enfileirar(chave, gerar_relatorio_do_usuario, user.pk))
+        logger.debug("Relatório enfileirado no login do user %s (tabelas: %s)", user.pk, ",".join(map(str, pks)))
     except Exception as e:
-        logger.exception("Falha ao gerar relatório no login do usuário %s: %s", getattr(user, "pk", ""), e)
+        logger.exception("Falha ao enfileirar relatório no login do usuário %s: %s", getattr(user, "pk", ""), e)
 
 
 # --- handlers to remove orphan products and their movimentos ---
@@ -83,4 +94,96 @@ def tabela_pre_delete(sender, instance, **kwargs):
                 logger.info("Produto %s ficará órfão após exclusão da tabela %s — removendo", p, instance)
                 p.delete()
     except Exception:
-        logger.exception("Erro ao processar pre_delete para TabelaProdutos %s", getattr(instance, "pk", "<unknown>"))
\ No newline at end of file
+        logger.exception("Erro ao processar pre_delete para TabelaProdutos %s", getattr(instance, "pk", "<unknown>"))
+
+
+# --- invalidação do cache de permissões (ver permissoes.py) ---
+
+
+@receiver(pre_save, sender=AcessoTabela)
+def acesso_tabela_pre_save(sender, instance, **kwargs):
+    # guarda usuario/tabela anteriores para recalcular também o par antigo se mudarem
+    instance._par_anterior = None
+    if instance.pk and not recalculo_esta_adiado():
+        instance._par_anterior = (
+            AcessoTabela.objects.filter(pk=instance.pk).values_list("usuario_id", "tabela_id").first()
+        )
+
+
+@receiver(post_save, sender=AcessoTabela)
+@receiver(post_delete, sender=AcessoTabela)
+def acesso_tabela_changed(sender, instance, **kwargs):
+    if recalculo_esta_adiado():
+        return
+    usuarios, tabelas = {instance.usuario_id}, {instance.tabela_id}
+    anterior = getattr(instance, "_par_anterior", None)
+    if anterior:
+        usuarios.add(anterior[0])
+        tabelas.add(anterior[1])
+    recalcular_permissoes_efetivas(usuario_ids=usuarios, tabela_ids=tabelas)
+
+
+@receiver(post_save, sender=AcessoGrupoTabela)
+@receiver(post_delete, sender=AcessoGrupoTabela)
+def acesso_grupo_changed(sender, instance, **kwargs):
+    # recalcula a tabela inteira: funciona mesmo quando o grupo está sendo excluído
+    # (os vínculos de membros podem já ter sido apagados em cascata)
+    recalcular_permissoes_efetivas(tabela_ids={instance.tabela_id})
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def grupos_do_usuario_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Entrada/saída de usuários em grupos. Forward: instance é o usuário; reverse:
+    instance é o Group e pk_set são usuários. Em clear pelo lado do grupo os
+    membros são lidos antes (pre_clear) para saber quem recalcular.
+    """
+    if reverse:
+        if action == "pre_clear":
+            instance._membros_antes_clear = set(instance.user_set.values_list("pk", flat=True))
+            return
+        if action == "post_clear":
+            usuarios = getattr(instance, "_membros_antes_clear", set())
+        elif action in ("post_add", "post_remove"):
+            usuarios = pk_set or set()
+        else:
+            return
+        tabelas = set(instance.acessos_tabela.values_list("tabela_id", flat=True))
+        recalcular_permissoes_efetivas(usuario_ids=usuarios, tabela_ids=tabelas)
+    elif action in ("post_add", "post_remove", "post_clear"):
+        recalcular_permissoes_efetivas(usuario_ids={instance.pk})
+
+
+@receiver(post_save, sender=TabelaProdutos)
+@receiver(post_delete, sender=TabelaProdutos)
+def tabela_changed_invalida_permissoes(sender, instance, **kwargs):
+    # o conjunto de tabelas públicas é compartilhado por todos os usuários
+    invalidar_permissoes()
+
+
+@receiver(post_save, sender=get_user_model())
+def usuario_criado_invalida_permissoes(sender, instance, created=False, **kwargs):
+    # protege contra reaproveitamento de pk (ex.: SQLite após exclusões)
+    if created:
+        invalidar_permissoes(instance.pk)
+
+
+# --- versão dos dados dos relatórios (ver relatorios.py) ---
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_save, sender=TabelaProdutos)
+@receiver(post_delete, sender=TabelaProdutos)
+@receiver(post_save, sender=Movimento)
+@receiver(post_delete, sender=Movimento)
+def dados_relatorio_changed(sender, **kwargs):
+    invalidar_relatorios()
+
+
+@receiver(m2m_changed, sender=Produto.tabelas.through)
+def vinculos_relatorio_changed(sender, action, **kwargs):
+    if action.startswith("post_"):
+        invalidar_relatorios()
@@ -98,7 +98,8 @@ def test_report_view_shows_generated_reports(client, django_user_model, tmp_path
     """
     Ensure that the ReportView lists files present in resultados/reports.
     We'll create a resultados/reports directory in the project root and place
-    a dummy file into it, then request the view as a staff user.
+    a dummy file into it, index it into the report manifest (the view reads the
+    manifest, not the folder), then request the view as a staff user.
     """
     # create staff user and login
     username = "reportadmin"
@@ -126,6 +127,7 @@ def test_report_view_shows_generated_reports(client, django_user_model, tmp_path
         # create a dummy PNG (or text) file that the template will detect
         dummy_png = reports_dir / "dummy_report.png"
         dummy_png.write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR")  # minimal PNG header bytes
+        call_command("indexar_relatorios", out=str(reports_dir))
 
         # GET the reports page
         url = reverse("inventario_v3:relatorios")
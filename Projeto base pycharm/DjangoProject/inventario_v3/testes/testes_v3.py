@@ -238,15 +238,19 @@ def test_gerar_relatorio_command_creates_files(tmp_path):
 
 
 @pytest.mark.django_db
-def test_signal_generates_report_on_login(django_user_model):
+def test_signal_generates_report_on_login(django_user_model, django_capture_on_commit_callbacks):
     # create user and a public table so the receiver will find tables
     user = django_user_model.objects.create_user(username="siguser", password="pwd")
     TabelaProdutos.objects.create(nome="Tsig", publico=True)
 
     import inventario_v3.signals as signals_mod
+    from inventario_comum.tarefas import relatorios
     with patch.object(signals_mod, "call_command") as mock_call:
-        # send the login signal (request can be None; receiver handles it defensively)
-        user_logged_in.send(sender=user.__class__, user=user, request=None)
+        # send the login signal (request can be None; receiver handles it defensively);
+        # the report is queued after commit and generated by the background worker
+        with django_capture_on_commit_callbacks(execute=True):
+            user_logged_in.send(sender=user.__class__, user=user, request=None)
+        assert relatorios.aguardar(5)
         assert mock_call.called
 
 
@@ -0,0 +1,717 @@
+# Testes de desempenho/escala para inventario_v3 (permissões, consultas e relatórios).
+import json
+from decimal import Decimal
+from io import StringIO
+import threading
+from types import SimpleNamespace
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from inventario_comum import tarefas
+from inventario_comum.consultas import OrcamentoConsultasExcedido
+from inventario_v3.contexto import contexto_do_request
+from inventario_v3.models import (
+    Produto, Categoria, Movimento, TabelaProdutos, AcessoTabela, AcessoGrupoTabela, PermissaoEfetiva, PerfilUsuario
+)
+from inventario_v3.permissoes import permissoes_do_request, anotar_capacidades
+from inventario_v3.relatorios import arquivo_publicado, versao_publicada
+from inventario_v3.views import ProdutosLista, user_has_table_level, product_has_table_with_access
+
+User = get_user_model()
+
+
+@pytest.mark.django_db
+def test_mapa_permissoes_respeita_niveis_e_tabelas_publicas():
+    user = User.objects.create_user(username="mapa_user", password="pwd")
+    privada = TabelaProdutos.objects.create(nome="Privada")
+    publica = TabelaProdutos.objects.create(nome="Publica", publico=True)
+    bloqueada = TabelaProdutos.objects.create(nome="PublicaBloqueada", publico=True)
+    sem_acesso = TabelaProdutos.objects.create(nome="SemAcesso")
+    AcessoTabela.objects.create(usuario=user, tabela=privada, nivel=AcessoTabela.Niveis.ESCRITA)
+    AcessoTabela.objects.create(usuario=user, tabela=bloqueada, nivel=AcessoTabela.Niveis.NENHUM)
+
+    assert user_has_table_level(user, privada, "escrita")
+    assert not user_has_table_level(user, privada, "administrador")
+    assert user_has_table_level(user, publica, "leitura")
+    assert not user_has_table_level(user, publica, "escrita")
+    # AcessoTabela explícito tem precedência sobre o fallback público
+    assert not user_has_table_level(user, bloqueada, "leitura")
+    assert not user_has_table_level(user, sem_acesso, "leitura")
+
+
+@pytest.mark.django_db
+def test_permissoes_do_request_usam_uma_consulta_por_request(django_assert_num_queries):
+    user = User.objects.create_user(username="req_user", password="pwd", is_staff=False)
+    tabelas = [TabelaProdutos.objects.create(nome=f"T{i}") for i in range(5)]
+    AcessoTabela.objects.create(usuario=user, tabela=tabelas[-1], nivel=AcessoTabela.Niveis.LEITURA)
+    produto = Produto.objects.create(nome="Multi", quantidade=1, preco="1.00")
+    produto.tabelas.add(*tabelas)
+    request = SimpleNamespace(user=user)
+
+    # 1 consulta para o mapa + 1 para os ids das tabelas do produto
+    with django_assert_num_queries(2):
+        assert product_has_table_with_access(produto, user, "leitura", request=request)
+    # o mapa fica memoizado no request
+    with django_assert_num_queries(0):
+        for t in tabelas:
+            user_has_table_level(user, t, "leitura", request=request)
+    assert permissoes_do_request(request) is permissoes_do_request(request)
+
+
+@pytest.mark.django_db
+def test_cache_de_permissoes_dispensa_consultas_e_invalida_ao_conceder(django_assert_num_queries):
+    user = User.objects.create_user(username="cache_user", password="pwd")
+    tabela = TabelaProdutos.objects.create(nome="TCache")
+
+    assert not permissoes_do_request(SimpleNamespace(user=user)).tem_nivel(tabela.pk, "leitura")
+    # request seguinte: mapa vem do cache, nenhuma consulta de permissão
+    with django_assert_num_queries(0):
+        assert not permissoes_do_request(SimpleNamespace(user=user)).tem_nivel(tabela.pk, "leitura")
+
+    AcessoTabela.objects.create(usuario=user, tabela=tabela, nivel=AcessoTabela.Niveis.LEITURA)
+    assert permissoes_do_request(SimpleNamespace(user=user)).tem_nivel(tabela.pk, "leitura")
+
+    tabela2 = TabelaProdutos.objects.create(nome="TCache2")
+    assert not permissoes_do_request(SimpleNamespace(user=user)).tem_nivel(tabela2.pk, "leitura")
+    tabela2.publico = True
+    tabela2.save()
+    assert permissoes_do_request(SimpleNamespace(user=user)).tem_nivel(tabela2.pk, "leitura")
+
+
+@pytest.mark.django_db
+def test_lista_de_produtos_sem_duplicatas_com_varias_tabelas(client, django_user_model):
+    user = django_user_model.objects.create_user(username="vis_user", password="pwd")
+    client.force_login(user)
+    publicas = [TabelaProdutos.objects.create(nome=f"Pub{i}", publico=True) for i in range(4)]
+    privada = TabelaProdutos.objects.create(nome="Priv")
+    multi = Produto.objects.create(nome="Multi", quantidade=1, preco="1.00")
+    multi.tabelas.add(*publicas, privada)
+    avulso = Produto.objects.create(nome="Avulso", quantidade=1, preco="1.00")
+    oculto = Produto.objects.create(nome="Oculto", quantidade=1, preco="1.00")
+    oculto.tabelas.add(privada)
+
+    resp = client.get(reverse("inventario_v3:produtos_lista"))
+    assert sorted(p.pk for p in resp.context["produtos"]) == sorted([multi.pk, avulso.pk])
+
+    AcessoTabela.objects.create(usuario=user, tabela=privada, nivel=AcessoTabela.Niveis.LEITURA)
+    resp = client.get(reverse("inventario_v3:tabelas_lista"))
+    assert sorted(t.pk for t in resp.context["tabelas"]) == sorted([t.pk for t in publicas] + [privada.pk])
+
+
+@pytest.mark.django_db
+def test_benchmark_visibilidade_nao_deixa_dados():
+    out = StringIO()
+    call_command("benchmark_visibilidade", produtos=20, tabelas_por_produto="1,3", repeticoes=1, stdout=out)
+    assert "exists" in out.getvalue()
+    assert not Produto.objects.exists()
+
+
+@pytest.mark.django_db
+def test_capacidades_anotadas_batem_com_checagem_por_produto(django_assert_num_queries):
+    user = User.objects.create_user(username="cap_user", password="pwd")
+    leitura = TabelaProdutos.objects.create(nome="CapLeitura")
+    escrita = TabelaProdutos.objects.create(nome="CapEscrita")
+    admin = TabelaProdutos.objects.create(nome="CapAdmin")
+    publica = TabelaProdutos.objects.create(nome="CapPublica", publico=True)
+    bloqueada = TabelaProdutos.objects.create(nome="CapBloqueada", publico=True)
+    for tabela, nivel in [
+        (leitura, AcessoTabela.Niveis.LEITURA),
+        (escrita, AcessoTabela.Niveis.ESCRITA),
+        (admin, AcessoTabela.Niveis.ADMINISTRADOR),
+        (bloqueada, AcessoTabela.Niveis.NENHUM),
+    ]:
+        AcessoTabela.objects.create(usuario=user, tabela=tabela, nivel=nivel)
+    combinacoes = [[], [leitura], [escrita], [admin], [publica], [bloqueada], [leitura, admin], [publica, escrita]]
+    for i, tabelas in enumerate(combinacoes):
+        Produto.objects.create(nome=f"Cap{i}", quantidade=1, preco="1.00").tabelas.add(*tabelas)
+
+    with django_assert_num_queries(1):
+        produtos = list(anotar_capacidades(Produto.objects.order_by("pk"), user))
+    for p in produtos:
+        esperado = tuple(
+            product_has_table_with_access(p, user, nivel)
+            for nivel in ("leitura", "escrita", "administrador")
+        )
+        assert (p.can_read, p.can_write, p.can_admin) == esperado, p.nome
+
+
+@pytest.mark.django_db
+def test_contexto_usuario_carrega_perfil_e_tabela_ativa_uma_vez(django_assert_num_queries):
+    user = User.objects.create_user(username="ctx_user", password="pwd")
+    tabela = TabelaProdutos.objects.create(nome="CtxTabela", publico=True)
+    PerfilUsuario.objects.update_or_create(usuario=user, defaults={"current_tabela": tabela})
+    user = User.objects.get(pk=user.pk)
+    request = SimpleNamespace(user=user)
+
+    with django_assert_num_queries(1):
+        contexto = contexto_do_request(request)
+        assert contexto.current_tabela == tabela
+        # user.perfil e a tabela ativa reaproveitam o que o contexto carregou
+        assert user.perfil.current_tabela.nome == "CtxTabela"
+        assert contexto_do_request(request) is contexto
+        assert contexto.funcao == user.perfil.funcao
+
+
+@pytest.mark.django_db
+def test_acesso_por_grupo_materializa_permissao_efetiva():
+    equipe = Group.objects.create(name="Almoxarifado")
+    membros = [User.objects.create_user(username=f"membro{i}", password="pwd") for i in range(3)]
+    equipe.user_set.add(*membros[:2])
+    tabela = TabelaProdutos.objects.create(nome="Estoque")
+
+    AcessoGrupoTabela.objects.create(grupo=equipe, tabela=tabela, nivel=AcessoTabela.Niveis.ESCRITA)
+    assert PermissaoEfetiva.objects.filter(tabela=tabela).count() == 2
+    assert user_has_table_level(membros[0], tabela, "escrita")
+    assert not user_has_table_level(membros[2], tabela, "leitura")
+
+    # entrada no grupo pelo lado do usuário; acesso direto maior prevalece
+    membros[2].groups.add(equipe)
+    AcessoTabela.objects.create(usuario=membros[0], tabela=tabela, nivel=AcessoTabela.Niveis.ADMINISTRADOR)
+    assert user_has_table_level(membros[2], tabela, "escrita")
+    assert user_has_table_level(membros[0], tabela, "administrador")
+
+    equipe.user_set.clear()
+    assert set(PermissaoEfetiva.objects.values_list("usuario_id", "nivel")) == {
+        (membros[0].pk, AcessoTabela.Niveis.ADMINISTRADOR)
+    }
+    assert not user_has_table_level(membros[1], tabela, "leitura")
+
+    call_command("recalcular_permissoes", stdout=StringIO())
+    assert PermissaoEfetiva.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_recalculo_por_usuario_junta_membros_do_grupo_uma_vez():
+    from inventario_v3.permissoes import recalcular_permissoes_efetivas
+
+    equipe = Group.objects.create(name="Expedicao")
+    membros = [User.objects.create_user(username=f"expedicao{i}", password="pwd") for i in range(4)]
+    equipe.user_set.add(*membros)
+    AcessoGrupoTabela.objects.create(grupo=equipe, tabela=TabelaProdutos.objects.create(nome="Doca"))
+
+    PermissaoEfetiva.objects.all().delete()
+    with CaptureQueriesContext(connection) as ctx:
+        assert recalcular_permissoes_efetivas(usuario_ids=[m.pk for m in membros[:2]]) == 2
+    # sem JOIN duplicado em auth_user_groups (linhas multiplicadas pelos membros do grupo)
+    assert all(q["sql"].count('JOIN "auth_user_groups"') <= 1 for q in ctx.captured_queries)
+
+
+@pytest.mark.django_db
+def test_acessos_em_lote_concede_e_revoga_numa_transacao(client, django_assert_max_num_queries):
+    staff = User.objects.create_user(username="lote_staff", password="pwd", is_staff=True)
+    equipe = [User.objects.create_user(username=f"op{i:02d}", password="pwd") for i in range(40)]
+    tabelas = [TabelaProdutos.objects.create(nome=f"Lote{i}") for i in range(3)]
+    AcessoTabela.objects.create(usuario=equipe[0], tabela=tabelas[0], nivel=AcessoTabela.Niveis.LEITURA)
+    client.force_login(staff)
+    url = reverse("inventario_v3:acessos_em_lote")
+
+    payload = {"conceder": [
+        {"usuario": u.pk, "tabela": t.pk, "nivel": AcessoTabela.Niveis.ESCRITA} for u in equipe for t in tabelas
+    ]}
+    # número de consultas não cresce com o tamanho do lote
+    with django_assert_max_num_queries(25):
+        resp = client.post(url, json.dumps(payload), content_type="application/json")
+    assert resp.status_code == 200
+    assert resp.json() == {"criados": 119, "alterados": 1, "revogados": 0}
+    assert PermissaoEfetiva.objects.filter(nivel=AcessoTabela.Niveis.ESCRITA).count() == 120
+    assert user_has_table_level(equipe[0], tabelas[0], "escrita")
+
+    resp = client.post(
+        url,
+        {"usuarios": [u.pk for u in equipe[:10]], "tabelas": [tabelas[2].pk], "acao": "revogar"},
+    )
+    assert resp.status_code == 302
+    assert AcessoTabela.objects.count() == 110
+    assert not user_has_table_level(equipe[5], tabelas[2], "leitura")
+
+    resp = client.post(url, json.dumps({"conceder": [{"usuario": 999999, "tabela": tabelas[0].pk, "nivel": "escrita"}]}),
+                       content_type="application/json")
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_acessos_em_lote_exige_administrador_da_tabela(client):
+    gerente = User.objects.create_user(username="gerente", password="pwd")
+    alvo = User.objects.create_user(username="alvo", password="pwd")
+    minha = TabelaProdutos.objects.create(nome="Minha")
+    alheia = TabelaProdutos.objects.create(nome="Alheia")
+    AcessoTabela.objects.create(usuario=gerente, tabela=minha, nivel=AcessoTabela.Niveis.ADMINISTRADOR)
+    client.force_login(gerente)
+    url = reverse("inventario_v3:acessos_em_lote")
+
+    ok = {"conceder": [{"usuario": alvo.pk, "tabela": minha.pk, "nivel": "leitura"}]}
+    assert client.post(url, json.dumps(ok), content_type="application/json").status_code == 200
+    negado = {"conceder": [{"usuario": alvo.pk, "tabela": alheia.pk, "nivel": "leitura"}]}
+    assert client.post(url, json.dumps(negado), content_type="application/json").status_code == 403
+    assert not AcessoTabela.objects.filter(tabela=alheia).exists()
+
+
+@pytest.mark.django_db
+def test_acessos_em_lote_aplica_nivel_sobre_par_criado_em_paralelo(monkeypatch):
+    from django.db.models import Manager
+
+    from inventario_v3.permissoes import aplicar_acessos_em_lote
+
+    usuario = User.objects.create_user(username="paralelo", password="pwd")
+    disputada, nova = TabelaProdutos.objects.create(nome="Disputada"), TabelaProdutos.objects.create(nome="Nova")
+    AcessoTabela.objects.create(usuario=usuario, tabela=disputada, nivel=AcessoTabela.Niveis.LEITURA)
+    # o lote não enxerga o par: como se outro request o tivesse criado depois da leitura
+    monkeypatch.setattr(Manager, "select_for_update", lambda self: AcessoTabela.objects.none())
+
+    resultado = aplicar_acessos_em_lote(
+        concessoes=[(usuario.pk, disputada.pk, AcessoTabela.Niveis.ESCRITA), (usuario.pk, nova.pk, "leitura")]
+    )
+    assert resultado == {"criados": 1, "alterados": 1, "revogados": 0}
+    assert AcessoTabela.objects.get(usuario=usuario, tabela=disputada).nivel == AcessoTabela.Niveis.ESCRITA
+    assert user_has_table_level(usuario, disputada, "escrita")
+
+
+@pytest.mark.django_db
+def test_matriz_de_acessos_paginada_e_autocomplete(client):
+    staff = User.objects.create_user(username="aaa_staff", password="pwd", is_staff=True)
+    for i in range(60):
+        User.objects.create_user(username=f"mat{i:02d}", password="pwd")
+    tabela = TabelaProdutos.objects.create(nome="Matriz")
+    alvo = User.objects.get(username="mat00")
+    AcessoTabela.objects.create(usuario=alvo, tabela=tabela, nivel=AcessoTabela.Niveis.ESCRITA)
+    client.force_login(staff)
+
+    resp = client.get(reverse("inventario_v3:matriz_acessos"), {"usuario": "mat"})
+    assert resp.status_code == 200
+    assert resp.context["page_obj"].paginator.count == 60
+    linha = resp.context["linhas"][0]
+    assert linha["usuario"] == alvo and linha["celulas"] == [AcessoTabela.Niveis.ESCRITA]
+
+    resp = client.get(reverse("inventario_v3:autocomplete_usuarios"), {"q": "mat1"})
+    assert [r["texto"] for r in resp.json()["resultados"]] == [f"mat{i}" for i in range(10, 20)]
+
+
+@pytest.mark.django_db
+def test_acessos_por_grupo_paginados_e_filtrados(client):
+    staff = User.objects.create_user(username="grp_staff", password="pwd", is_staff=True)
+    tabela = TabelaProdutos.objects.create(nome="Grupos")
+    outra = TabelaProdutos.objects.create(nome="Outra")
+    grupos = Group.objects.bulk_create(Group(name=f"grp{i:02d}") for i in range(60))
+    AcessoGrupoTabela.objects.bulk_create(AcessoGrupoTabela(grupo=g, tabela=tabela) for g in grupos)
+    AcessoGrupoTabela.objects.create(grupo=grupos[0], tabela=outra)
+    client.force_login(staff)
+    url = reverse("inventario_v3:gerenciar_acessos")
+
+    resp = client.get(url)
+    pagina = resp.context["pagina_grupos"]
+    assert pagina.paginator.count == 61 and len(resp.context["group_accesses"]) == 50
+    assert "gpage=2" in resp.content.decode()
+    assert len(client.get(url, {"gpage": 2}).context["group_accesses"]) == 11
+
+    resp = client.get(url, {"grupo": "grp1", "tabela": "Grupos"})
+    assert [a.grupo.name for a in resp.context["group_accesses"]] == [f"grp{i}" for i in range(10, 20)]
+    assert [a.tabela for a in client.get(url, {"tabela": "Outra"}).context["group_accesses"]] == [outra]
+
+
+@pytest.mark.django_db
+def test_visiveis_para_bate_com_checagem_por_produto_e_filtra_relatorio(tmp_path):
+    user = User.objects.create_user(username="vis_mgr", password="pwd")
+    leitura = TabelaProdutos.objects.create(nome="VisLeitura")
+    escrita = TabelaProdutos.objects.create(nome="VisEscrita")
+    publica = TabelaProdutos.objects.create(nome="VisPublica", publico=True)
+    privada = TabelaProdutos.objects.create(nome="VisPrivada")
+    AcessoTabela.objects.create(usuario=user, tabela=leitura, nivel=AcessoTabela.Niveis.LEITURA)
+    AcessoTabela.objects.create(usuario=user, tabela=escrita, nivel=AcessoTabela.Niveis.ESCRITA)
+    for i, tabelas in enumerate([[], [leitura], [escrita], [publica], [privada], [privada, escrita]]):
+        Produto.objects.create(nome=f"Vis{i}", quantidade=i, preco="1.00").tabelas.add(*tabelas)
+
+    for nivel in ("leitura", "escrita", "administrador"):
+        visiveis = set(Produto.objects.visiveis_para(user, nivel).values_list("nome", flat=True))
+        esperado = {p.nome for p in Produto.objects.all() if product_has_table_with_access(p, user, nivel)}
+        assert visiveis == esperado, nivel
+    assert set(TabelaProdutos.objects.visiveis_para(user)) == {leitura, escrita, publica}
+    assert list(TabelaProdutos.objects.visiveis_para(user, "escrita")) == [escrita]
+
+    call_command("gerar_relatorio", out=str(tmp_path), usuario="vis_mgr", stdout=StringIO())
+    low_stock = json.loads(arquivo_publicado(tmp_path, "low_stock.json", dono=user).read_text(encoding="utf-8"))["low_stock"]
+    assert {p["nome"] for p in low_stock} == {"Vis0", "Vis1", "Vis2", "Vis3", "Vis5"}
+
+
+@pytest.mark.django_db
+def test_staff_nao_ganha_leitura_de_tabelas_privadas(client):
+    staff = User.objects.create_user(username="vis_staff", password="pwd", is_staff=True)
+    privada = TabelaProdutos.objects.create(nome="StaffPrivada")
+    produto = Produto.objects.create(nome="StaffOculto", preco="1.00")
+    produto.tabelas.add(privada)
+
+    assert not Produto.objects.visiveis_para(staff).exists()
+    client.force_login(staff)
+    assert "StaffOculto" not in client.get(reverse("inventario_v3:produtos_lista")).content.decode()
+    assert client.get(reverse("inventario_v3:produtos_descricao", kwargs={"pk": produto.pk})).status_code == 403
+    # staff mantém o atalho das views de escrita e a lista completa de tabelas
+    assert client.get(reverse("inventario_v3:produtos_editar", kwargs={"pk": produto.pk})).status_code == 200
+    assert privada in client.get(reverse("inventario_v3:tabelas_lista")).context["tabelas"]
+
+
+def _povoar(user, tabela, inicio, fim):
+    """Linhas [inicio, fim) de cada lista, em bulk (sem signals)."""
+    usuarios = User.objects.bulk_create(User(username=f"orc{i:04d}") for i in range(inicio, fim))
+    tabelas = TabelaProdutos.objects.bulk_create(TabelaProdutos(nome=f"OrcT{i:04d}") for i in range(inicio, fim))
+    Categoria.objects.bulk_create(Categoria(nome=f"OrcC{i:04d}") for i in range(inicio, fim))
+    produtos = Produto.objects.bulk_create(Produto(nome=f"OrcP{i:04d}", quantidade=i) for i in range(inicio, fim))
+    Produto.tabelas.through.objects.bulk_create(
+        Produto.tabelas.through(produto=p, tabelaprodutos=t)
+        for p, outra in zip(produtos, tabelas) for t in (tabela, outra)
+    )
+    AcessoTabela.objects.bulk_create(
+        AcessoTabela(usuario=u, tabela=t, nivel=AcessoTabela.Niveis.LEITURA) for u, t in zip(usuarios, tabelas)
+    )
+    detalhe = Produto.objects.get(nome="OrcP0000")
+    Movimento.objects.bulk_create(
+        Movimento(produto=detalhe, usuario=u, tipo_movimento=Movimento.MOV_ENT, quantidade=1) for u in usuarios
+    )
+    return detalhe
+
+
+@pytest.mark.django_db
+def test_listas_e_detalhes_com_consultas_constantes(client, settings, monkeypatch):
+    settings.ORCAMENTO_CONSULTAS_MODO = "erro"
+    user = User.objects.create_user(username="orc_user", password="pwd")
+    tabela = TabelaProdutos.objects.create(nome="OrcBase")
+    AcessoTabela.objects.create(usuario=user, tabela=tabela, nivel=AcessoTabela.Niveis.ADMINISTRADOR)
+    detalhe = _povoar(user, tabela, 0, 10)
+    client.force_login(user)
+    urls = [
+        reverse("inventario_v3:produtos_lista"),
+        reverse("inventario_v3:produtos_descricao", kwargs={"pk": detalhe.pk}),
+        reverse("inventario_v3:categorias_lista"),
+        reverse("inventario_v3:usuarios_lista"),
+        reverse("inventario_v3:tabelas_lista"),
+        reverse("inventario_v3:categorias_lista_json"),
+        reverse("inventario_v3:tabelas_lista_json"),
+        reverse("inventario_v3:gerenciar_acessos"),
+        reverse("inventario_v3:matriz_acessos"),
+        reverse("inventario_v3:autocomplete_usuarios") + "?q=orc",
+        reverse("inventario_v3:relatorios"),
+    ]
+
+    def consultas():
+        contagens = []
+        for url in urls:
+            with CaptureQueriesContext(connection) as ctx:
+                assert client.get(url).status_code == 200, url
+            contagens.append(len(ctx))
+        return contagens
+
+    poucas = consultas()
+    _povoar(user, tabela, 10, 1000)
+    assert consultas() == poucas
+
+    monkeypatch.setattr(ProdutosLista, "max_consultas", 2)
+    with pytest.raises(OrcamentoConsultasExcedido):
+        client.get(urls[0])
+    settings.ORCAMENTO_CONSULTAS_MODO = "log"
+    assert client.get(urls[0]).status_code == 200
+
+
+@pytest.mark.django_db
+def test_lista_de_produtos_paginada_por_cursor_e_ordenada(client):
+    user = User.objects.create_user(username="cursor_user", password="pwd")
+    tabela = TabelaProdutos.objects.create(nome="Cursor")
+    AcessoTabela.objects.create(usuario=user, tabela=tabela, nivel=AcessoTabela.Niveis.LEITURA)
+    ferragens = Categoria.objects.create(nome="Ferragens")
+    # preços repetidos: o desempate pelo id mantém as páginas sem buracos nem repetições
+    produtos = Produto.objects.bulk_create(
+        Produto(nome=f"Cur{i:02d}", quantidade=i, preco=Decimal(i % 7), categoria=ferragens) for i in range(60)
+    )
+    Produto.tabelas.through.objects.bulk_create(
+        Produto.tabelas.through(produto=p, tabelaprodutos=tabela) for p in produtos
+    )
+    Produto.objects.create(nome="Oculto", preco="1.00").tabelas.add(TabelaProdutos.objects.create(nome="Priv"))
+    client.force_login(user)
+    url = reverse("inventario_v3:produtos_lista")
+
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.get(url, {"ordem": "-preco"})
+    sql = " ".join(q["sql"] for q in ctx.captured_queries)
+    assert "OFFSET" not in sql and "COUNT(" not in sql
+    assert "Ferragens" in resp.content.decode()
+
+    esperado = sorted(produtos, key=lambda p: (-p.preco, -p.pk))
+    paginas = []
+    params = {"ordem": "-preco"}
+    while True:
+        page_obj = client.get(url, params).context["page_obj"]
+        paginas.append([p.pk for p in page_obj])
+        if not page_obj.has_next():
+            break
+        params = {"ordem": "-preco", "cursor": page_obj.cursor_proximo}
+    assert [len(p) for p in paginas] == [25, 25, 10]
+    assert sum(paginas, []) == [p.pk for p in esperado]
+
+    # voltando da última página chega-se às mesmas páginas
+    anterior = client.get(url, {"ordem": "-preco", "cursor": page_obj.cursor_anterior}).context["page_obj"]
+    assert [p.pk for p in anterior] == paginas[1]
+    primeira = client.get(url, {"ordem": "-preco", "cursor": anterior.cursor_anterior}).context["page_obj"]
+    assert [p.pk for p in primeira] == paginas[0] and not primeira.has_previous()
+
+    # cursor de outra ordenação ou inválido volta à primeira página
+    resp = client.get(url, {"ordem": "nome", "cursor": anterior.cursor_proximo})
+    assert [p.nome for p in resp.context["page_obj"]][:2] == ["Cur00", "Cur01"]
+    assert client.get(url, {"cursor": "não-é-cursor"}).status_code == 200
+    colunas = client.get(url, {"ordem": "nome"}).context["colunas_ordem"]
+    assert colunas["nome"]["query"] == "ordem=-nome" and colunas["preco"]["query"] == "ordem=preco"
+
+
+@pytest.mark.django_db
+def test_fragmento_da_lista_de_produtos_sem_layout(client):
+    user = User.objects.create_user(username="frag_v3", password="pwd")
+    tabela = TabelaProdutos.objects.create(nome="Frag")
+    AcessoTabela.objects.create(usuario=user, tabela=tabela, nivel=AcessoTabela.Niveis.LEITURA)
+    produtos = Produto.objects.bulk_create(Produto(nome=f"Frag{i:02d}", quantidade=1) for i in range(30))
+    Produto.tabelas.through.objects.bulk_create(
+        Produto.tabelas.through(produto=p, tabelaprodutos=tabela) for p in produtos
+    )
+    client.force_login(user)
+    url = reverse("inventario_v3:produtos_lista")
+
+    completa = client.get(url)
+    resp = client.get(url, HTTP_X_FRAGMENTO="1")
+    html = resp.content.decode()
+    assert "<table" in html and "<html" not in html and len(html) < len(completa.content)
+    assert "X-Fragmento" in resp["Vary"] and "X-Fragmento" in completa["Vary"]
+
+    # os links do cursor saem sem o parâmetro do fragmento e mantêm a ordenação
+    html = client.get(url, {"fragmento": "1", "ordem": "-nome"}).content.decode()
+    assert "Frag29" in html and "fragmento=" not in html and "?ordem=-nome&amp;cursor=" in html
+
+
+@pytest.mark.django_db
+def test_listas_de_categorias_e_tabelas_com_totais_numa_consulta(client, django_assert_num_queries):
+    user = User.objects.create_user(username="totais_user", password="pwd")
+    tabela = TabelaProdutos.objects.create(nome="Totais")
+    vazia = TabelaProdutos.objects.create(nome="Vazia", publico=True)
+    privada = TabelaProdutos.objects.create(nome="Privada")
+    AcessoTabela.objects.create(usuario=user, tabela=tabela, nivel=AcessoTabela.Niveis.LEITURA)
+    ferragens = Categoria.objects.create(nome="Ferragens")
+    Categoria.objects.create(nome="Sem produtos")
+    visiveis = [
+        Produto.objects.create(nome="Parafuso", quantidade=10, preco="1.50", categoria=ferragens),
+        Produto.objects.create(nome="Porca", quantidade=4, preco="0.25", categoria=ferragens),
+    ]
+    for p in visiveis:
+        p.tabelas.add(tabela)
+    # produto de tabela sem acesso não entra nos totais da categoria
+    Produto.objects.create(nome="Oculto", quantidade=100, preco="9.00", categoria=ferragens).tabelas.add(privada)
+    client.force_login(user)
+
+    resp = client.get(reverse("inventario_v3:categorias_lista"))
+    por_nome = {c.nome: c.totais for c in resp.context["categorias"]}
+    assert por_nome["Ferragens"] == {"produtos": 2, "unidades": 14, "valor": Decimal("16.00")}
+    assert por_nome["Sem produtos"]["produtos"] == 0
+    assert "R$ 16.00" in resp.content.decode()
+
+    dados = client.get(reverse("inventario_v3:tabelas_lista_json")).json()
+    assert [t["nome"] for t in dados["tabelas"]] == ["Totais", "Vazia"]
+    assert dados["tabelas"][0] == {
+        "id": tabela.pk, "nome": "Totais", "publico": False, "produtos": 2, "unidades": 14, "valor": "16.00",
+    }
+    assert dados["tabelas"][1]["produtos"] == 0 and dados["tem_proxima"] is False
+
+    # os totais custam uma consulta agrupada por página, com qualquer número de linhas
+    Categoria.objects.bulk_create(Categoria(nome=f"Cat{i:03d}") for i in range(120))
+    url = reverse("inventario_v3:categorias_lista_json")
+    with CaptureQueriesContext(connection) as ctx:
+        pagina = client.get(url).json()
+    agregadas = [q for q in ctx.captured_queries if "GROUP BY" in q["sql"]]
+    assert len(agregadas) == 1
+    assert len(pagina["categorias"]) == 50 and pagina["tem_proxima"] is True
+    assert client.get(url, {"page": 3}).json()["pagina"] == 3
+
+
+@pytest.mark.django_db
+def test_login_enfileira_um_relatorio_por_usuario(
+    client, monkeypatch, tmp_path, django_capture_on_commit_callbacks
+):
+    import inventario_v3.signals as sinais
+
+    pedidos = []
+    monkeypatch.setattr(sinais, "gerar_relatorio_do_usuario", pedidos.append)
+    tabela = TabelaProdutos.objects.create(nome="RelLogin")
+    usuarios = [User.objects.create_user(username=f"rel_login{i}", password="pwd") for i in range(2)]
+    for u in usuarios:
+        AcessoTabela.objects.create(usuario=u, tabela=tabela, nivel=AcessoTabela.Niveis.LEITURA)
+
+    # worker ocupado com outra tarefa: logins repetidos do mesmo usuário viram uma
+    # geração só; usuários com as mesmas tabelas ainda recebem cada um o seu
+    comecou, liberar = threading.Event(), threading.Event()
+    tarefas.relatorios.enfileirar("ocupando", lambda: (comecou.set(), liberar.wait(5)))
+    try:
+        assert comecou.wait(5)
+        for u in usuarios + usuarios[:1]:
+            with django_capture_on_commit_callbacks(execute=True):
+                assert client.login(username=u.username, password="pwd")
+        assert all(tarefas.relatorios.ocupada(sinais.chave_relatorio(u.pk)) for u in usuarios) and not pedidos
+    finally:
+        liberar.set()
+    assert tarefas.relatorios.aguardar(5)
+    assert pedidos == [u.pk for u in usuarios]
+
+    # o comando publica os arquivos de uma vez, sem deixar a pasta temporária
+    from inventario_v3.models import ArquivoRelatorio
+
+    call_command("gerar_relatorio", out=str(tmp_path), stdout=StringIO())
+    primeira = versao_publicada(tmp_path)
+    assert arquivo_publicado(tmp_path, "low_stock.json").is_file()
+    assert not list(tmp_path.glob(".gerando-*"))
+
+    # cada geração é uma subpasta nova; manifesto e atual.json trocam juntos e a
+    # versão anterior fica no disco para quem ainda a lê
+    call_command("gerar_relatorio", "--forcar", out=str(tmp_path), stdout=StringIO())
+    segunda = versao_publicada(tmp_path)
+    assert segunda["versao"] != primeira["versao"] and (tmp_path / primeira["versao"]).is_dir()
+    assert sorted(ArquivoRelatorio.objects.filter(pasta=str(tmp_path.resolve())).values_list("nome", flat=True)) == [
+        f"{segunda['versao']}/{nome}" for nome in segunda["arquivos"]
+    ]
+    call_command("gerar_relatorio", "--forcar", out=str(tmp_path), stdout=StringIO())
+    assert not (tmp_path / primeira["versao"]).exists() and (tmp_path / segunda["versao"]).is_dir()
+
+
+@pytest.mark.django_db
+def test_relatorio_em_dia_nao_consulta_produtos_nem_redesenha(tmp_path):
+    user = User.objects.create_user(username="rel_cache", password="pwd")
+    outro = User.objects.create_user(username="rel_cache_outro", password="pwd")
+    tabela = TabelaProdutos.objects.create(nome="RelCache")
+    AcessoTabela.objects.create(usuario=user, tabela=tabela, nivel=AcessoTabela.Niveis.LEITURA)
+    Produto.objects.create(nome="Cacheado", quantidade=2, preco="1.00").tabelas.add(tabela)
+
+    def gerar(*extras, usuario="rel_cache"):
+        saida = StringIO()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command("gerar_relatorio", *extras, out=str(tmp_path), usuario=usuario, stdout=saida)
+        return saida.getvalue(), " ".join(q["sql"] for q in ctx.captured_queries)
+
+    saida, _ = gerar()
+    assert "Wrote" in saida
+    modificado = arquivo_publicado(tmp_path, "low_stock.json", dono=user).stat().st_mtime_ns
+    saida, sql = gerar()
+    assert "up to date" in saida and "inventario_v3_produto" not in sql
+    assert arquivo_publicado(tmp_path, "low_stock.json", dono=user).stat().st_mtime_ns == modificado
+
+    # outro usuário gera o próprio relatório sem invalidar o do primeiro
+    assert "Wrote" in gerar(usuario="rel_cache_outro")[0]
+    assert "up to date" in gerar()[0]
+    # --forcar e escritas em produtos/movimentos geram de novo
+    assert "Wrote" in gerar("--forcar")[0]
+    Movimento.objects.create(
+        produto=Produto.objects.get(nome="Cacheado"), usuario=user, tipo_movimento=Movimento.MOV_ENT, quantidade=1
+    )
+    assert "Wrote" in gerar()[0]
+    assert "up to date" in gerar()[0]
+
+@pytest.mark.django_db
+def test_relatorio_agrega_no_banco_com_memoria_limitada(tmp_path):
+    from inventario_v3.relatorios import menor_estoque, totais_por_categoria
+
+    ferragens = Categoria.objects.create(nome="Ferragens")
+    Produto.objects.bulk_create(
+        [Produto(nome=f"Ferr{i:02d}", quantidade=i + 1, categoria=ferragens) for i in range(30)]
+        + [Produto(nome="Avulso", quantidade=0)]
+    )
+    assert totais_por_categoria(Produto.objects.all()) == [("Ferragens", 30, 465), ("Sem categoria", 1, 0)]
+    assert [p["nome"] for p in menor_estoque(Produto.objects.all(), 3)] == ["Avulso", "Ferr00", "Ferr01"]
+
+    with CaptureQueriesContext(connection) as ctx:
+        call_command("gerar_relatorio", "--top", "5", out=str(tmp_path), stdout=StringIO())
+    consultas = [q["sql"] for q in ctx.captured_queries if '"inventario_v3_produto"' in q["sql"]]
+    assert len(consultas) == 2
+    assert "GROUP BY" in consultas[0] and "LIMIT 5" in consultas[1]
+    baixos = json.loads(arquivo_publicado(tmp_path, "low_stock.json").read_text(encoding="utf-8"))["low_stock"]
+    assert [p["nome"] for p in baixos] == ["Avulso", "Ferr00", "Ferr01", "Ferr02", "Ferr03"]
+
+
+@pytest.mark.django_db
+def test_relatorio_em_svg_e_png_sob_demanda(settings, tmp_path):
+    settings.RELATORIOS_PROCESSOS_GRAFICOS = 0
+    Produto.objects.create(nome="Vetorial", quantidade=3)
+
+    call_command("gerar_relatorio", out=str(tmp_path), stdout=StringIO())
+    publicada = tmp_path / versao_publicada(tmp_path)["versao"]
+    assert sorted(p.name for p in publicada.glob("*.svg")) == [
+        "estoque_por_categoria.svg", "low_stock_top.svg", "produtos_por_categoria.svg"
+    ]
+    assert not list(publicada.glob("*.png"))
+    assert "Vetorial" in (publicada / "low_stock_top.svg").read_text(encoding="utf-8")
+
+    # mudar de formato não reaproveita o relatório e troca os gráficos publicados
+    saida = StringIO()
+    call_command("gerar_relatorio", "--format", "png", out=str(tmp_path), stdout=saida)
+    assert "Wrote" in saida.getvalue()
+    publicada = tmp_path / versao_publicada(tmp_path)["versao"]
+    assert len(list(publicada.glob("*.png"))) == 3 and not list(publicada.glob("*.svg"))
+
+
+@pytest.mark.django_db
+def test_pagina_de_relatorios_lista_o_manifesto_sem_ler_a_pasta(
+    client, settings, monkeypatch, tmp_path, django_assert_num_queries
+):
+    from pathlib import Path
+
+    from inventario_v3.models import ArquivoRelatorio
+
+    settings.BASE_DIR = tmp_path
+    settings.RELATORIOS_PROCESSOS_GRAFICOS = 0
+    dono = User.objects.create_user(username="rel_manifesto", password="pwd")
+    outro = User.objects.create_user(username="rel_manifesto_outro", password="pwd")
+    tabela = TabelaProdutos.objects.create(nome="Manifesto")
+    AcessoTabela.objects.create(usuario=dono, tabela=tabela, nivel=AcessoTabela.Niveis.LEITURA)
+    Produto.objects.create(nome="Indexado", quantidade=1).tabelas.add(tabela)
+
+    call_command("gerar_relatorio", usuario="rel_manifesto", stdout=StringIO())
+    pasta = tmp_path / "resultados" / "reports"
+    arquivos = ArquivoRelatorio.objects.filter(pasta=str(pasta.resolve()))
+    versao = f"report_user{dono.pk}/" + versao_publicada(pasta, dono)["versao"]
+    assert sorted(a.nome for a in arquivos) == sorted(f"{versao}/{p.name}" for p in (pasta / versao).iterdir())
+    json_baixo = arquivos.get(nome=f"{versao}/low_stock.json")
+    assert json_baixo.dono == dono and json_baixo.escopo == str(tabela.pk) and not json_baixo.compartilhado
+    assert json_baixo.tamanho == arquivo_publicado(pasta, "low_stock.json", dono).stat().st_size
+
+    # a página só consulta o manifesto: nada de listar a pasta nem stat() por arquivo
+    monkeypatch.setattr(Path, "iterdir", lambda self: pytest.fail("a página leu a pasta"))
+    client.force_login(dono)
+    with django_assert_num_queries(4):
+        resposta = client.get(reverse("inventario_v3:relatorios"))
+    assert "low_stock.json" in resposta.content.decode()
+    client.force_login(outro)
+    assert "low_stock.json" not in client.get(reverse("inventario_v3:relatorios")).content.decode()
+    monkeypatch.undo()
+
+    # arquivos antigos entram pelo indexar_relatorios; os que sumiram saem
+    (pasta / f"report_user{outro.pk}_antigo.json").write_text("{}", encoding="utf-8")
+    (pasta / "report_geral.html").write_text("<html></html>", encoding="utf-8")
+    arquivo_publicado(pasta, "low_stock.json", dono).unlink()
+    call_command("indexar_relatorios", stdout=StringIO())
+    assert not arquivos.filter(nome=f"{versao}/low_stock.json").exists()
+    assert arquivos.get(nome=f"{versao}/low_stock_top.svg").dono == dono
+    assert arquivos.get(nome=f"report_user{outro.pk}_antigo.json").dono == outro
+    visiveis = client.get(reverse("inventario_v3:relatorios")).content.decode()
+    assert "report_geral.html" in visiveis and "antigo.json" in visiveis and "low_stock_top" not in visiveis
+
+    # o relatório de outro usuário não tira o do primeiro da página; o geral é de todos
+    call_command("gerar_relatorio", usuario="rel_manifesto_outro", stdout=StringIO())
+    assert arquivos.filter(dono=dono, nome__startswith=f"{versao}/").count() == 5
+    assert arquivos.filter(dono=outro, nome__startswith=f"report_user{outro.pk}/").exists()
+    call_command("gerar_relatorio", stdout=StringIO())
+    geral = versao_publicada(pasta)["versao"]
+    assert arquivos.filter(nome__startswith=f"{geral}/", dono=None, compartilhado=True).count() == 6
+    assert arquivos.filter(dono=dono, nome__startswith=f"{versao}/").count() == 5
+
+    def pagina(usuario):
+        client.force_login(usuario)
+        return client.get(reverse("inventario_v3:relatorios")).content.decode()
+
+    do_dono, do_outro = pagina(dono), pagina(outro)
+    assert f"{geral}/low_stock_top.svg" in do_dono and f"{geral}/low_stock_top.svg" in do_outro
+    assert f"{versao}/low_stock_top.svg" in do_dono and f"{versao}/" not in do_outro
+    assert f"report_user{outro.pk}/" in do_outro and f"report_user{outro.pk}/" not in do_dono
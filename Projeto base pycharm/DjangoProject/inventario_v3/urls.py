@@ -48,6 +48,7 @@ urlpatterns = [
 
     # Categorias (staff)
     path("categorias/", views.CategoriasLista.as_view(), name="categorias_lista"),
+    path("categorias/json/", views.CategoriasListaJson.as_view(), name="categorias_lista_json"),
     path("categorias/adicionar/", views.CategoriasAdicionar.as_view(), name="categorias_adicionar"),
     path("categorias/<int:pk>/editar/", views.CategoriasEditar.as_view(), name="categorias_editar"),
     path("categorias/<int:pk>/remover/", views.CategoriasRemover.as_view(), name="categorias_remover"),
@@ -67,9 +68,14 @@ urlpatterns = [
 
     # Product/Table access (staff view)
     path("gerenciar-acessos/", views.GerenciarAcessos.as_view(), name="gerenciar_acessos"),
+    path("gerenciar-acessos/matriz/", views.MatrizAcessos.as_view(), name="matriz_acessos"),
+    path("gerenciar-acessos/lote/", views.AcessosEmLote.as_view(), name="acessos_em_lote"),
+    path("gerenciar-acessos/autocomplete/usuarios/", views.AutocompleteUsuarios.as_view(), name="autocomplete_usuarios"),
+    path("gerenciar-acessos/autocomplete/tabelas/", views.AutocompleteTabelas.as_view(), name="autocomplete_tabelas"),
 
     # Tabelas de produtos (CRUD + seleção)
     path("tabelas/", views.TabelasLista.as_view(), name="tabelas_lista"),
+    path("tabelas/json/", views.TabelasListaJson.as_view(), name="tabelas_lista_json"),
     path("tabelas/adicionar/", views.TabelasAdicionar.as_view(), name="tabelas_adicionar"),
     path("tabelas/<int:pk>/editar/", views.TabelasEditar.as_view(), name="tabelas_editar"),
     path("tabelas/<int:pk>/remover/", views.TabelasRemover.as_view(), name="tabelas_remover"),
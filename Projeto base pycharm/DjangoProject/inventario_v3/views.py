@@ -8,22 +8,33 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth import get_user_model, authenticate, login
 from django.conf import settings
 from django.shortcuts import get_object_or_404, redirect
-from django.http import HttpResponseForbidden
-from django.db.models import Q
-from django.utils import timezone
+from django.http import HttpResponseForbidden, JsonResponse
+from django.core.paginator import Paginator
+from django.db.models import Prefetch
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.core.management import call_command
 from django.contrib import messages
-from datetime import datetime, timezone as dt_timezone
-from pathlib import Path
+from decimal import Decimal
+import json
 import logging, re
 
+from inventario_comum.fragmentos import FragmentoMixin
+from inventario_comum.paginacao import query_sem_pagina
+
 from .models import (
     Produto, Categoria, Movimento,
-    PerfilUsuario, TabelaProdutos, AcessoTabela
+    PerfilUsuario, TabelaProdutos, AcessoTabela, AcessoGrupoTabela, PermissaoEfetiva, ArquivoRelatorio
+)
+from .contexto import contexto_do_request
+from .paginacao import PaginadorCursor
+from .relatorios import pasta_relatorios
+from .permissoes import (
+    permissoes_do_request, anotar_capacidades,
+    aplicar_acessos_em_lote,
 )
 from .forms import (
     ProdutoForm, MovimentoForm, CategoriaForm,
-    TabelaProdutosForm, AcessoTabelaForm,
+    TabelaProdutosForm, AcessoTabelaForm, AcessoGrupoTabelaForm,
     UserCreateForm, UserUpdateForm
 )
 
@@ -32,32 +43,21 @@ Usuario = get_user_model()
 
 
 # ----- helper permission utilities (table-level) -----
-def user_has_table_level(user, tabela, required_level="leitura"):
+def user_has_table_level(user, tabela, required_level="leitura", request=None):
     """
     Return True if `user` has at least `required_level` for tabela.
     Levels order: nenhum < leitura < escrita < administrador
+
+    Consulta o MapaPermissoes do request (uma consulta por request); sem request
+    o mapa é carregado avulso para esta chamada.
     """
     if not user or not user.is_authenticated:
         return False
-    if getattr(user, "is_superuser", False):
-        return True
-
-    profile = getattr(user, "perfil", None)
-    # allow custom profile helper if present
-    if profile and getattr(profile, "is_admin", lambda: False)():
-        return True
-
-    acc = AcessoTabela.objects.filter(usuario=user, tabela=tabela).first()
-    if acc:
-        order = {"nenhum": 0, "leitura": 1, "escrita": 2, "administrador": 3}
-        return order.get(acc.nivel, 0) >= order.get(required_level, 0)
-    # fallback: public tabelas allow leitura
-    if getattr(tabela, "publico", False) and required_level == "leitura":
-        return True
-    return False
+    mapa = permissoes_do_request(request, user)
+    return mapa.tem_nivel(getattr(tabela, "pk", tabela), required_level)
 
 
-def product_has_table_with_access(product, user, required_level="leitura"):
+def product_has_table_with_access(product, user, required_level="leitura", request=None):
     """
     For a product that may belong to multiple tabelas, return True if the user
     has the required_level on any tabela the product belongs to.
@@ -65,30 +65,76 @@ def product_has_table_with_access(product, user, required_level="leitura"):
     Adaptation: consider products that have NO tabelas attached as 'public'
     for access checks (so tests that create products without tabelas can view/move them).
     """
+    tabela_ids = _tabela_ids_do_produto(product)
     # If product has no tabelas, treat it as accessible (public)
-    if product.tabelas.count() == 0:
+    if not tabela_ids:
         return True
+    if not user or not user.is_authenticated:
+        return False
+    return permissoes_do_request(request, user).algum_com_nivel(tabela_ids, required_level)
 
-    for t in product.tabelas.all():
-        if user_has_table_level(user, t, required_level):
-            return True
-    return False
+
+def _tabela_ids_do_produto(product):
+    # reaproveita prefetch_related('tabelas') quando disponível; senão, uma consulta só de ids
+    cache = getattr(product, "_prefetched_objects_cache", {})
+    if "tabelas" in cache:
+        return [t.pk for t in cache["tabelas"]]
+    return list(product.tabelas.values_list("pk", flat=True))
 
 
 # ----- Products views (respecting tabela active / permissions) -----
-class ProdutosLista(LoginRequiredMixin, ListView):
+class ProdutosLista(LoginRequiredMixin, FragmentoMixin, ListView):
     login_url = reverse_lazy("inventario_v3:login")
     model = Produto
     template_name = 'inventario_v3/produtos_lista.html'
+    fragmento_template_name = "inventario_v3/_produtos_lista_fragmento.html"
     context_object_name = 'produtos'
+    paginate_by = 25
+    # ?ordem=campo ou -campo; cada um tem índice (campo, id) em Produto.Meta
+    ordenacoes = ("nome", "quantidade", "preco", "criado_em")
+    max_consultas = 8
+
+    def get_ordem(self):
+        """(campo, descendente) a partir de ?ordem=; padrão: nome crescente."""
+        ordem = self.request.GET.get("ordem", "")
+        campo = ordem.lstrip("-")
+        if campo not in self.ordenacoes:
+            return "nome", False
+        return campo, ordem.startswith("-")
 
     def get_queryset(self):
-        qs = super().get_queryset()
-        perfil = getattr(self.request.user, "perfil", None)
-        tabela = getattr(perfil, "current_tabela", None) if perfil else None
-        if tabela:
-            return qs.filter(tabelas=tabela).distinct()
-        return qs.filter(Q(tabelas__isnull=True) | Q(tabelas__publico=True)).distinct()
+        qs = Produto.objects.visiveis_para(self.request.user)
+        tabela = contexto_do_request(self.request).current_tabela
+        if tabela is not None:
+            qs = qs.na_tabela(tabela)
+        # can_read/can_write/can_admin por linha, calculados na mesma consulta;
+        # as tabelas de todas as linhas da página vêm de uma consulta só
+        return anotar_capacidades(qs, self.request.user).select_related("categoria").prefetch_related("tabelas")
+
+    def paginate_queryset(self, queryset, page_size):
+        # keyset (?cursor=) em vez de ?page=: sem OFFSET nem COUNT, a primeira página
+        # de uma tabela com 200 mil produtos custa o mesmo que a de uma com 20
+        campo, descendente = self.get_ordem()
+        paginador = PaginadorCursor(queryset, campo, page_size, descendente=descendente)
+        pagina = paginador.pagina(self.request.GET.get("cursor"))
+        return paginador, pagina, pagina.object_list, pagina.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        campo_atual, descendente = self.get_ordem()
+        # links montados aqui: o fragmento é renderizado sem request
+        ctx["query_sem_cursor"] = query_sem_pagina(self.request.GET, "cursor")
+        params = self.request.GET.copy()
+        params.pop("cursor", None)
+        params.pop("fragmento", None)
+        colunas = {}
+        for campo in self.ordenacoes:
+            ativa = campo == campo_atual
+            # clicar na coluna ativa inverte a direção; mudar a ordenação volta à primeira página
+            params["ordem"] = f"-{campo}" if ativa and not descendente else campo
+            colunas[campo] = {"query": params.urlencode(), "ativa": ativa, "descendente": ativa and descendente}
+        ctx["colunas_ordem"] = colunas
+        return ctx
 
 
 class ProdutosDescricao(LoginRequiredMixin, DetailView):
@@ -96,13 +142,20 @@ class ProdutosDescricao(LoginRequiredMixin, DetailView):
     model = Produto
     template_name = 'inventario_v3/produtos_descricao.html'
     context_object_name = 'produto'
+    max_consultas = 10
 
     def dispatch(self, request, *args, **kwargs):
-        produto = self.get_object()
-        if not product_has_table_with_access(produto, request.user, "leitura"):
+        produto = get_object_or_404(Produto.objects.only("pk"), pk=kwargs.get("pk"))
+        if not Produto.objects.visiveis_para(request.user).filter(pk=produto.pk).exists():
             return HttpResponseForbidden("Você não tem permissão para ver este produto.")
         return super().dispatch(request, *args, **kwargs)
 
+    def get_queryset(self):
+        # tabelas e movimentos (com o usuário de cada um) em uma consulta cada
+        return Produto.objects.prefetch_related(
+            "tabelas", Prefetch("movimentos", queryset=Movimento.objects.select_related("usuario"))
+        )
+
 
 class ProdutosAdicionar(LoginRequiredMixin, CreateView):
     login_url = reverse_lazy("inventario_v3:login")
@@ -112,18 +165,18 @@ class ProdutosAdicionar(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy('inventario_v3:produtos_lista')
 
     def form_valid(self, form):
-        perfil = getattr(self.request.user, "perfil", None)
+        tabela_ativa = contexto_do_request(self.request).current_tabela
         selected_tabelas = form.cleaned_data.get("tabelas")
         tabela_ok = False
 
         if selected_tabelas:
             for t in selected_tabelas:
-                if user_has_table_level(self.request.user, t, "escrita"):
+                if user_has_table_level(self.request.user, t, "escrita", request=self.request):
                     tabela_ok = True
                     break
         else:
-            tabela = getattr(perfil, "current_tabela", None) if perfil else None
-            if tabela and user_has_table_level(self.request.user, tabela, "escrita"):
+            tabela = tabela_ativa
+            if tabela and user_has_table_level(self.request.user, tabela, "escrita", request=self.request):
                 tabela_ok = True
 
         if not tabela_ok and not self.request.user.is_staff and not self.request.user.is_superuser:
@@ -131,9 +184,8 @@ class ProdutosAdicionar(LoginRequiredMixin, CreateView):
 
         resp = super().form_valid(form)
         if not selected_tabelas:
-            tabela = getattr(perfil, "current_tabela", None) if perfil else None
-            if tabela:
-                self.object.tabelas.add(tabela)
+            if tabela_ativa:
+                self.object.tabelas.add(tabela_ativa)
         logger.info("Criado produto: %s", form.cleaned_data.get('nome'))
         return resp
 
@@ -147,7 +199,9 @@ class ProdutosEditar(LoginRequiredMixin, UpdateView):
 
     def dispatch(self, request, *args, **kwargs):
         produto = self.get_object()
-        if not product_has_table_with_access(produto, request.user, "administrador") and not request.user.is_staff and not request.user.is_superuser:
+        if not request.user.is_staff and not Produto.objects.visiveis_para(
+            request.user, "administrador"
+        ).filter(pk=produto.pk).exists():
             return HttpResponseForbidden("Você não tem permissão para editar este produto.")
         return super().dispatch(request, *args, **kwargs)
 
@@ -160,7 +214,9 @@ class ProdutosRemover(LoginRequiredMixin, DeleteView):
 
     def dispatch(self, request, *args, **kwargs):
         produto = self.get_object()
-        if not product_has_table_with_access(produto, request.user, "administrador") and not request.user.is_staff and not request.user.is_superuser:
+        if not request.user.is_staff and not Produto.objects.visiveis_para(
+            request.user, "administrador"
+        ).filter(pk=produto.pk).exists():
             return HttpResponseForbidden("Você não tem permissão para remover este produto.")
         return super().dispatch(request, *args, **kwargs)
 
@@ -176,7 +232,9 @@ class NovoMovimento(LoginRequiredMixin, FormView):
         if not request.user.is_authenticated:
             return self.handle_no_permission()
         self.produto = get_object_or_404(Produto, pk=kwargs.get('pk'))
-        if not product_has_table_with_access(self.produto, request.user, "escrita") and not request.user.is_staff and not request.user.is_superuser:
+        if not request.user.is_staff and not Produto.objects.visiveis_para(
+            request.user, "escrita"
+        ).filter(pk=self.produto.pk).exists():
             return HttpResponseForbidden("Você não tem permissão para registrar movimentos neste produto.")
         return super().dispatch(request, *args, **kwargs)
 
@@ -204,12 +262,67 @@ class NovoMovimento(LoginRequiredMixin, FormView):
         return redirect('inventario_v3:produtos_descricao', pk=self.produto.pk)
 
 
+# ----- listas com totais de produtos (categorias e tabelas) -----
+class TotaisProdutosMixin:
+    """
+    Colunas de resumo para uma lista paginada: cada objeto da página ganha
+    `totais` = {"produtos", "unidades", "valor"} (valor = Sum(quantidade * preco))
+    vindos de uma consulta agrupada só para a página inteira, em vez de um
+    agregado por linha. O custo depende do tamanho da página, não do catálogo.
+    `campo_totais` é o campo de Produto que aponta para os objetos da lista; só
+    os produtos que o usuário pode ver entram nos totais.
+    """
+    paginate_by = 50
+    campos_json = ("nome",)
+    campo_totais = "categoria"
+
+    def get_totais(self, pks):
+        """{pk do objeto: totais} dos objetos `pks`, via ProdutoQuerySet.totais_por."""
+        campo = self.campo_totais
+        produtos = Produto.objects.visiveis_para(self.request.user).filter(**{f"{campo}__in": pks})
+        return produtos.totais_por(campo)
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        objetos = ctx["object_list"]
+        totais = self.get_totais([obj.pk for obj in objetos])
+        for obj in objetos:
+            obj.totais = totais.get(obj.pk) or {"produtos": 0, "unidades": 0, "valor": Decimal("0.00")}
+        return ctx
+
+    def resposta_json(self, context):
+        """Variante JSON da lista: mesmas linhas, paginação e totais."""
+        pagina = context["page_obj"]
+        linhas = [
+            {
+                "id": obj.pk,
+                **{campo: getattr(obj, campo) for campo in self.campos_json},
+                "produtos": obj.totais["produtos"],
+                "unidades": obj.totais["unidades"] or 0,
+                "valor": str(obj.totais["valor"]),
+            }
+            for obj in context["object_list"]
+        ]
+        return JsonResponse({
+            self.context_object_name: linhas,
+            "pagina": pagina.number if pagina else 1,
+            "tem_proxima": bool(pagina and pagina.has_next()),
+        })
+
+
 # ----- Category views (login required only) -----
-class CategoriasLista(LoginRequiredMixin, ListView):
+class CategoriasLista(LoginRequiredMixin, TotaisProdutosMixin, ListView):
     login_url = reverse_lazy("inventario_v3:login")
     model = Categoria
     template_name = "inventario_v3/categorias_lista.html"
     context_object_name = "categorias"
+    ordering = ["nome", "pk"]
+    max_consultas = 7
+
+
+class CategoriasListaJson(CategoriasLista):
+    def render_to_response(self, context, **response_kwargs):
+        return self.resposta_json(context)
 
 
 class CategoriasAdicionar(LoginRequiredMixin, CreateView):
@@ -236,70 +349,38 @@ class CategoriasRemover(LoginRequiredMixin, DeleteView):
 
 
 # ----- Report view (login required only) -----
-class Relatorios(LoginRequiredMixin, TemplateView):
+class Relatorios(LoginRequiredMixin, ListView):
+    """Arquivos publicados por gerar_relatorio, do manifesto (ArquivoRelatorio): sem ler a pasta."""
     login_url = reverse_lazy("inventario_v3:login")
     template_name = "inventario_v3/relatorios.html"
+    context_object_name = "reports"
+    paginate_by = 50
+    # só o GET: o POST gera o relatório na hora
+    max_consultas = {"GET": 5}
 
-    def get_context_data(self, **kwargs):
-        ctx = super().get_context_data(**kwargs)
-        out = Path("resultados/reports")
-        ctx["reports"] = []
-        if out.exists():
-            user = self.request.user
-            user_pk = getattr(user, "pk", None)
-
-            for p in sorted(out.iterdir()):
-                if not p.is_file():
-                    continue
-                # aceitar html, png, json
-                if p.suffix.lower() not in (".html", ".png", ".jpg", ".jpeg", ".json"):
-                    continue
-                name = p.name
-
-                # staff/superuser vê todos os arquivos permitidos
-                if getattr(user, "is_staff", False) or getattr(user, "is_superuser", False):
-                    show = True
-                else:
-                    show = False
-                    if user_pk is not None and name.startswith(f"report_user{user_pk}_"):
-                        show = True
-                    if name.startswith("report_") and not name.startswith("report_user"):
-                        show = True
-
-                if not show:
-                    continue
-
-                mtime = datetime.fromtimestamp(p.stat().st_mtime, tz=dt_timezone.utc)
-                mtime_local = timezone.localtime(mtime)
-                ctx["reports"].append({
-                    "name": p.name,
-                    "url": f"/resultados/reports/{p.name}",
-                    "generated_at": mtime_local,
-                })
-        return ctx
+    def get_queryset(self):
+        return (
+            ArquivoRelatorio.objects.visiveis_para(self.request.user)
+            .filter(pasta=str(pasta_relatorios()))
+            .order_by("-gerado_em", "nome")
+            .only("nome", "tamanho", "gerado_em")
+        )
 
     def post(self, request, *args, **kwargs):
         """
         Gera relatório imediato para o usuário atual (mesma lógica do signal).
         """
         user = request.user
-        if getattr(user, "is_superuser", False) or getattr(user, "is_staff", False):
-            pks = list(TabelaProdutos.objects.values_list("pk", flat=True))
-        else:
-            public_pks = list(TabelaProdutos.objects.filter(publico=True).values_list("pk", flat=True))
-            acesso_pks = list(AcessoTabela.objects.filter(usuario=user).values_list("tabela__pk", flat=True))
-            pks = list({*public_pks, *acesso_pks})
-
-        if not pks:
+        if not TabelaProdutos.objects.visiveis_para(user).exists():
             messages.warning(request, "Nenhuma tabela acessível encontrada — relatório não foi gerado.")
             return redirect(reverse_lazy("inventario_v3:relatorios"))
 
-        out_dir = Path(settings.BASE_DIR) / "resultados" / "reports"
+        out_dir = pasta_relatorios()
         out_dir.mkdir(parents=True, exist_ok=True)
 
         try:
-            # call without unsupported custom options
-            call_command("gerar_relatorio", out=str(out_dir))
+            # agrega apenas os produtos visíveis para o usuário
+            call_command("gerar_relatorio", out=str(out_dir), usuario=str(user.pk))
             messages.success(request, "Relatório gerado com sucesso.")
         except Exception as e:
             messages.error(request, f"Falha ao gerar relatório: {e}")
@@ -312,6 +393,15 @@ class UsuariosLista(LoginRequiredMixin, ListView):
     model = Usuario
     template_name = "inventario_v3/usuarios_lista.html"
     context_object_name = "users"
+    paginate_by = 50
+    max_consultas = 6
+
+    def get_queryset(self):
+        qs = Usuario.objects.order_by("username")
+        q = self.request.GET.get("q", "").strip()
+        if q:
+            qs = qs.filter(username__icontains=q)
+        return qs
 
 
 class UsuariosAdicionar(LoginRequiredMixin, CreateView):
@@ -346,44 +436,260 @@ class UsuariosRemover(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy("inventario_v3:usuarios_lista")
 
 
-class GerenciarAcessos(LoginRequiredMixin, TemplateView):
+class GerenciarAcessos(LoginRequiredMixin, ListView):
     """
-    Gerencia AcessoTabela entries (user <-> tabela).
+    Gerencia AcessoTabela entries (user <-> tabela) e concessões por grupo
+    (AcessoGrupoTabela: todos os membros do grupo recebem o nível).
     Agora acessível para qualquer usuário autenticado.
+
+    A lista é paginada e filtrável (?usuario=, ?tabela=); os campos de usuário e
+    tabela usam autocomplete em vez de listar todos os registros. As concessões por
+    grupo têm paginação própria (?gpage=) e são filtradas por ?grupo= e ?tabela=.
     """
     login_url = reverse_lazy("inventario_v3:login")
     template_name = "inventario_v3/gerenciar_acessos.html"
+    context_object_name = "accesses"
+    paginate_by = 50
+    grupos_por_pagina = 50
+    max_consultas = 16
+
+    def get_queryset(self):
+        qs = AcessoTabela.objects.select_related("usuario", "tabela").order_by("usuario__username", "tabela__nome")
+        q_usuario = self.request.GET.get("usuario", "").strip()
+        q_tabela = self.request.GET.get("tabela", "").strip()
+        if q_usuario:
+            qs = qs.filter(usuario__username__icontains=q_usuario)
+        if q_tabela:
+            qs = qs.filter(tabela__nome__icontains=q_tabela)
+        return qs
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx["accesses"] = AcessoTabela.objects.select_related("usuario", "tabela").all()
-        ctx["form"] = AcessoTabelaForm()
+        q_grupo = self.request.GET.get("grupo", "").strip()
+        q_tabela = self.request.GET.get("tabela", "").strip()
+        grupos = AcessoGrupoTabela.objects.select_related("grupo", "tabela").order_by("grupo__name", "tabela__nome")
+        if q_grupo:
+            grupos = grupos.filter(grupo__name__icontains=q_grupo)
+        if q_tabela:
+            grupos = grupos.filter(tabela__nome__icontains=q_tabela)
+        pagina_grupos = Paginator(grupos, self.grupos_por_pagina).get_page(self.request.GET.get("gpage"))
+        ctx["group_accesses"] = pagina_grupos.object_list
+        ctx["pagina_grupos"] = pagina_grupos
+        ctx["filtro_grupo"] = q_grupo
+        ctx.setdefault("form", AcessoTabelaForm())
+        ctx.setdefault("group_form", AcessoGrupoTabelaForm())
+        ctx["filtro_usuario"] = self.request.GET.get("usuario", "")
+        ctx["filtro_tabela"] = self.request.GET.get("tabela", "")
         return ctx
 
     def post(self, request, *args, **kwargs):
-        form = AcessoTabelaForm(request.POST)
-        if form.is_valid():
-            form.save()
-            return redirect("inventario_v3:gerenciar_acessos")
-        ctx = self.get_context_data(**kwargs)
-        ctx["form"] = form
-        return self.render_to_response(ctx)
+        if request.POST.get("tipo") == "grupo":
+            form = AcessoGrupoTabelaForm(request.POST)
+            if form.is_valid():
+                form.save()
+                return redirect("inventario_v3:gerenciar_acessos")
+            chave = "group_form"
+        else:
+            form = AcessoTabelaForm(request.POST)
+            if form.is_valid():
+                dados = form.cleaned_data
+                aplicar_acessos_em_lote(concessoes=[(dados["usuario"].pk, dados["tabela"].pk, dados["nivel"])])
+                return redirect("inventario_v3:gerenciar_acessos")
+            chave = "form"
+        self.object_list = self.get_queryset()
+        return self.render_to_response(self.get_context_data(**{chave: form}))
+
+
+LIMITE_AUTOCOMPLETE = 20
+
+
+class AutocompleteUsuarios(LoginRequiredMixin, View):
+    """GET ?q= -> até 20 usuários {id, texto} cujo username contém q."""
+    login_url = reverse_lazy("inventario_v3:login")
+    max_consultas = 5
+
+    def get(self, request):
+        q = request.GET.get("q", "").strip()
+        qs = Usuario.objects.order_by("username")
+        if q:
+            qs = qs.filter(username__icontains=q)
+        resultados = [{"id": pk, "texto": nome} for pk, nome in qs.values_list("pk", "username")[:LIMITE_AUTOCOMPLETE]]
+        return JsonResponse({"resultados": resultados})
+
+
+class AutocompleteTabelas(LoginRequiredMixin, View):
+    """GET ?q= -> até 20 tabelas {id, texto} cujo nome contém q."""
+    login_url = reverse_lazy("inventario_v3:login")
+    max_consultas = 5
+
+    def get(self, request):
+        q = request.GET.get("q", "").strip()
+        qs = TabelaProdutos.objects.order_by("nome")
+        if q:
+            qs = qs.filter(nome__icontains=q)
+        resultados = [{"id": pk, "texto": nome} for pk, nome in qs.values_list("pk", "nome")[:LIMITE_AUTOCOMPLETE]]
+        return JsonResponse({"resultados": resultados})
+
+
+class MatrizAcessos(LoginRequiredMixin, TemplateView):
+    """
+    Matriz usuários x tabelas com o nível efetivo (PermissaoEfetiva) de cada par.
+
+    Linhas e colunas são paginadas separadamente (?page= para usuários, ?tpage=
+    para tabelas) e filtráveis (?usuario=, ?tabela=); as células da página vêm de
+    uma única consulta. O formulário da página envia para AcessosEmLote.
+    """
+    login_url = reverse_lazy("inventario_v3:login")
+    template_name = "inventario_v3/matriz_acessos.html"
+    max_consultas = 10
+    usuarios_por_pagina = 50
+    tabelas_por_pagina = 20
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        q_usuario = self.request.GET.get("usuario", "").strip()
+        q_tabela = self.request.GET.get("tabela", "").strip()
+        usuarios = Usuario.objects.order_by("username").only("pk", "username")
+        tabelas = TabelaProdutos.objects.order_by("nome").only("pk", "nome", "publico")
+        if q_usuario:
+            usuarios = usuarios.filter(username__icontains=q_usuario)
+        if q_tabela:
+            tabelas = tabelas.filter(nome__icontains=q_tabela)
+
+        pagina_usuarios = Paginator(usuarios, self.usuarios_por_pagina).get_page(self.request.GET.get("page"))
+        pagina_tabelas = Paginator(tabelas, self.tabelas_por_pagina).get_page(self.request.GET.get("tpage"))
+        usuarios_pagina = list(pagina_usuarios)
+        tabelas_pagina = list(pagina_tabelas)
+
+        niveis = {
+            (usuario_id, tabela_id): nivel
+            for usuario_id, tabela_id, nivel in PermissaoEfetiva.objects.filter(
+                usuario__in=usuarios_pagina, tabela__in=tabelas_pagina
+            ).values_list("usuario_id", "tabela_id", "nivel")
+        }
+        ctx["linhas"] = [
+            {"usuario": u, "celulas": [niveis.get((u.pk, t.pk), "") for t in tabelas_pagina]}
+            for u in usuarios_pagina
+        ]
+        ctx.update(
+            tabelas=tabelas_pagina,
+            page_obj=pagina_usuarios,
+            pagina_tabelas=pagina_tabelas,
+            niveis=AcessoTabela.Niveis.CHOICES,
+            filtro_usuario=q_usuario,
+            filtro_tabela=q_tabela,
+        )
+        return ctx
+
+
+class AcessosEmLote(LoginRequiredMixin, View):
+    """
+    Concede/revoga muitos acessos numa transação (permissoes.aplicar_acessos_em_lote).
+
+    - JSON: {"conceder": [{"usuario": id, "tabela": id, "nivel": "..."}],
+             "revogar": [{"usuario": id, "tabela": id}]} -> JSON com os totais;
+    - formulário da matriz: usuarios=<ids>, tabelas=<ids>, nivel, acao=conceder|revogar
+      (produto cartesiano) -> redirect para a matriz.
+
+    Exige staff/superuser ou nível administrador em todas as tabelas envolvidas.
+    """
+    login_url = reverse_lazy("inventario_v3:login")
+    limite_operacoes = 5000
+
+    def post(self, request):
+        json_request = request.content_type == "application/json"
+        try:
+            concessoes, revogacoes = (
+                self._operacoes_json(request) if json_request else self._operacoes_formulario(request)
+            )
+            self._validar(request, concessoes, revogacoes)
+        except ValueError as e:
+            if json_request:
+                return JsonResponse({"erro": str(e)}, status=400)
+            messages.error(request, str(e))
+            return redirect("inventario_v3:matriz_acessos")
+        except PermissionError as e:
+            if json_request:
+                return JsonResponse({"erro": str(e)}, status=403)
+            return HttpResponseForbidden(str(e))
+
+        resultado = aplicar_acessos_em_lote(concessoes, revogacoes)
+        logger.info("Acessos em lote por %s: %s", request.user.pk, resultado)
+        if json_request:
+            return JsonResponse(resultado)
+        messages.success(
+            request,
+            "Acessos atualizados: {criados} criado(s), {alterados} alterado(s), {revogados} revogado(s).".format(**resultado),
+        )
+        destino = request.POST.get("next", "")
+        if not url_has_allowed_host_and_scheme(destino, allowed_hosts={request.get_host()}):
+            destino = reverse_lazy("inventario_v3:matriz_acessos")
+        return redirect(destino)
+
+    @staticmethod
+    def _operacoes_json(request):
+        try:
+            dados = json.loads(request.body or b"{}")
+            concessoes = [(int(o["usuario"]), int(o["tabela"]), o["nivel"]) for o in dados.get("conceder", [])]
+            revogacoes = [(int(o["usuario"]), int(o["tabela"])) for o in dados.get("revogar", [])]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            raise ValueError("JSON inválido: use {\"conceder\": [...], \"revogar\": [...]}.")
+        return concessoes, revogacoes
+
+    @staticmethod
+    def _operacoes_formulario(request):
+        try:
+            usuarios = [int(pk) for pk in request.POST.getlist("usuarios")]
+            tabelas = [int(pk) for pk in request.POST.getlist("tabelas")]
+        except ValueError:
+            raise ValueError("Seleção de usuários/tabelas inválida.")
+        if not usuarios or not tabelas:
+            raise ValueError("Selecione ao menos um usuário e uma tabela.")
+        if request.POST.get("acao") == "revogar":
+            return [], [(u, t) for u in usuarios for t in tabelas]
+        nivel = request.POST.get("nivel", "")
+        return [(u, t, nivel) for u in usuarios for t in tabelas], []
+
+    def _validar(self, request, concessoes, revogacoes):
+        total = len(concessoes) + len(revogacoes)
+        if total > self.limite_operacoes:
+            raise ValueError(f"Máximo de {self.limite_operacoes} operações por lote ({total} enviadas).")
+        validos = {valor for valor, _ in AcessoTabela.Niveis.CHOICES}
+        if any(nivel not in validos for _, _, nivel in concessoes):
+            raise ValueError("Nível inválido.")
+        usuarios = {u for u, _, _ in concessoes} | {u for u, _ in revogacoes}
+        tabelas = {t for _, t, _ in concessoes} | {t for _, t in revogacoes}
+        if Usuario.objects.filter(pk__in=usuarios).count() != len(usuarios):
+            raise ValueError("Usuário inexistente no lote.")
+        if TabelaProdutos.objects.filter(pk__in=tabelas).count() != len(tabelas):
+            raise ValueError("Tabela inexistente no lote.")
+        user = request.user
+        if user.is_staff or user.is_superuser:
+            return
+        mapa = permissoes_do_request(request)
+        if not all(mapa.tem_nivel(t, AcessoTabela.Niveis.ADMINISTRADOR) for t in tabelas):
+            raise PermissionError("Sem permissão de administrador em todas as tabelas do lote.")
 
 
 # ----- TabelaProdutos CRUD and selection (login required only) -----
-class TabelasLista(LoginRequiredMixin, ListView):
+class TabelasLista(LoginRequiredMixin, TotaisProdutosMixin, ListView):
     login_url = reverse_lazy("inventario_v3:login")
     model = TabelaProdutos
     template_name = "inventario_v3/tabelas_lista.html"
     context_object_name = "tabelas"
+    campos_json = ("nome", "publico")
+    campo_totais = "tabelas"
+    max_consultas = 7
 
     def get_queryset(self):
-        user = self.request.user
-        if getattr(user, "is_superuser", False) or getattr(user, "is_staff", False):
-            return TabelaProdutos.objects.all()
-        qs_public = TabelaProdutos.objects.filter(publico=True)
-        qs_acesso = TabelaProdutos.objects.filter(acessos__usuario=user)
-        return (qs_public | qs_acesso).distinct()
+        if self.request.user.is_staff:
+            return TabelaProdutos.objects.order_by("nome", "pk")
+        return TabelaProdutos.objects.visiveis_para(self.request.user).order_by("nome", "pk")
+
+
+class TabelasListaJson(TabelasLista):
+    def render_to_response(self, context, **response_kwargs):
+        return self.resposta_json(context)
 
 
 class TabelasAdicionar(LoginRequiredMixin, CreateView):
@@ -417,9 +723,9 @@ class SelecionaTabelaAtual(LoginRequiredMixin, View):
 
     def post(self, request, tabela_pk):
         tabela = get_object_or_404(TabelaProdutos, pk=tabela_pk)
-        if not user_has_table_level(self.request.user, tabela, "leitura"):
+        if not user_has_table_level(self.request.user, tabela, "leitura", request=self.request):
             return HttpResponseForbidden("Sem permissão para selecionar esta tabela.")
-        perfil = getattr(self.request.user, "perfil", None)
+        perfil = contexto_do_request(self.request).perfil
         if perfil:
             perfil.current_tabela = tabela
             perfil.save(update_fields=["current_tabela"])
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.apps import apps
 
+from inventario_comum.admin_duplicatas import DuplicatasAdminMixin
+
 # Import models that always exist
 from .models import Produtos, Movimentacao, PerfilUsuario, Categoria
 
@@ -19,7 +21,7 @@ class CategoriaAdmin(admin.ModelAdmin):
 
 
 @admin.register(Produtos)
-class ProdutosAdmin(admin.ModelAdmin):
+class ProdutosAdmin(DuplicatasAdminMixin, admin.ModelAdmin):
     list_display = ("nome", "quantidade", "preco", "categoria", "criado_em")
     search_fields = ("nome",)
     list_filter = ("criado_em", "categoria")
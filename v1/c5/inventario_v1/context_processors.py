@@ -1,22 +1,18 @@
 from typing import Dict
 
-from .models import PerfilUsuario
+from .contexto import contexto_do_request
 
 
 def can_manage_users(request) -> Dict[str, bool]:
     """
     Context processor que adiciona a flag `can_manage_users` em todos os templates.
     True somente quando o usuário autenticado possui perfil com papel 'administrador'.
+    Também expõe `contexto_usuario` (ver contexto.ContextoUsuario).
     """
-    user = getattr(request, "user", None)
-    if not user or not getattr(user, "is_authenticated", False):
-        return {"can_manage_users": False}
-
+    contexto = contexto_do_request(request)
     try:
-        perfil = getattr(user, "perfil", None)
-        if perfil and getattr(perfil, "papel", None) == PerfilUsuario.ROLE_ADMINISTRADOR:
-            return {"can_manage_users": True}
+        pode = contexto.is_administrador
     except Exception:
         # qualquer erro, considerar sem permissão
-        pass
-    return {"can_manage_users": False}
\ No newline at end of file
+        pode = False
+    return {"can_manage_users": pode, "contexto_usuario": contexto}
@@ -0,0 +1,73 @@
+"""
+Contexto do usuário por request (perfil, papel, tabelas permitidas).
+
+ContextoUsuario é preguiçoso: nada é consultado até o primeiro acesso, e cada
+informação é memoizada no próprio objeto, que vive em request.contexto_usuario
+(ver middleware.ContextoUsuarioMiddleware). Papel e tabelas vêm do cache de
+permissões (permissoes.py); o perfil completo só é carregado se alguém pedir.
+"""
+from functools import cached_property
+
+from .models import PerfilUsuario
+from .permissoes import permissoes_efetivas
+
+ATTR_REQUEST = "contexto_usuario"
+
+
+class ContextoUsuario:
+    def __init__(self, user):
+        self.user = user
+
+    @property
+    def autenticado(self):
+        return bool(self.user and getattr(self.user, "is_authenticated", False))
+
+    @cached_property
+    def _permissoes(self):
+        return permissoes_efetivas(self.user)
+
+    @cached_property
+    def perfil(self):
+        if not self.autenticado:
+            return None
+        perfil = PerfilUsuario.objects.filter(usuario_id=self.user.pk).first()
+        if perfil is not None:
+            # preenche o cache de user.perfil para templates/views que acessam direto
+            self.user.perfil = perfil
+        return perfil
+
+    @property
+    def papel(self):
+        return self._permissoes["papel"]
+
+    @property
+    def tabelas_permitidas(self):
+        return self._permissoes["tabelas"]
+
+    @property
+    def is_administrador(self):
+        return self.autenticado and self.papel == PerfilUsuario.ROLE_ADMINISTRADOR
+
+    @property
+    def pode_gerenciar_usuarios(self):
+        if not self.autenticado:
+            return False
+        if getattr(self.user, "is_superuser", False) or getattr(self.user, "is_staff", False):
+            return True
+        return self.is_administrador
+
+    def pode_ver_tabela(self, tabela_pk):
+        return self.pode_gerenciar_usuarios or tabela_pk in self.tabelas_permitidas
+
+
+def contexto_do_request(request):
+    """
+    Retorna o ContextoUsuario do request, criando-o se o middleware não estiver
+    instalado (ou se request.user mudou, ex.: após login no próprio request).
+    """
+    user = getattr(request, "user", None)
+    contexto = getattr(request, ATTR_REQUEST, None)
+    if contexto is None or contexto.user is not user:
+        contexto = ContextoUsuario(user)
+        setattr(request, ATTR_REQUEST, contexto)
+    return contexto
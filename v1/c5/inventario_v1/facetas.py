@@ -0,0 +1,168 @@
+"""
+Facetas da lista de produtos: contagens por categoria, tabela, faixa de estoque e
+faixa de preço para o conjunto de filtros atual (?categoria=&tabela=&estoque=&preco=).
+
+Cada dimensão é contada com todos os filtros aplicados menos o dela mesma (as
+outras opções da dimensão continuam visíveis, com suas contagens), numa única
+consulta agrupada por dimensão. As contagens vão para o cache numa chave com a
+versão dos dados e a assinatura da consulta (o SQL já inclui visibilidade, busca e
+filtros); a versão é incrementada pelos receivers em signals.py a cada escrita em
+produtos, categorias, tabelas ou movimentações. Com vários processos o backend de
+cache precisa ser compartilhado.
+"""
+import hashlib
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from inventario_comum.versoes import invalidar_versao, versao_atual
+
+FACETAS_CACHE_TIMEOUT = 10 * 60
+_CHAVE_VERSAO = "inventario_v1:facetas:versao"
+
+# valor da faceta para produtos sem categoria / sem tabela
+SEM = "sem"
+LIMITE_ESTOQUE_BAIXO = 10
+
+FAIXAS_ESTOQUE = (
+    ("zerado", "Sem estoque", Q(quantidade__lte=0)),
+    ("baixo", f"Estoque baixo (até {LIMITE_ESTOQUE_BAIXO})", Q(quantidade__gt=0, quantidade__lte=LIMITE_ESTOQUE_BAIXO)),
+    ("normal", "Estoque normal", Q(quantidade__gt=LIMITE_ESTOQUE_BAIXO)),
+)
+FAIXAS_PRECO = (
+    ("ate-10", "Até R$ 10", Q(preco__lt=Decimal("10"))),
+    ("10-50", "R$ 10 a R$ 50", Q(preco__gte=Decimal("10"), preco__lt=Decimal("50"))),
+    ("50-200", "R$ 50 a R$ 200", Q(preco__gte=Decimal("50"), preco__lt=Decimal("200"))),
+    ("200-mais", "Acima de R$ 200", Q(preco__gte=Decimal("200"))),
+)
+FAIXAS = {"estoque": FAIXAS_ESTOQUE, "preco": FAIXAS_PRECO}
+DIMENSOES = (
+    ("categoria", "Categoria"),
+    ("tabela", "Tabela"),
+    ("estoque", "Estoque"),
+    ("preco", "Preço"),
+)
+
+
+def versao_dados():
+    return versao_atual(_CHAVE_VERSAO)
+
+
+def invalidar_facetas():
+    invalidar_versao(_CHAVE_VERSAO)
+
+
+def filtros_do_request(params):
+    """{dimensão: valor} com os filtros válidos de `params`; valores inválidos são ignorados."""
+    filtros = {}
+    for dimensao in ("categoria", "tabela"):
+        valor = params.get(dimensao, "").strip()
+        if valor == SEM or valor.isdigit():
+            filtros[dimensao] = valor
+    for dimensao, faixas in FAIXAS.items():
+        valor = params.get(dimensao, "").strip()
+        if valor in {chave for chave, _, _ in faixas}:
+            filtros[dimensao] = valor
+    return filtros
+
+
+def _condicao(dimensao, valor):
+    if dimensao == "categoria":
+        return Q(categoria__isnull=True) if valor == SEM else Q(categoria_id=int(valor))
+    if dimensao == "tabela":
+        return Q(tabelas__isnull=True) if valor == SEM else Q(tabelas__pk=int(valor))
+    return {chave: condicao for chave, _, condicao in FAIXAS[dimensao]}[valor]
+
+
+def aplicar_filtros(qs, filtros, exceto=None):
+    for dimensao, valor in filtros.items():
+        if dimensao != exceto:
+            qs = qs.filter(_condicao(dimensao, valor))
+    return qs
+
+
+def _contar(qs, dimensao):
+    """[(valor, rótulo, total)] da dimensão, numa consulta."""
+    if dimensao == "categoria":
+        linhas = (
+            qs.order_by("categoria__nome")
+            .values_list("categoria_id", "categoria__nome")
+            .annotate(total=Count("pk", distinct=True))
+        )
+        return [(SEM if pk is None else str(pk), nome or "Sem categoria", total) for pk, nome, total in linhas]
+    if dimensao == "tabela":
+        linhas = (
+            qs.order_by("tabelas__nome")
+            .values_list("tabelas__pk", "tabelas__nome")
+            .annotate(total=Count("pk", distinct=True))
+        )
+        return [(SEM if pk is None else str(pk), nome or "Sem tabela", total) for pk, nome, total in linhas]
+    faixas = FAIXAS[dimensao]
+    totais = qs.order_by().aggregate(
+        **{f"f{i}": Count("pk", distinct=True, filter=condicao) for i, (_, _, condicao) in enumerate(faixas)}
+    )
+    return [(chave, rotulo, totais[f"f{i}"]) for i, (chave, rotulo, _) in enumerate(faixas)]
+
+
+def _chave(versao, dimensao, qs):
+    sql, params = qs.order_by().query.sql_with_params()
+    assinatura = hashlib.md5(repr((sql, params)).encode("utf-8")).hexdigest()
+    return f"inventario_v1:facetas:{versao}:{dimensao}:{assinatura}"
+
+
+def contar_facetas(base_qs, filtros, tabelas_permitidas=None):
+    """
+    {dimensão: [(valor, rótulo, total)]} para o queryset base (visibilidade, busca,
+    período) com `filtros`. Com tabelas_permitidas (conjunto de pks), a faceta de
+    tabela só lista essas tabelas, mesmo que um produto visível esteja em outras.
+    """
+    versao = versao_dados()
+    consultas = {dimensao: aplicar_filtros(base_qs, filtros, exceto=dimensao) for dimensao, _ in DIMENSOES}
+    chaves = {dimensao: _chave(versao, dimensao, qs) for dimensao, qs in consultas.items()}
+    em_cache = cache.get_many(list(chaves.values()))
+    contagens = {}
+    novas = {}
+    for dimensao, chave in chaves.items():
+        if chave in em_cache:
+            contagens[dimensao] = em_cache[chave]
+        else:
+            contagens[dimensao] = novas[chave] = _contar(consultas[dimensao], dimensao)
+    if novas:
+        cache.set_many(novas, FACETAS_CACHE_TIMEOUT)
+    if tabelas_permitidas is not None:
+        contagens["tabela"] = [
+            linha for linha in contagens["tabela"] if linha[0] == SEM or int(linha[0]) in tabelas_permitidas
+        ]
+    return contagens
+
+
+def facetas_para_exibir(contagens, filtros, params):
+    """
+    Lista de {"dimensao", "rotulo", "opcoes"} para templates/JSON; cada opção traz
+    valor, rótulo, total, se está selecionada e a querystring que a liga/desliga
+    (sem ?page=, que deixa de fazer sentido quando o filtro muda, nem ?fragmento=).
+    """
+    base = {chave: valor for chave, valor in params.items() if chave not in ("page", "fragmento") and valor != ""}
+    resultado = []
+    for dimensao, rotulo in DIMENSOES:
+        opcoes = []
+        for valor, rotulo_opcao, total in contagens.get(dimensao, []):
+            selecionado = filtros.get(dimensao) == valor
+            alvo = dict(base)
+            if selecionado:
+                alvo.pop(dimensao, None)
+            else:
+                alvo[dimensao] = valor
+            opcoes.append(
+                {
+                    "valor": valor,
+                    "rotulo": rotulo_opcao,
+                    "total": total,
+                    "selecionado": selecionado,
+                    "query": urlencode(alvo),
+                }
+            )
+        resultado.append({"dimensao": dimensao, "rotulo": rotulo, "opcoes": opcoes})
+    return resultado
@@ -2,6 +2,8 @@ from django import forms
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 
+from inventario_comum.autocomplete import campo_autocomplete
+
 from .models import Produtos, Movimentacao, PerfilUsuario, Categoria
 
 User = get_user_model()
@@ -48,6 +50,7 @@ class MovimentacaoFormulario(forms.ModelForm):
     class Meta:
         model = Movimentacao
         fields = ["produto", "tipo", "quantidade", "observacao"]
+        widgets = {"produto": campo_autocomplete("inventario_v1:produtos_autocomplete", "opcoes-produto")}
 
     def clean_quantidade(self):
         q = self.cleaned_data.get("quantidade")
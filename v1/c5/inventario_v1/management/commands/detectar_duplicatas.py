@@ -0,0 +1,5 @@
+from inventario_comum.comandos import DetectarDuplicatas
+
+
+class Command(DetectarDuplicatas):
+    modelo = "inventario_v1.Produtos"
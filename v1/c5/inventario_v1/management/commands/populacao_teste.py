@@ -304,4 +304,10 @@ class Command(BaseCommand):
             except Exception as exc:
                 self.stdout.write(self.style.WARNING(f"  - Erro ao preparar geração de relatório: {exc}"))
 
+        # a limpeza roda com signals mutados: reconstrói o índice de busca por inteiro
+        try:
+            call_command("reindexar_busca", stdout=self.stdout)
+        except Exception as exc:
+            self.stdout.write(self.style.WARNING(f"  - Índice de busca não reconstruído: {exc}"))
+
         self.stdout.write(self.style.NOTICE("Operação finalizada."))
\ No newline at end of file
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+
+from inventario_v1.models import Produtos, Movimentacao
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói os contadores de atividade dos produtos (total de movimentações, "
+        "unidades de entrada/saída e data da última movimentação) a partir do histórico.\n"
+        "Uso: python manage.py recalcular_atividade [--lote N]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=1000, help="Tamanho do lote do bulk_update (default: 1000)")
+
+    def handle(self, *args, **options):
+        lote = max(1, int(options.get("lote") or 1000))
+
+        # uma única agregação agrupada por produto sobre o histórico completo
+        agregados = (
+            Movimentacao.objects.values("produto_id")
+            .annotate(
+                total=Count("id"),
+                entradas=Sum("quantidade", filter=Q(tipo=Movimentacao.TIPO_ENTRADA)),
+                saidas=Sum("quantidade", filter=Q(tipo=Movimentacao.TIPO_SAIDA)),
+                ultima=Max("criado_em"),
+            )
+            .order_by()
+        )
+        por_produto = {row["produto_id"]: row for row in agregados.iterator()}
+
+        campos = ["total_movimentacoes", "total_entradas", "total_saidas", "ultima_movimentacao_em"]
+        pendentes = []
+        atualizados = 0
+        with transaction.atomic():
+            for produto in Produtos.objects.only("pk", *campos).iterator(chunk_size=lote):
+                row = por_produto.get(produto.pk, {})
+                produto.total_movimentacoes = row.get("total") or 0
+                produto.total_entradas = row.get("entradas") or 0
+                produto.total_saidas = row.get("saidas") or 0
+                produto.ultima_movimentacao_em = row.get("ultima")
+                pendentes.append(produto)
+                if len(pendentes) >= lote:
+                    Produtos.objects.bulk_update(pendentes, campos)
+                    atualizados += len(pendentes)
+                    pendentes = []
+            if pendentes:
+                Produtos.objects.bulk_update(pendentes, campos)
+                atualizados += len(pendentes)
+
+        self.stdout.write(self.style.SUCCESS(f"Contadores de atividade recalculados para {atualizados} produto(s)."))
@@ -0,0 +1,25 @@
+"""
+Middleware de contexto de usuário do inventario_v1; o orçamento de consultas
+vem de inventario_comum.middleware.
+
+O contexto vai depois do AuthenticationMiddleware; o orçamento, no início:
+
+    MIDDLEWARE = [
+        "inventario_comum.middleware.OrcamentoConsultasMiddleware",
+        ...
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
+        "inventario_v1.middleware.ContextoUsuarioMiddleware",
+        ...
+    ]
+"""
+from .contexto import contexto_do_request
+
+
+class ContextoUsuarioMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # só anexa o objeto; as consultas acontecem no primeiro uso
+        contexto_do_request(request)
+        return self.get_response(request)
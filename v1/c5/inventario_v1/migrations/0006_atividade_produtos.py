@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-19 03:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario_v1', '0005_tabelaprodutos_alter_perfilusuario_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produtos',
+            name='total_entradas',
+            field=models.PositiveIntegerField(default=0, verbose_name='Unidades de entrada'),
+        ),
+        migrations.AddField(
+            model_name='produtos',
+            name='total_movimentacoes',
+            field=models.PositiveIntegerField(default=0, verbose_name='Total de movimentações'),
+        ),
+        migrations.AddField(
+            model_name='produtos',
+            name='total_saidas',
+            field=models.PositiveIntegerField(default=0, verbose_name='Unidades de saída'),
+        ),
+        migrations.AddField(
+            model_name='produtos',
+            name='ultima_movimentacao_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Última movimentação em'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacao',
+            index=models.Index(fields=['produto', '-criado_em'], name='movimentacao_produto_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produtos',
+            index=models.Index(fields=['-ultima_movimentacao_em'], name='produtos_ultima_mov_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produtos',
+            index=models.Index(fields=['-total_movimentacoes'], name='produtos_total_mov_idx'),
+        ),
+    ]
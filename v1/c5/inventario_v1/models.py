@@ -1,7 +1,7 @@
 from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.db.models import F
+from django.db.models import F, Q, Case, When, Value, Exists, OuterRef, Subquery
 
 modeloUsuario = get_user_model()
 
@@ -39,6 +39,28 @@ class TabelaProdutos(models.Model):
         return self.nome
 
 
+class ProdutosQuerySet(models.QuerySet):
+    def visiveis_para(self, usuario):
+        """
+        Produtos que `usuario` pode ver: todos para quem gerencia usuários
+        (superuser/staff/administrador); para os demais, produtos sem tabela ou com
+        alguma tabela em tabelas_permitidas. Um único predicado EXISTS, com as
+        tabelas lidas do cache de permissões.
+        """
+        from .contexto import ContextoUsuario
+
+        contexto = ContextoUsuario(usuario)
+        if not contexto.autenticado:
+            return self.none()
+        if contexto.pode_gerenciar_usuarios:
+            return self.all()
+        vinculos = Produtos.tabelas.through.objects.filter(produtos_id=OuterRef("pk"))
+        return self.filter(
+            ~Q(Exists(vinculos))
+            | Q(Exists(vinculos.filter(tabelaprodutos_id__in=contexto.tabelas_permitidas)))
+        )
+
+
 class Produtos(models.Model):
     nome = models.CharField("Nome", max_length=200)
     descricao = models.TextField("Descrição", blank=True)
@@ -62,8 +84,21 @@ class Produtos(models.Model):
     criado_em = models.DateTimeField("Criado em", auto_now_add=True)
     atualizado_em = models.DateTimeField("Atualizado em", auto_now=True)
 
+    # contadores de atividade desnormalizados: mantidos por Movimentacao.aplicar_no_estoque /
+    # reverter_no_estoque e reconstruídos pelo comando recalcular_atividade
+    total_movimentacoes = models.PositiveIntegerField("Total de movimentações", default=0)
+    total_entradas = models.PositiveIntegerField("Unidades de entrada", default=0)
+    total_saidas = models.PositiveIntegerField("Unidades de saída", default=0)
+    ultima_movimentacao_em = models.DateTimeField("Última movimentação em", null=True, blank=True)
+
+    objects = ProdutosQuerySet.as_manager()
+
     class Meta:
         ordering = ("nome",)
+        indexes = [
+            models.Index(fields=["-ultima_movimentacao_em"], name="produtos_ultima_mov_idx"),
+            models.Index(fields=["-total_movimentacoes"], name="produtos_total_mov_idx"),
+        ]
 
     def __str__(self):
         return f"{self.nome} ({self.quantidade})"
@@ -138,24 +173,56 @@ class Movimentacao(models.Model):
     observacao = models.TextField("Observação", blank=True)
     criado_em = models.DateTimeField("Registrado em", default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["produto", "-criado_em"], name="movimentacao_produto_data_idx"),
+        ]
+
     def __str__(self):
         return f"{self.get_tipo_display()} {self.quantidade} x {self.produto.nome}"
 
+    def _contadores_atividade(self, sinal: int) -> dict:
+        """
+        Expressões F que ajustam os contadores de atividade do produto.
+        sinal=1 ao aplicar a movimentação, sinal=-1 ao reverter.
+        """
+        campo = "total_entradas" if self.tipo == self.TIPO_ENTRADA else "total_saidas"
+        return {
+            "total_movimentacoes": F("total_movimentacoes") + sinal,
+            campo: F(campo) + sinal * int(self.quantidade),
+        }
+
     def aplicar_no_estoque(self):
         """
         Atualiza o estoque usando F expressions dentro de uma transação.
         Reverte a operação se o resultado ficar negativo e levanta ValueError.
         """
         with transaction.atomic():
+            # contadores de atividade sobem no mesmo UPDATE do estoque
+            ultima = Case(
+                When(
+                    Q(ultima_movimentacao_em__isnull=True) | Q(ultima_movimentacao_em__lt=self.criado_em),
+                    then=Value(self.criado_em),
+                ),
+                default=F("ultima_movimentacao_em"),
+            )
             if self.tipo == self.TIPO_ENTRADA:
-                Produtos.objects.filter(pk=self.produto_id).update(quantidade=F("quantidade") + int(self.quantidade))
+                Produtos.objects.filter(pk=self.produto_id).update(
+                    quantidade=F("quantidade") + int(self.quantidade),
+                    ultima_movimentacao_em=ultima,
+                    **self._contadores_atividade(1),
+                )
             else:
-                Produtos.objects.filter(pk=self.produto_id).update(quantidade=F("quantidade") - int(self.quantidade))
+                Produtos.objects.filter(pk=self.produto_id).update(
+                    quantidade=F("quantidade") - int(self.quantidade),
+                    ultima_movimentacao_em=ultima,
+                    **self._contadores_atividade(1),
+                )
 
             # verificar novo valor
             produto_atual = Produtos.objects.select_for_update().get(pk=self.produto_id)
             if produto_atual.quantidade < 0:
-                # reverter a alteração feita
+                # reverter a alteração feita (os contadores são desfeitos pelo rollback do atomic)
                 if self.tipo == self.TIPO_ENTRADA:
                     Produtos.objects.filter(pk=self.produto_id).update(quantidade=F("quantidade") - int(self.quantidade))
                 else:
@@ -168,10 +235,25 @@ class Movimentacao(models.Model):
         Levanta ValueError se a reversão deixaria quantidade negativa.
         """
         with transaction.atomic():
+            # a última movimentação passa a ser a mais recente que sobra no histórico
+            ultima = Subquery(
+                Movimentacao.objects.filter(produto_id=OuterRef("pk"))
+                .exclude(pk=self.pk)
+                .order_by("-criado_em")
+                .values("criado_em")[:1]
+            )
             if self.tipo == self.TIPO_ENTRADA:
-                Produtos.objects.filter(pk=self.produto_id).update(quantidade=F("quantidade") - int(self.quantidade))
+                Produtos.objects.filter(pk=self.produto_id).update(
+                    quantidade=F("quantidade") - int(self.quantidade),
+                    ultima_movimentacao_em=ultima,
+                    **self._contadores_atividade(-1),
+                )
             else:
-                Produtos.objects.filter(pk=self.produto_id).update(quantidade=F("quantidade") + int(self.quantidade))
+                Produtos.objects.filter(pk=self.produto_id).update(
+                    quantidade=F("quantidade") + int(self.quantidade),
+                    ultima_movimentacao_em=ultima,
+                    **self._contadores_atividade(-1),
+                )
 
             produto_atual = Produtos.objects.select_for_update().get(pk=self.produto_id)
             if produto_atual.quantidade < 0:
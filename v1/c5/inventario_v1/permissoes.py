@@ -0,0 +1,62 @@
+"""
+Cache das permissões efetivas de cada usuário (papel do perfil + tabelas permitidas).
+
+As permissões ficam no cache do Django numa chave versionada: uma versão global e
+uma por usuário, incrementadas pelos receivers em signals.py sempre que o perfil ou
+PerfilUsuario.tabelas_permitidas mudam. Assim a maioria dos requests não consulta o
+banco e alterações passam a valer imediatamente. Com vários processos o backend de
+cache precisa ser compartilhado (Redis/Memcached/DB).
+"""
+from django.core.cache import cache
+
+from inventario_comum.versoes import incrementar_versao, versao_atual
+
+from .models import PerfilUsuario
+
+PERMISSOES_CACHE_TIMEOUT = 60 * 60
+_CHAVE_VERSAO_GLOBAL = "inventario_v1:permissoes:versao"
+
+
+def _chave_versao_usuario(usuario_pk):
+    return f"{_CHAVE_VERSAO_GLOBAL}:u{usuario_pk}"
+
+
+def invalidar_permissoes(usuario_pk=None):
+    """
+    Incrementa a versão das permissões de um usuário (usuario_pk) ou de todos (None).
+    """
+    chave = _CHAVE_VERSAO_GLOBAL if usuario_pk is None else _chave_versao_usuario(usuario_pk)
+    incrementar_versao(chave)
+
+
+def permissoes_efetivas(usuario) -> dict:
+    """
+    Retorna {"papel": str | None, "tabelas": frozenset de pks de TabelaProdutos}
+    para o usuário autenticado, lendo do cache quando a versão está atual.
+    """
+    if not usuario or not getattr(usuario, "is_authenticated", False):
+        return {"papel": None, "tabelas": frozenset()}
+
+    chave_usuario = _chave_versao_usuario(usuario.pk)
+    versoes = cache.get_many([_CHAVE_VERSAO_GLOBAL, chave_usuario])
+    chave = "inventario_v1:permissoes:{}:{}:{}".format(
+        usuario.pk,
+        versao_atual(_CHAVE_VERSAO_GLOBAL, versoes.get(_CHAVE_VERSAO_GLOBAL)),
+        versao_atual(chave_usuario, versoes.get(chave_usuario)),
+    )
+    em_cache = cache.get(chave)
+    if em_cache is not None:
+        return {"papel": em_cache["papel"], "tabelas": frozenset(em_cache["tabelas"])}
+
+    # uma consulta: papel + ids das tabelas permitidas (LEFT JOIN na tabela M2M)
+    papel = None
+    tabelas = set()
+    for papel_row, tabela_pk in PerfilUsuario.objects.filter(usuario_id=usuario.pk).values_list(
+        "papel", "tabelas_permitidas__pk"
+    ):
+        papel = papel_row
+        if tabela_pk is not None:
+            tabelas.add(tabela_pk)
+
+    cache.set(chave, {"papel": papel, "tabelas": sorted(tabelas)}, PERMISSOES_CACHE_TIMEOUT)
+    return {"papel": papel, "tabelas": frozenset(tabelas)}
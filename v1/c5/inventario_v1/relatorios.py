@@ -1,15 +1,40 @@
+"""
+Relatórios (gráficos PNG + HTML + JSON) em MEDIA_ROOT/relatorios/<carimbo>/.
+
+O resultado de cada geração fica no cache numa chave com a versão dos dados
+(facetas.versao_dados, incrementada a cada escrita em produtos, categorias,
+tabelas ou movimentações) e o escopo do relatório (tabelas pedidas, produtos
+visíveis para o usuário e nome dos arquivos). Pedir de novo o mesmo relatório
+sem que nada tenha mudado devolve os arquivos já gerados, sem consultas nem
+gráficos. Escritas em lote (bulk_create, update de queryset) não incrementam a
+versão: o relatório em cache vale até RELATORIOS_CACHE_TIMEOUT.
+
+Os dados dos gráficos vêm de totais_por_categoria (uma consulta agrupada) e
+menor_estoque (ORDER BY quantidade LIMIT n): nenhum produto é carregado em
+memória, que fica O(categorias + n) qualquer que seja o tamanho do catálogo.
+Os gráficos saem em SVG gerado sem matplotlib (padrão) ou, com formato="png"
+(ou settings.RELATORIOS_FORMATO = "png"), desenhados ao mesmo tempo no pool de
+processos de inventario_comum/graficos.py, aquecido enquanto as consultas rodam. Nos dois casos
+o JSON do relatório traz os dados de cada gráfico.
+"""
+import hashlib
 from pathlib import Path
+from django.core.cache import cache
 from django.utils import timezone
 from django.conf import settings
+from django.db.models import Count, Exists, OuterRef, Sum
 from django.core.exceptions import ImproperlyConfigured
 import json
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
 
+from inventario_comum import graficos
+
+from .contexto import ContextoUsuario
+from .facetas import versao_dados
 from .models import Produtos as Produto  # usar modelo local Produtos
 
 PREFIX_RELATORIOS = "relatorios"
+RELATORIOS_CACHE_TIMEOUT = 60 * 60
+SEM_CATEGORIA = "Sem categoria"
 
 
 def _assegura_media_root():
@@ -20,14 +45,82 @@ def _assegura_media_root():
     return Path(settings.MEDIA_ROOT)
 
 
-def gerar_relatorio(pks_tabelas=None, usuario: str | None = None) -> dict:
+def totais_por_categoria(produtos_qs):
+    """
+    [(nome da categoria, produtos, unidades em estoque)] numa consulta agrupada,
+    categorias com mais produtos primeiro. Categorias de mesmo nome somam juntas.
+    """
+    linhas = (
+        produtos_qs.order_by()
+        .values("categoria__nome")
+        .annotate(produtos=Count("pk"), unidades=Sum("quantidade"))
+        .order_by("-produtos", "categoria__nome")
+    )
+    return [(linha["categoria__nome"] or SEM_CATEGORIA, linha["produtos"], linha["unidades"] or 0) for linha in linhas]
+
+
+def menor_estoque(produtos_qs, n=10):
+    """Os n produtos com menor quantidade ({"pk", "nome", "quantidade", "categoria"}), via ORDER BY ... LIMIT."""
+    linhas = produtos_qs.order_by("quantidade", "pk").values("pk", "nome", "quantidade", "categoria__nome")[:n]
+    return [
+        {
+            "pk": linha["pk"],
+            "nome": linha["nome"],
+            "quantidade": linha["quantidade"] or 0,
+            "categoria": linha["categoria__nome"] or SEM_CATEGORIA,
+        }
+        for linha in linhas
+    ]
+
+
+def _escopo_visibilidade(usuario):
+    """O que `usuario` enxerga, no mesmo critério de ProdutosQuerySet.visiveis_para (lido do cache de permissões)."""
+    if usuario is None:
+        return "todos"
+    contexto = ContextoUsuario(usuario)
+    if not contexto.autenticado:
+        return "nenhum"
+    if contexto.pode_gerenciar_usuarios:
+        return "todos"
+    return tuple(sorted(contexto.tabelas_permitidas))
+
+
+def _chave_cache(pks_tabelas, usuario, visivel_para, formato):
+    escopo = (
+        tuple(sorted(set(pks_tabelas))) if pks_tabelas else "todas",
+        _escopo_visibilidade(visivel_para),
+        usuario or None,
+        formato,
+    )
+    assinatura = hashlib.md5(repr(escopo).encode("utf-8")).hexdigest()
+    return f"inventario_v1:relatorios:{versao_dados()}:{assinatura}"
+
+
+def gerar_relatorio(
+    pks_tabelas=None, usuario: str | None = None, visivel_para=None, forcar=False, formato: str | None = None
+) -> dict:
     """
     Gera gráficos e um relatório HTML/JSON para as tabelas indicadas (lista de PKs).
     Se pks_tabelas for None ou vazio, usa todos os produtos.
+    Com visivel_para (um User), agrega apenas Produto.objects.visiveis_para(visivel_para).
+    formato: "svg" ou "png" (padrão settings.RELATORIOS_FORMATO, "svg"); outro valor é ValueError.
+
+    Se o mesmo relatório já foi gerado na versão atual dos dados e os arquivos
+    ainda existem, devolve esse resultado ("reaproveitado": True) sem gerar nada;
+    forcar=True gera de novo mesmo assim.
 
     Retorna um dicionário com metadados e caminhos relativos.
     """
+    formato = graficos.formato_do_relatorio(formato)
     raiz_media = _assegura_media_root()
+    # versão lida antes das consultas: uma escrita durante a geração invalida o resultado
+    chave = _chave_cache(pks_tabelas, usuario, visivel_para, formato)
+    em_cache = None if forcar else cache.get(chave)
+    if em_cache is not None and all((raiz_media / arquivo).is_file() for arquivo in em_cache["arquivos"]):
+        return {**em_cache, "reaproveitado": True}
+    if formato == "png":
+        graficos.aquecer()
+
     pasta_base = raiz_media / PREFIX_RELATORIOS
     pasta_base.mkdir(parents=True, exist_ok=True)
 
@@ -40,7 +133,8 @@ def gerar_relatorio(pks_tabelas=None, usuario: str | None = None) -> dict:
         try:
             # se o modelo Produto tiver relacionamento 'tabelas', aplicamos filtro; senão usamos todos
             if hasattr(Produto, "tabelas"):
-                produtos_qs = Produto.objects.filter(tabelas__pk__in=pks_tabelas).distinct()
+                vinculos = Produto.tabelas.through.objects.filter(produtos_id=OuterRef("pk"), tabelaprodutos_id__in=pks_tabelas)
+                produtos_qs = Produto.objects.filter(Exists(vinculos))
             else:
                 produtos_qs = Produto.objects.all()
         except Exception:
@@ -48,16 +142,14 @@ def gerar_relatorio(pks_tabelas=None, usuario: str | None = None) -> dict:
     else:
         produtos_qs = Produto.objects.all()
 
-    produtos = list(produtos_qs.select_related("categoria"))
+    if visivel_para is not None:
+        produtos_qs = produtos_qs.visiveis_para(visivel_para)
 
-    # 1) Produtos por categoria (contagem por categoria)
-    categoria_para_produtos = {}
-    for p in produtos:
-        cat = p.categoria.nome if getattr(p, "categoria", None) else "Sem categoria"
-        categoria_para_produtos.setdefault(cat, set()).add(p.pk)
+    totais = totais_por_categoria(produtos_qs)
 
-    categorias = list(categoria_para_produtos.keys())
-    contagens = [len(categoria_para_produtos[c]) for c in categorias]
+    # 1) Produtos por categoria (contagem por categoria)
+    categorias = [categoria for categoria, _, _ in totais]
+    contagens = [produtos for _, produtos, _ in totais]
     if not categorias:
         categorias = ["(nenhum)"]
         contagens = [0]
@@ -66,66 +158,42 @@ def gerar_relatorio(pks_tabelas=None, usuario: str | None = None) -> dict:
     pasta_saida = pasta_base / carimbo
     pasta_saida.mkdir(parents=True, exist_ok=True)
 
-    # Gráfico 1
-    fig1, ax1 = plt.subplots(figsize=(8, 4))
-    ax1.bar(range(len(categorias)), contagens, color="#2e86c1")
-    ax1.set_xticks(range(len(categorias)))
-    ax1.set_xticklabels(categorias, rotation=35, ha="right")
-    ax1.set_title("Produtos por Categoria")
-    ax1.set_ylabel("Quantidade")
-    ax1.set_ylim(0, (max(contagens) * 1.15) if any(contagens) else 1)
-    plt.tight_layout()
-    nome_chart1 = f"chart_produtos_por_categoria_{carimbo}.png"
-    caminho_chart1 = pasta_saida / nome_chart1
-    fig1.savefig(caminho_chart1, dpi=100)
-    plt.close(fig1)
-
     # 2) Produtos com menor estoque (top 10)
-    produtos_ordenados = sorted(produtos, key=lambda x: (x.quantidade if x.quantidade is not None else 0))
-    mais_baixos = produtos_ordenados[:10]
-    nomes_baixos = [f"{(p.categoria.nome if getattr(p,'categoria',None) else 'Sem categoria')} - {p.nome}" for p in mais_baixos]
-    valores_baixos = [p.quantidade for p in mais_baixos]
+    mais_baixos = menor_estoque(produtos_qs, 10)
+    nomes_baixos = [f"{p['categoria']} - {p['nome']}" for p in mais_baixos]
+    valores_baixos = [p["quantidade"] for p in mais_baixos]
     if not nomes_baixos:
         nomes_baixos = ["(nenhum)"]
         valores_baixos = [0]
 
-    fig2, ax2 = plt.subplots(figsize=(9, 5))
-    y_pos = list(range(len(nomes_baixos)-1, -1, -1))
-    ax2.barh(y_pos, valores_baixos, color="#ff8c00")
-    ax2.set_yticks(range(len(nomes_baixos)))
-    ax2.set_yticklabels(list(reversed(nomes_baixos)))
-    ax2.set_xlabel("Quantidade")
-    ax2.set_title("Produtos com menor estoque (top 10)")
-    plt.tight_layout()
-    nome_chart2 = f"chart_estoque_baixo_{carimbo}.png"
-    caminho_chart2 = pasta_saida / nome_chart2
-    fig2.savefig(caminho_chart2, dpi=100)
-    plt.close(fig2)
-
     # 3) Estoque por Categoria (soma das quantidades)
-    estoque_por_categoria = {}
-    for p in produtos:
-        cat = p.categoria.nome if getattr(p, "categoria", None) else "Sem categoria"
-        estoque_por_categoria[cat] = estoque_por_categoria.get(cat, 0) + (p.quantidade or 0)
-
-    categorias3 = list(estoque_por_categoria.keys())
-    valores3 = [estoque_por_categoria[c] for c in categorias3]
+    categorias3 = [categoria for categoria, _, _ in totais]
+    valores3 = [unidades for _, _, unidades in totais]
     if not categorias3:
         categorias3 = ["(nenhum)"]
         valores3 = [0]
 
-    fig3, ax3 = plt.subplots(figsize=(8, 4))
-    ax3.bar(range(len(categorias3)), valores3, color="#2ca02c")
-    ax3.set_xticks(range(len(categorias3)))
-    ax3.set_xticklabels(categorias3, rotation=35, ha="right")
-    ax3.set_title("Estoque por Categoria (unidades)")
-    ax3.set_ylabel("Unidades")
-    ax3.set_ylim(0, max(valores3) * 1.15 if any(valores3) else 1)
-    plt.tight_layout()
-    nome_chart3 = f"chart_estoque_por_categoria_{carimbo}.png"
-    caminho_chart3 = pasta_saida / nome_chart3
-    fig3.savefig(caminho_chart3, dpi=100)
-    plt.close(fig3)
+    nome_chart1 = f"chart_produtos_por_categoria_{carimbo}.{formato}"
+    nome_chart2 = f"chart_estoque_baixo_{carimbo}.{formato}"
+    nome_chart3 = f"chart_estoque_por_categoria_{carimbo}.{formato}"
+    desenhos = [
+        {
+            "arquivo": str(pasta_saida / nome_chart1), "titulo": "Produtos por Categoria",
+            "rotulos": categorias, "valores": contagens, "cor": "#2e86c1", "tamanho": (8, 4),
+            "rotulo_eixo": "Quantidade", "rotacao": 35, "margem": 0.15,
+        },
+        {
+            "arquivo": str(pasta_saida / nome_chart2), "titulo": "Produtos com menor estoque (top 10)",
+            "rotulos": nomes_baixos, "valores": valores_baixos, "cor": "#ff8c00", "tamanho": (9, 5),
+            "horizontal": True, "rotulo_eixo": "Quantidade",
+        },
+        {
+            "arquivo": str(pasta_saida / nome_chart3), "titulo": "Estoque por Categoria (unidades)",
+            "rotulos": categorias3, "valores": valores3, "cor": "#2ca02c", "tamanho": (8, 4),
+            "rotulo_eixo": "Unidades", "rotacao": 35, "margem": 0.15,
+        },
+    ]
+    graficos.escrever_graficos(desenhos, formato)
 
     # Montar HTML
     nome_base = f"relatorio_usuario{usuario}_{carimbo}" if usuario else f"relatorio_{carimbo}"
@@ -168,6 +236,10 @@ def gerar_relatorio(pks_tabelas=None, usuario: str | None = None) -> dict:
         "usuario": usuario or None,
         "tabelas": pks_tabelas or [],
         "arquivos": [nome_chart1, nome_chart2, nome_chart3, nome_html],
+        "formato": formato,
+        "graficos": [
+            {"titulo": d["titulo"], "rotulos": d["rotulos"], "valores": d["valores"]} for d in desenhos
+        ],
     }
     caminho_json = pasta_saida / nome_json
     with caminho_json.open("w", encoding="utf-8") as fh:
@@ -182,10 +254,12 @@ def gerar_relatorio(pks_tabelas=None, usuario: str | None = None) -> dict:
         f"{PREFIX_RELATORIOS}/{carimbo}/{nome_json}",
     ]
 
-    return {
+    resultado = {
         "diretorio_saida": pasta_saida,
         "arquivos": arquivos_gerados,
         "url_html_relativa": f"{PREFIX_RELATORIOS}/{carimbo}/{nome_html}",
         "url_json_relativa": f"{PREFIX_RELATORIOS}/{carimbo}/{nome_json}",
         "carimbo": carimbo,
-    }
\ No newline at end of file
+    }
+    cache.set(chave, resultado, RELATORIOS_CACHE_TIMEOUT)
+    return {**resultado, "reaproveitado": False}
@@ -173,12 +173,182 @@ def gerar_relatorio(*args, **kwargs):
 
 @receiver(user_logged_in)
 def on_user_logged_in(sender, user, request, **kwargs):
+    """
+    Enfileira o relatório do usuário no worker de inventario_comum/tarefas.py
+    (após o commit do login); o login não espera os gráficos. Logins repetidos
+    antes da geração começar resultam num relatório só. O relatório agrega apenas os produtos
+    visíveis para o usuário (e a chave de cache dele carrega esse escopo).
+    """
+    from inventario_comum.tarefas import relatorios
+
+    usuario = str(getattr(user, "pk", ""))
     try:
-        gerar_relatorio(usuario=str(getattr(user, "pk", "")))
-        logger.debug("Geração de relatório acionada em login para user %s", user)
+        transaction.on_commit(
+            lambda: relatorios.enfileirar(("login", usuario), gerar_relatorio, usuario=usuario, visivel_para=user)
+        )
+        logger.debug("Relatório do login enfileirado para user %s", user)
     except Exception:
         logger.exception("Erro ao processar on_user_logged_in")
 
 
+def perfil_tabelas_permitidas_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    from .permissoes import invalidar_permissoes
+    if not reverse:
+        # instance é o PerfilUsuario
+        invalidar_permissoes(instance.usuario_id)
+    elif pk_set:
+        # instance é a TabelaProdutos; pk_set contém PerfilUsuario
+        for usuario_pk in model.objects.filter(pk__in=pk_set).values_list("usuario_id", flat=True):
+            invalidar_permissoes(usuario_pk)
+    else:
+        # post_clear reverso: não sabemos quais perfis foram afetados
+        invalidar_permissoes()
+
+
+def perfil_usuario_changed(sender, instance, **kwargs):
+    from .permissoes import invalidar_permissoes
+    invalidar_permissoes(instance.usuario_id)
+
+
+def tabela_produtos_changed(sender, instance, **kwargs):
+    from .permissoes import invalidar_permissoes
+    invalidar_permissoes()
+
+
+def _connect_permissoes_handlers():
+    """
+    Conecta os receivers que invalidam o cache versionado de permissões (permissoes.py).
+    """
+    try:
+        PerfilUsuario = apps.get_model("inventario_v1", "PerfilUsuario")
+        TabelaProdutos = apps.get_model("inventario_v1", "TabelaProdutos")
+    except LookupError:
+        return
+    post_save.connect(perfil_usuario_changed, sender=PerfilUsuario)
+    post_delete.connect(perfil_usuario_changed, sender=PerfilUsuario)
+    post_delete.connect(tabela_produtos_changed, sender=TabelaProdutos)
+    if hasattr(PerfilUsuario, "tabelas_permitidas"):
+        m2m_changed.connect(perfil_tabelas_permitidas_changed, sender=PerfilUsuario.tabelas_permitidas.through)
+
+
+_CATEGORIA_TO_PRODUTOS_BEFORE_DELETE = {}
+
+
+def produto_busca_salvo(sender, instance, **kwargs):
+    from . import busca
+    busca.indexar_produtos(sender.objects.filter(pk=instance.pk))
+
+
+def produto_busca_removido(sender, instance, **kwargs):
+    from . import busca
+    busca.remover_do_indice([instance.pk])
+
+
+def categoria_busca_salva(sender, instance, created, **kwargs):
+    # categoria nova ainda não tem produtos; renomear muda o texto indexado de todos os seus produtos
+    if created:
+        return
+    from . import busca
+    busca.indexar_produtos(instance.produtos.all())
+
+
+def categoria_busca_pre_delete(sender, instance, **kwargs):
+    _CATEGORIA_TO_PRODUTOS_BEFORE_DELETE[instance.pk] = list(instance.produtos.values_list("pk", flat=True))
+
+
+def categoria_busca_removida(sender, instance, **kwargs):
+    from . import busca
+    pks = _CATEGORIA_TO_PRODUTOS_BEFORE_DELETE.pop(instance.pk, None) or []
+    if pks:
+        Produtos = apps.get_model("inventario_v1", "Produtos")
+        busca.indexar_produtos(Produtos.objects.filter(pk__in=pks))
+
+
+def _connect_busca_handlers():
+    """
+    Mantém o índice full-text (busca.py) em sincronia com produtos e categorias.
+    Os receivers rodam na mesma conexão do save/delete, dentro da mesma transação.
+    """
+    try:
+        Produtos = apps.get_model("inventario_v1", "Produtos")
+        Categoria = apps.get_model("inventario_v1", "Categoria")
+    except LookupError:
+        return
+    post_save.connect(produto_busca_salvo, sender=Produtos)
+    post_delete.connect(produto_busca_removido, sender=Produtos)
+    post_save.connect(categoria_busca_salva, sender=Categoria)
+    pre_delete.connect(categoria_busca_pre_delete, sender=Categoria)
+    post_delete.connect(categoria_busca_removida, sender=Categoria)
+
+
+def dados_produtos_changed(sender, **kwargs):
+    from .facetas import invalidar_facetas
+    invalidar_facetas()
+
+
+def _connect_facetas_handlers():
+    """
+    Invalida as contagens de facetas em cache (facetas.py) a cada escrita que muda
+    produtos ou seus rótulos. Movimentações alteram o estoque com UPDATE (sem
+    signal de Produtos), por isso também contam.
+    """
+    try:
+        Produtos = apps.get_model("inventario_v1", "Produtos")
+        Categoria = apps.get_model("inventario_v1", "Categoria")
+        TabelaProdutos = apps.get_model("inventario_v1", "TabelaProdutos")
+        Movimentacao = apps.get_model("inventario_v1", "Movimentacao")
+    except LookupError:
+        return
+    for modelo in (Produtos, Categoria, TabelaProdutos, Movimentacao):
+        post_save.connect(dados_produtos_changed, sender=modelo)
+        post_delete.connect(dados_produtos_changed, sender=modelo)
+    m2m_changed.connect(dados_produtos_changed, sender=Produtos.tabelas.through)
+
+
+def _do_app(sender):
+    meta = getattr(sender, "_meta", None)
+    return meta is not None and meta.app_label == "inventario_v1"
+
+
+def contagem_salvo(sender, instance, created=False, **kwargs):
+    if not _do_app(sender):
+        return
+    from inventario_comum.paginacao import ajustar_contador, invalidar_contagens
+    invalidar_contagens()
+    if created:
+        ajustar_contador(sender, 1)
+
+
+def contagem_removido(sender, instance, **kwargs):
+    if not _do_app(sender):
+        return
+    from inventario_comum.paginacao import ajustar_contador, invalidar_contagens
+    invalidar_contagens()
+    ajustar_contador(sender, -1)
+
+
+def contagem_m2m(sender, action, **kwargs):
+    if action.startswith("post_") and _do_app(sender):
+        from inventario_comum.paginacao import invalidar_contagens
+        invalidar_contagens()
+
+
+def _connect_paginacao_handlers():
+    """
+    Mantém as contagens dos paginadores (inventario_comum/paginacao.py): qualquer escrita em modelos
+    do app muda a versão das contagens filtradas; inserções e remoções ajustam o
+    contador mantido da tabela.
+    """
+    post_save.connect(contagem_salvo, dispatch_uid="inventario_v1_contagem_salvo")
+    post_delete.connect(contagem_removido, dispatch_uid="inventario_v1_contagem_removido")
+    m2m_changed.connect(contagem_m2m, dispatch_uid="inventario_v1_contagem_m2m")
+
+
 _connect_optional_handlers()
-_connect_movimentacao_post_delete()
\ No newline at end of file
+_connect_movimentacao_post_delete()
+_connect_permissoes_handlers()
+_connect_busca_handlers()
+_connect_facetas_handlers()
+_connect_paginacao_handlers()
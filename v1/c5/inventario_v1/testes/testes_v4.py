@@ -0,0 +1,595 @@
+# Testes de desempenho/escala para inventario_v1 (contadores, consultas e relatórios).
+import json
+from decimal import Decimal
+from io import StringIO
+import threading
+
+import pytest
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from inventario_comum import duplicatas, tarefas
+from inventario_comum.consultas import OrcamentoConsultasExcedido
+from inventario_v1.busca import buscar
+from inventario_v1.facetas import contar_facetas, filtros_do_request
+from inventario_v1.models import Categoria, Produtos, Movimentacao, PerfilUsuario, TabelaProdutos
+from inventario_v1.permissoes import permissoes_efetivas
+from inventario_v1.relatorios import gerar_relatorio, menor_estoque, totais_por_categoria
+from inventario_v1.views import ProdutosLista
+
+User = get_user_model()
+
+
+@pytest.mark.django_db
+def test_contadores_atividade_aplicar_e_reverter():
+    p = Produtos.objects.create(nome="P_ativ", quantidade=10, preco=Decimal("1.00"))
+    m1 = Movimentacao.objects.create(produto=p, tipo=Movimentacao.TIPO_ENTRADA, quantidade=5)
+    m1.aplicar_no_estoque()
+    m2 = Movimentacao.objects.create(produto=p, tipo=Movimentacao.TIPO_SAIDA, quantidade=3)
+    m2.aplicar_no_estoque()
+    p.refresh_from_db()
+    assert (p.total_movimentacoes, p.total_entradas, p.total_saidas) == (2, 5, 3)
+    assert p.ultima_movimentacao_em == m2.criado_em
+
+    m2.reverter_no_estoque()
+    p.refresh_from_db()
+    assert (p.total_movimentacoes, p.total_entradas, p.total_saidas) == (1, 5, 0)
+    assert p.ultima_movimentacao_em == m1.criado_em
+    assert p.quantidade == 15
+
+
+@pytest.mark.django_db
+def test_recalcular_atividade_reconstroi_contadores():
+    p = Produtos.objects.create(nome="P_rebuild", quantidade=0, preco=Decimal("1.00"))
+    vazio = Produtos.objects.create(nome="P_vazio", quantidade=0, preco=Decimal("1.00"))
+    Movimentacao.objects.create(produto=p, tipo=Movimentacao.TIPO_ENTRADA, quantidade=7)
+    Movimentacao.objects.create(produto=p, tipo=Movimentacao.TIPO_SAIDA, quantidade=2)
+    Produtos.objects.filter(pk=vazio.pk).update(total_movimentacoes=9)
+
+    call_command("recalcular_atividade")
+
+    p.refresh_from_db()
+    vazio.refresh_from_db()
+    assert (p.total_movimentacoes, p.total_entradas, p.total_saidas) == (2, 7, 2)
+    assert p.ultima_movimentacao_em is not None
+    assert vazio.total_movimentacoes == 0
+    assert vazio.ultima_movimentacao_em is None
+
+
+@pytest.mark.django_db
+def test_produtos_lista_ordena_por_mais_movimentados(client):
+    user = User.objects.create_user(username="ord_user", password="pwd")
+    client.force_login(user)
+    Produtos.objects.create(nome="A_parado", quantidade=1, preco=Decimal("1.00"))
+    ativo = Produtos.objects.create(nome="Z_ativo", quantidade=1, preco=Decimal("1.00"))
+    Movimentacao.objects.create(produto=ativo, tipo=Movimentacao.TIPO_ENTRADA, quantidade=1).aplicar_no_estoque()
+
+    resp = client.get(reverse("inventario_v1:produtos_lista"), {"ordem": "ativos"})
+    assert resp.status_code == 200
+    assert [p.nome for p in resp.context["produtos"]] == ["Z_ativo", "A_parado"]
+
+    resp = client.get(reverse("inventario_v1:produtos_lista"), {"ordem": "recentes"})
+    assert [p.nome for p in resp.context["produtos"]] == ["Z_ativo", "A_parado"]
+
+    resp = client.get(reverse("inventario_v1:produtos_lista"), {"dias": "30"})
+    assert [p.nome for p in resp.context["produtos"]] == ["Z_ativo"]
+
+
+@pytest.mark.django_db
+def test_permissoes_efetivas_cacheadas_e_invalidadas(django_assert_num_queries):
+    user = User.objects.create_user(username="perm_cache", password="pwd")
+    tabela = TabelaProdutos.objects.create(nome="T_cache")
+
+    assert permissoes_efetivas(user)["tabelas"] == frozenset()
+    with django_assert_num_queries(0):
+        assert permissoes_efetivas(user)["papel"] == PerfilUsuario.ROLE_OPERATOR
+
+    perfil = PerfilUsuario.objects.get(usuario=user)
+    perfil.tabelas_permitidas.add(tabela)
+    assert permissoes_efetivas(user)["tabelas"] == frozenset({tabela.pk})
+
+    tabela.perfis.clear()
+    assert permissoes_efetivas(user)["tabelas"] == frozenset()
+
+    perfil.papel = PerfilUsuario.ROLE_ADMINISTRADOR
+    perfil.save()
+    assert permissoes_efetivas(user)["papel"] == PerfilUsuario.ROLE_ADMINISTRADOR
+
+
+@pytest.mark.django_db
+def test_contexto_usuario_unico_por_request(client, django_assert_max_num_queries):
+    user = User.objects.create_user(username="ctx_v1", password="pwd")
+    PerfilUsuario.objects.filter(usuario=user).update(papel=PerfilUsuario.ROLE_ADMINISTRADOR)
+    client.force_login(user)
+    client.get(reverse("inventario_v1:usuarios_lista"))  # aquece o cache de permissões
+
+    resp = client.get(reverse("inventario_v1:usuarios_lista"))
+    contexto = resp.wsgi_request.contexto_usuario
+    assert resp.context["contexto_usuario"] is contexto
+    assert resp.context["can_manage_users"] is True
+    # papel/tabelas vêm do cache; o perfil só é consultado quando pedido, e uma vez
+    with django_assert_max_num_queries(1):
+        assert contexto.perfil.papel == PerfilUsuario.ROLE_ADMINISTRADOR
+        assert contexto.perfil is contexto.perfil
+
+
+@pytest.mark.django_db
+def test_visiveis_para_restringe_lista_e_detalhe(client):
+    user = User.objects.create_user(username="vis_v1", password="pwd")
+    permitida = TabelaProdutos.objects.create(nome="T_vis_ok")
+    proibida = TabelaProdutos.objects.create(nome="T_vis_nao")
+    PerfilUsuario.objects.get(usuario=user).tabelas_permitidas.add(permitida)
+    livre = Produtos.objects.create(nome="Livre", quantidade=1, preco=Decimal("1.00"))
+    ok = Produtos.objects.create(nome="Ok", quantidade=1, preco=Decimal("1.00"))
+    ok.tabelas.add(permitida, proibida)
+    oculto = Produtos.objects.create(nome="Oculto", quantidade=1, preco=Decimal("1.00"))
+    oculto.tabelas.add(proibida)
+
+    assert set(Produtos.objects.visiveis_para(user)) == {livre, ok}
+    client.force_login(user)
+    resp = client.get(reverse("inventario_v1:produtos_lista"))
+    assert {p.pk for p in resp.context["produtos"]} == {livre.pk, ok.pk}
+    resp = client.get(reverse("inventario_v1:produtos_descricao", kwargs={"pk": oculto.pk}))
+    assert resp.status_code == 404
+
+    # movimentações de produtos ocultos não podem ser vistas nem revertidas
+    escondida = Movimentacao.objects.create(produto=oculto, tipo=Movimentacao.TIPO_ENTRADA, quantidade=1)
+    visivel = Movimentacao.objects.create(produto=ok, tipo=Movimentacao.TIPO_ENTRADA, quantidade=1)
+    remover = reverse("inventario_v1:movimentacoes_remover", kwargs={"pk": escondida.pk})
+    assert client.get(remover).status_code == 404
+    assert client.post(remover).status_code == 404
+    assert Movimentacao.objects.filter(pk=escondida.pk).exists()
+    assert client.get(reverse("inventario_v1:movimentacoes_remover", kwargs={"pk": visivel.pk})).status_code == 200
+
+    perfil = PerfilUsuario.objects.get(usuario=user)
+    perfil.papel = PerfilUsuario.ROLE_ADMINISTRADOR
+    perfil.save()
+    assert Produtos.objects.visiveis_para(user).count() == 3
+
+
+@pytest.mark.django_db
+def test_busca_full_text_sem_acentos_por_prefixo_e_sincronizada(client):
+    perifericos = Categoria.objects.create(nome="Periféricos")
+    porca = Produtos.objects.create(nome="Porca sextavada", quantidade=1, preco=Decimal("1.00"))
+    pecas = Produtos.objects.create(nome="Peças de reposição", quantidade=1, preco=Decimal("1.00"))
+    teclado = Produtos.objects.create(
+        nome="Teclado", descricao="acompanha porca", quantidade=1, preco=Decimal("1.00"), categoria=perifericos
+    )
+
+    def nomes(texto):
+        return [p.nome for p in buscar(Produtos.objects.all(), texto)]
+
+    assert nomes("pecas") == ["Peças de reposição"]
+    assert nomes("PERIF") == ["Teclado"]
+    # casamento no nome pesa mais que na descrição
+    assert nomes("porc") == ["Porca sextavada", "Teclado"]
+    assert nomes("porca sext") == ["Porca sextavada"]
+    assert nomes('"porca" OR') == []
+
+    perifericos.nome = "Acessórios"
+    perifericos.save()
+    assert nomes("acessorio") == ["Teclado"]
+    perifericos.delete()
+    assert nomes("acessorio") == []
+    pecas.delete()
+    assert nomes("pecas") == []
+
+    client.force_login(User.objects.create_user(username="busca_v1", password="pwd"))
+    resp = client.get(reverse("inventario_v1:produtos_lista"), {"q": "porca"})
+    assert [p.pk for p in resp.context["produtos"]] == [porca.pk, teclado.pk]
+
+
+@pytest.mark.django_db
+def test_autocomplete_de_produtos_limita_filtra_e_valida(client, django_assert_max_num_queries):
+    user = User.objects.create_user(username="auto_v1", password="pwd")
+    oculta = TabelaProdutos.objects.create(nome="T_auto_oculta")
+    for i in range(60):
+        Produtos.objects.create(nome=f"Parafuso {i:02d}", quantidade=5, preco=Decimal("1.00"))
+    escondido = Produtos.objects.create(nome="Parafuso secreto", quantidade=5, preco=Decimal("1.00"))
+    escondido.tabelas.add(oculta)
+    client.force_login(user)
+
+    url = reverse("inventario_v1:produtos_autocomplete")
+    resultados = client.get(url, {"q": "paraf"}).json()["resultados"]
+    assert len(resultados) == 20
+    assert "Parafuso secreto" not in {r["texto"] for r in client.get(url, {"q": "secreto"}).json()["resultados"]}
+    assert len(client.get(url, {"limite": "500"}).json()["resultados"]) == 50
+
+    # o formulário não renderiza a lista de produtos; o pk enviado é validado no servidor
+    with django_assert_max_num_queries(8):
+        resp = client.get(reverse("inventario_v1:movimentacoes_adicionar"))
+    assert "Parafuso 59" not in resp.content.decode()
+    resp = client.post(
+        reverse("inventario_v1:movimentacoes_adicionar"),
+        {"produto": escondido.pk, "tipo": Movimentacao.TIPO_ENTRADA, "quantidade": 1},
+    )
+    assert resp.status_code == 200 and "produto" in resp.context["form"].errors
+    resp = client.get(reverse("inventario_v1:movimentacoes_lista"), {"produto": "abc"})
+    assert resp.status_code == 200 and "products_list" not in resp.context
+
+
+def _povoar(inicio, fim):
+    """Linhas [inicio, fim) de cada lista, em bulk (sem signals)."""
+    usuarios = User.objects.bulk_create(User(username=f"orc{i:04d}") for i in range(inicio, fim))
+    PerfilUsuario.objects.bulk_create(PerfilUsuario(usuario=u) for u in usuarios)
+    categorias = Categoria.objects.bulk_create(Categoria(nome=f"OrcC{i:04d}") for i in range(inicio, fim))
+    tabelas = TabelaProdutos.objects.bulk_create(TabelaProdutos(nome=f"OrcT{i:04d}") for i in range(inicio, fim))
+    produtos = Produtos.objects.bulk_create(
+        Produtos(nome=f"OrcP{i:04d}", quantidade=i, preco=Decimal("1.00"), categoria=c)
+        for i, c in zip(range(inicio, fim), categorias)
+    )
+    Produtos.tabelas.through.objects.bulk_create(
+        Produtos.tabelas.through(produtos=p, tabelaprodutos=t) for p, t in zip(produtos, tabelas)
+    )
+    detalhe = Produtos.objects.get(nome="OrcP0000")
+    Movimentacao.objects.bulk_create(
+        Movimentacao(produto=p, usuario=u, tipo=Movimentacao.TIPO_ENTRADA, quantidade=1)
+        for p, u in zip([detalhe] * len(usuarios) + produtos, usuarios * 2)
+    )
+    return detalhe
+
+
+@pytest.mark.django_db
+def test_listas_e_detalhes_com_consultas_constantes(client, settings, monkeypatch, tmp_path):
+    settings.MIDDLEWARE = ["inventario_comum.middleware.OrcamentoConsultasMiddleware", *settings.MIDDLEWARE]
+    settings.ORCAMENTO_CONSULTAS_MODO = "erro"
+    settings.MEDIA_ROOT = str(tmp_path)
+    # sem cache de relatório: cada GET de relatorios gera de novo e é medido inteiro
+    monkeypatch.setattr("inventario_v1.relatorios.RELATORIOS_CACHE_TIMEOUT", 0)
+    user = User.objects.create_user(username="orc_admin", password="pwd")
+    PerfilUsuario.objects.filter(usuario=user).update(papel=PerfilUsuario.ROLE_ADMINISTRADOR)
+    detalhe = _povoar(0, 10)
+    movimentacao = detalhe.movimentacoes.first()
+    client.force_login(user)
+    urls = [
+        reverse("inventario_v1:produtos_lista"),
+        reverse("inventario_v1:produtos_lista") + "?q=orcp",
+        reverse("inventario_v1:produtos_descricao", kwargs={"pk": detalhe.pk}),
+        reverse("inventario_v1:categorias_lista"),
+        reverse("inventario_v1:movimentacoes_lista"),
+        reverse("inventario_v1:movimentacoes_remover", kwargs={"pk": movimentacao.pk}),
+        reverse("inventario_v1:usuarios_lista"),
+        reverse("inventario_v1:produtos_autocomplete") + "?q=orc",
+        reverse("inventario_v1:relatorios"),
+    ]
+
+    def consultas():
+        contagens = []
+        for url in urls:
+            with CaptureQueriesContext(connection) as ctx:
+                assert client.get(url).status_code == 200, url
+            contagens.append(len(ctx))
+        return contagens
+
+    consultas()  # aquece o cache de permissões
+    poucas = consultas()
+    _povoar(10, 1000)
+    assert consultas() == poucas
+
+    monkeypatch.setattr(ProdutosLista, "max_consultas", 2)
+    with pytest.raises(OrcamentoConsultasExcedido):
+        client.get(urls[0])
+    settings.ORCAMENTO_CONSULTAS_MODO = "log"
+    assert client.get(urls[0]).status_code == 200
+
+
+@pytest.mark.django_db
+def test_facetas_contam_por_dimensao_cacheiam_e_invalidam(client, django_assert_num_queries):
+    user = User.objects.create_user(username="facetas_v1", password="pwd")
+    ferragens = Categoria.objects.create(nome="Ferragens")
+    tintas = Categoria.objects.create(nome="Tintas")
+    permitida = TabelaProdutos.objects.create(nome="T_fac_ok")
+    oculta = TabelaProdutos.objects.create(nome="T_fac_oculta")
+    PerfilUsuario.objects.get(usuario=user).tabelas_permitidas.add(permitida)
+    for nome, categoria, quantidade, preco in [
+        ("Prego", ferragens, 0, "0.50"),
+        ("Parafuso", ferragens, 5, "1.00"),
+        ("Martelo", ferragens, 30, "45.00"),
+        ("Tinta", tintas, 8, "120.00"),
+        ("Avulso", None, 50, "300.00"),
+    ]:
+        Produtos.objects.create(nome=nome, categoria=categoria, quantidade=quantidade, preco=Decimal(preco))
+    Produtos.objects.get(nome="Martelo").tabelas.add(permitida, oculta)
+
+    def totais(facetas, dimensao):
+        faceta = next(f for f in facetas if f["dimensao"] == dimensao)
+        return {o["rotulo"]: o["total"] for o in faceta["opcoes"] if o["total"]}
+
+    client.force_login(user)
+    url = reverse("inventario_v1:produtos_lista")
+    facetas = client.get(url).context["facetas"]
+    assert totais(facetas, "categoria") == {"Ferragens": 3, "Tintas": 1, "Sem categoria": 1}
+    assert totais(facetas, "tabela") == {"T_fac_ok": 1, "Sem tabela": 4}
+    assert totais(facetas, "estoque") == {"Sem estoque": 1, "Estoque baixo (até 10)": 2, "Estoque normal": 2}
+
+    resp = client.get(url, {"categoria": ferragens.pk, "estoque": "baixo"})
+    assert [p.nome for p in resp.context["produtos"]] == ["Parafuso"]
+    facetas = resp.context["facetas"]
+    # a dimensão filtrada conta sem o próprio filtro; as demais respeitam todos os filtros
+    assert totais(facetas, "categoria") == {"Ferragens": 1, "Tintas": 1}
+    assert totais(facetas, "estoque") == {"Sem estoque": 1, "Estoque baixo (até 10)": 1, "Estoque normal": 1}
+    assert totais(facetas, "preco") == {"Até R$ 10": 1}
+    selecionada = next(o for o in facetas[0]["opcoes"] if o["selecionado"])
+    assert selecionada["rotulo"] == "Ferragens" and f"categoria={ferragens.pk}" not in selecionada["query"]
+
+    base = Produtos.objects.visiveis_para(user)
+    filtros = filtros_do_request({"preco": "ate-10", "categoria": "x"})
+    assert filtros == {"preco": "ate-10"}
+    contar_facetas(base, filtros)
+    with django_assert_num_queries(0):
+        contar_facetas(base, filtros)
+
+    Movimentacao.objects.create(produto=Produtos.objects.get(nome="Prego"), tipo=Movimentacao.TIPO_ENTRADA, quantidade=3).aplicar_no_estoque()
+    json_facetas = client.get(reverse("inventario_v1:produtos_facetas"), {"categoria": ferragens.pk}).json()["facetas"]
+    assert totais(json_facetas, "estoque") == {"Estoque baixo (até 10)": 2, "Estoque normal": 1}
+
+
+@pytest.mark.django_db
+def test_paginadores_sem_count_repetido(client, django_capture_on_commit_callbacks):
+    cache.clear()
+    user = User.objects.create_user(username="pag_v1", password="pwd")
+    PerfilUsuario.objects.filter(usuario=user).update(papel=PerfilUsuario.ROLE_ADMINISTRADOR)
+    ferragens = Categoria.objects.create(nome="Ferragens")
+    for i in range(25):
+        Produtos.objects.create(nome=f"Pag{i:02d}", quantidade=1, preco=Decimal("1.00"), categoria=ferragens if i % 2 else None)
+    produto = Produtos.objects.get(nome="Pag00")
+    for _ in range(31):
+        Movimentacao.objects.create(produto=produto, tipo=Movimentacao.TIPO_ENTRADA, quantidade=1)
+    client.force_login(user)
+
+    def contagens(url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = client.get(url, params or {})
+        return resp, sum("__count" in q["sql"] for q in ctx.captured_queries)
+
+    url = reverse("inventario_v1:produtos_lista")
+    resp, counts = contagens(url)
+    assert resp.context["paginator"].count == 25 and counts == 1
+    # contador mantido: o produto novo entra no total sem outro COUNT
+    with django_capture_on_commit_callbacks(execute=True):
+        Produtos.objects.create(nome="Pag_novo", quantidade=1, preco=Decimal("1.00"))
+    resp, counts = contagens(url, {"page": 2})
+    assert resp.context["paginator"].count == 26 and counts == 0
+    assert resp.context["query_sem_pagina"] == ""
+
+    # lista filtrada: COUNT em cache até a próxima escrita no app
+    resp, _ = contagens(url, {"categoria": ferragens.pk})
+    assert resp.context["paginator"].count == 12
+    _, counts = contagens(url, {"categoria": ferragens.pk})
+    assert counts == 0
+    produto.categoria = ferragens
+    produto.save()
+    resp, _ = contagens(url, {"categoria": ferragens.pk, "page": 1})
+    assert resp.context["paginator"].count == 13
+    assert "categoria=" in resp.context["query_sem_pagina"] and "page" not in resp.context["query_sem_pagina"]
+
+    url = reverse("inventario_v1:movimentacoes_lista")
+    resp, counts = contagens(url)
+    assert counts == 0 and resp.context["page_obj"].has_next() and resp.context["paginator"].num_pages is None
+    assert len(resp.context["movimentacoes"]) == 30
+    resp, _ = contagens(url, {"page": 2})
+    assert not resp.context["page_obj"].has_next() and resp.context["page_obj"].start_index() == 31
+    assert client.get(url, {"page": 3}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_fragmentos_das_listas_sem_layout(client):
+    user = User.objects.create_user(username="frag_v1", password="pwd")
+    PerfilUsuario.objects.filter(usuario=user).update(papel=PerfilUsuario.ROLE_ADMINISTRADOR)
+    for i in range(25):
+        produto = Produtos.objects.create(nome=f"Frag{i:02d}", quantidade=1, preco=Decimal("1.00"))
+    Movimentacao.objects.create(produto=produto, tipo=Movimentacao.TIPO_ENTRADA, quantidade=1)
+    client.force_login(user)
+
+    for nome in ("produtos_lista", "movimentacoes_lista"):
+        url = reverse(f"inventario_v1:{nome}")
+        with CaptureQueriesContext(connection) as pagina:
+            completa = client.get(url, {"page": 1})
+        with CaptureQueriesContext(connection) as fragmento:
+            resp = client.get(url, {"page": 1}, HTTP_X_FRAGMENTO="1")
+        html = resp.content.decode()
+        assert "<table" in html and "<html" not in html and "<nav" not in html
+        assert len(html) < len(completa.content)
+        assert len(fragmento) <= len(pagina)
+        assert "X-Fragmento" in resp["Vary"] and "X-Fragmento" in completa["Vary"]
+        assert 'data-fragmento>' in completa.content.decode()
+
+    # ?fragmento=1 também serve, e não vaza para os links de página
+    resp = client.get(reverse("inventario_v1:produtos_lista"), {"fragmento": "1", "q": "frag"})
+    html = resp.content.decode()
+    assert "<html" not in html and "Frag00" in html
+    assert "fragmento=" not in html and "q=frag&page=2" in html
+
+
+@pytest.mark.django_db
+def test_duplicatas_agrupam_produtos_e_aparecem_no_admin(client, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    for nome, descricao, quantidade in [
+        ("Parafuso M6", "Parafuso de aço inox", 10),
+        ("Parafuso M-6 inox", "", 5),
+        ("PARAFUSO  m6", "", 1),
+        ("Parafuso M8", "", 7),
+        ("Porca M6", "", 3),
+        ("Teclado USB", "Teclado membrana", 2),
+        ("Teclado USB", "Teclado membrana", 4),
+        ("Mouse Óptico", "", 1),
+    ]:
+        Produtos.objects.create(nome=nome, descricao=descricao, quantidade=quantidade, preco=Decimal("1.00"))
+
+    grupos = duplicatas.detectar_duplicatas(Produtos.objects.all())
+    nomes = [sorted(p["nome"] for p in g["produtos"]) for g in grupos]
+    # números diferentes (M6 x M8) não são duplicatas
+    assert nomes == [["PARAFUSO  m6", "Parafuso M-6 inox", "Parafuso M6"], ["Teclado USB", "Teclado USB"]]
+    assert grupos[0]["quantidade_total"] == 16 and 0.6 <= grupos[0]["similaridade"] < 1
+
+    saida = StringIO()
+    call_command("detectar_duplicatas", "--json", stdout=saida)
+    assert json.loads(saida.getvalue()) == grupos
+    admin = User.objects.create_user(username="dup_admin", password="pwd", is_staff=True, is_superuser=True)
+    client.force_login(admin)
+    resp = client.get(reverse("admin:inventario_v1_produtos_duplicatas"))
+    assert resp.status_code == 200 and "Parafuso M-6 inox" in resp.content.decode()
+
+
+@pytest.mark.django_db
+def test_admin_de_duplicatas_enfileira_recalculo_e_confere_permissoes(client, settings, tmp_path, monkeypatch):
+    settings.MEDIA_ROOT = tmp_path
+    settings.RELATORIOS_EM_SEGUNDO_PLANO = False
+    for nome in ("Parafuso M6", "Parafuso M-6"):
+        Produtos.objects.create(nome=nome, quantidade=1, preco=Decimal("1.00"))
+    url = reverse("admin:inventario_v1_produtos_duplicatas")
+
+    # staff sem permissão de ver produtos não abre a página nem recalcula
+    client.force_login(User.objects.create_user(username="dup_staff", password="pwd", is_staff=True))
+    assert client.get(url).status_code == 403
+    assert client.post(url).status_code == 403
+
+    client.force_login(User.objects.create_user(username="dup_super", password="pwd", is_staff=True, is_superuser=True))
+    # o recálculo vai para a fila de tarefas (aqui, na hora), não para o request
+    enfileirados = []
+    monkeypatch.setattr(tarefas.duplicatas, "enfileirar", lambda chave, funcao, *a: enfileirados.append(chave) or funcao(*a))
+    assert client.post(url).status_code == 302
+    assert enfileirados == [("duplicatas", "inventario_v1.produtos")]
+    assert len(duplicatas.carregar_resultado(Produtos)["grupos"]) == 1
+
+    # acima do limite o admin manda usar o comando
+    settings.DUPLICATAS_LIMITE_ADMIN = 1
+    resp = client.post(url, follow=True)
+    assert enfileirados == [("duplicatas", "inventario_v1.produtos")]
+    assert "detectar_duplicatas" in resp.content.decode()
+
+
+@pytest.mark.django_db
+def test_login_enfileira_relatorio_sem_esperar_a_geracao(client, monkeypatch, django_capture_on_commit_callbacks):
+    import inventario_v1.signals as sinais
+
+    comecou, liberar = threading.Event(), threading.Event()
+    pedidos = []
+
+    def gerar_lento(**kwargs):
+        pedidos.append(kwargs)
+        comecou.set()
+        liberar.wait(5)
+
+    monkeypatch.setattr(sinais, "gerar_relatorio", gerar_lento)
+    user = User.objects.create_user(username="login_rel", password="pwd")
+    try:
+        # nada é enfileirado antes do commit do login
+        with django_capture_on_commit_callbacks() as callbacks:
+            assert client.login(username="login_rel", password="pwd")
+        assert callbacks and not pedidos
+        for callback in callbacks:
+            callback()
+        assert comecou.wait(5)
+        # logins durante a geração: uma repetição só, e o login não espera
+        for _ in range(3):
+            with django_capture_on_commit_callbacks(execute=True):
+                assert client.login(username="login_rel", password="pwd")
+        assert tarefas.relatorios.ocupada(("login", str(user.pk))) and len(pedidos) == 1
+    finally:
+        liberar.set()
+    assert tarefas.relatorios.aguardar(5)
+    assert [(p["usuario"], p["visivel_para"]) for p in pedidos] == [(str(user.pk), user)] * 2
+
+
+@pytest.mark.django_db
+def test_relatorio_do_login_so_agrega_produtos_visiveis(client, settings, tmp_path, django_capture_on_commit_callbacks):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.RELATORIOS_EM_SEGUNDO_PLANO = False
+    settings.RELATORIOS_PROCESSOS_GRAFICOS = 0
+    privada = TabelaProdutos.objects.create(nome="Privada")
+    Produtos.objects.create(nome="Oculto", quantidade=0).tabelas.add(privada)
+    Produtos.objects.create(nome="Visivel", quantidade=1)
+    User.objects.create_user(username="login_restrito", password="pwd")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        assert client.login(username="login_restrito", password="pwd")
+    (relatorio,) = tmp_path.glob("relatorios/*/relatorio_usuario*.json")
+    dados = json.loads(relatorio.read_text(encoding="utf-8"))
+    rotulos = " | ".join(rotulo for grafico in dados["graficos"] for rotulo in grafico["rotulos"])
+    assert "Visivel" in rotulos and "Oculto" not in rotulos
+
+
+@pytest.mark.django_db
+def test_relatorio_reaproveitado_enquanto_os_dados_nao_mudam(settings, tmp_path, django_assert_num_queries):
+    settings.MEDIA_ROOT = str(tmp_path)
+    admin = User.objects.create_superuser(username="rel_cache_admin", password="pwd")
+    Produtos.objects.create(nome="Cacheado", quantidade=3, preco="2.00")
+
+    primeiro = gerar_relatorio(usuario="7")
+    assert not primeiro["reaproveitado"]
+    # mesmo relatório, dados iguais: só a leitura do cache, sem consultas nem gráficos
+    with django_assert_num_queries(0):
+        segundo = gerar_relatorio(usuario="7")
+    assert segundo["reaproveitado"] and segundo["arquivos"] == primeiro["arquivos"]
+
+    # outro escopo, forcar=True, escrita em produtos ou arquivos apagados geram de novo
+    assert not gerar_relatorio(usuario="8")["reaproveitado"]
+    # quem vê tudo compartilha o relatório sem restrição; quem vê menos tem o seu
+    assert gerar_relatorio(usuario="7", visivel_para=admin)["reaproveitado"]
+    restrito = User.objects.create_user(username="rel_cache_restrito", password="pwd")
+    assert not gerar_relatorio(usuario="7", visivel_para=restrito)["reaproveitado"]
+    assert gerar_relatorio(usuario="7", visivel_para=restrito)["reaproveitado"]
+    assert not gerar_relatorio(usuario="7", forcar=True)["reaproveitado"]
+    Produtos.objects.create(nome="Novo", quantidade=1, preco="1.00")
+    terceiro = gerar_relatorio(usuario="7")
+    assert not terceiro["reaproveitado"]
+    (tmp_path / terceiro["url_html_relativa"]).unlink()
+    assert not gerar_relatorio(usuario="7")["reaproveitado"]
+
+
+@pytest.mark.django_db
+def test_relatorio_agrega_no_banco_sem_carregar_produtos(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    ferragens = Categoria.objects.create(nome="Ferragens")
+    tintas = Categoria.objects.create(nome="Tintas")
+    Produtos.objects.bulk_create(
+        [Produtos(nome=f"Ferr{i:02d}", quantidade=i + 1, categoria=ferragens) for i in range(30)]
+        + [Produtos(nome=f"Tinta{i}", quantidade=0, categoria=tintas) for i in range(3)]
+        + [Produtos(nome="Avulso", quantidade=7)]
+    )
+    produtos = Produtos.objects.all()
+    assert totais_por_categoria(produtos) == [("Ferragens", 30, 465), ("Tintas", 3, 0), ("Sem categoria", 1, 7)]
+    baixos = menor_estoque(produtos, 5)
+    assert [p["nome"] for p in baixos] == ["Tinta0", "Tinta1", "Tinta2", "Ferr00", "Ferr01"]
+    assert baixos[0]["categoria"] == "Tintas"
+
+    # uma consulta agrupada e uma com LIMIT: nenhuma lê o catálogo inteiro
+    with CaptureQueriesContext(connection) as ctx:
+        gerar_relatorio(forcar=True)
+    consultas = [q["sql"] for q in ctx.captured_queries if '"inventario_v1_produtos"' in q["sql"]]
+    assert len(consultas) == 2
+    assert "GROUP BY" in consultas[0] and "LIMIT 10" in consultas[1]
+
+@pytest.mark.django_db
+def test_relatorio_em_svg_por_padrao_com_dados_no_json(settings, tmp_path):
+    from xml.etree import ElementTree
+
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.RELATORIOS_PROCESSOS_GRAFICOS = 0
+    tintas = Categoria.objects.create(nome="Tintas <&>")
+    Produtos.objects.create(nome="Branca", quantidade=4, categoria=tintas)
+    Produtos.objects.create(nome="Avulso", quantidade=1)
+
+    resultado = gerar_relatorio()
+    svgs = [tmp_path / a for a in resultado["arquivos"] if a.endswith(".svg")]
+    assert len(svgs) == 3 and not [a for a in resultado["arquivos"] if a.endswith(".png")]
+    raiz = ElementTree.fromstring(svgs[0].read_text(encoding="utf-8"))
+    assert len(raiz.findall("{http://www.w3.org/2000/svg}rect")) == 3  # fundo + duas barras
+    assert "Tintas <&>" in [t.text for t in raiz.iter("{http://www.w3.org/2000/svg}text")]
+    dados = json.loads((tmp_path / resultado["url_json_relativa"]).read_text(encoding="utf-8"))
+    assert dados["formato"] == "svg"
+    assert dados["graficos"][0]["rotulos"] == ["Sem categoria", "Tintas <&>"]
+    assert dados["graficos"][0]["valores"] == [1, 1]
+
+    png = gerar_relatorio(formato="png")
+    assert not png["reaproveitado"]
+    pngs = [tmp_path / a for a in png["arquivos"] if a.endswith(".png")]
+    assert len(pngs) == 3
+    assert sum(p.stat().st_size for p in svgs) * 3 < sum(p.stat().st_size for p in pngs)
+    with pytest.raises(ValueError):
+        gerar_relatorio(formato="pdf")
@@ -12,6 +12,8 @@ urlpatterns = [
     path("produtos/adicionar/", views.ProdutosAdicionar.as_view(), name="produtos_adicionar"),
     path("produtos/<int:pk>/editar/", views.ProdutosEditar.as_view(), name="produtos_editar"),
     path("produtos/<int:pk>/remover/", views.ProdutosRemover.as_view(), name="produtos_remover"),
+    path("produtos/autocomplete/", views.ProdutosAutocomplete.as_view(), name="produtos_autocomplete"),
+    path("produtos/facetas/", views.ProdutosFacetas.as_view(), name="produtos_facetas"),
 
     # categorias
     path("categorias/", views.CategoriasLista.as_view(), name="categorias_lista"),
@@ -6,14 +6,24 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib import messages
 from django.apps import apps
 from django.db import transaction
+from django.db.models import F
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse
+from django.utils import timezone
+from datetime import timedelta
 import logging
 
 from django.contrib.auth import get_user_model, login as auth_login, update_session_auth_hash
 from django.contrib.auth.views import LoginView as DjangoLoginView
 
+from inventario_comum.fragmentos import FragmentoMixin
+from inventario_comum.paginacao import PaginadorContagemCacheada, PaginadorSondado, query_sem_pagina
+
 from .models import Produtos, Movimentacao, PerfilUsuario, Categoria
+from .contexto import ContextoUsuario, contexto_do_request
+from .busca import buscar, filtrar, ranquear
+from .facetas import SEM, aplicar_filtros, contar_facetas, facetas_para_exibir, filtros_do_request
 from .forms import (
     ProdutosFormulario,
     MovimentacaoFormulario,
@@ -26,20 +36,19 @@ from .forms import (
 usuarioAtual = logging.getLogger(__name__)
 User = get_user_model()
 
+LIMITE_AUTOCOMPLETE = 20
+LIMITE_AUTOCOMPLETE_MAXIMO = 50
+
 
 # --- Helper de permissão para gerenciar usuários -----------------------------
-def usuario_pode_gerenciar_usuarios(usuario):
-    if not usuario or not getattr(usuario, "is_authenticated", False):
-        return False
-    if getattr(usuario, "is_superuser", False) or getattr(usuario, "is_staff", False):
-        return True
-    try:
-        perfil = getattr(usuario, "perfil", None)
-        if perfil and getattr(perfil, "papel", None) == PerfilUsuario.ROLE_ADMINISTRADOR:
-            return True
-    except Exception:
-        return False
-    return False
+def usuario_pode_gerenciar_usuarios(usuario, request=None):
+    """
+    Superuser/staff ou perfil 'administrador'. Com request, reaproveita o
+    ContextoUsuario memoizado no request.
+    """
+    if request is not None and getattr(request, "user", None) is usuario:
+        return contexto_do_request(request).pode_gerenciar_usuarios
+    return ContextoUsuario(usuario).pode_gerenciar_usuarios
 # -----------------------------------------------------------------------------
 
 
@@ -58,46 +67,93 @@ class LoginViewRedirect(DjangoLoginView):
 
 
 # Produtos views (mantidas; form_valids já garantem save_m2m)
-class ProdutosLista(LoginRequiredMixin, ListView):
+class ProdutosLista(LoginRequiredMixin, FragmentoMixin, ListView):
     model = Produtos
     template_name = "inventario_v1/produtos_lista.html"
+    fragmento_template_name = "inventario_v1/_produtos_lista_fragmento.html"
     context_object_name = "produtos"
     paginate_by = 20
+    paginator_class = PaginadorContagemCacheada
+    # 4 consultas de facetas quando o cache está frio
+    max_consultas = 10
+
+    # ordenações aceitas em ?ordem=, todas apoiadas nos contadores indexados de Produtos
+    ORDENACOES = {
+        "nome": ("nome",),
+        # nunca movimentados (NULL) por último em qualquer banco; pk desempata
+        "recentes": (F("ultima_movimentacao_em").desc(nulls_last=True), "pk"),
+        "ativos": ("-total_movimentacoes", "nome"),
+    }
+
+    def get_ordenacao(self):
+        ordem = self.request.GET.get("ordem", "nome")
+        return ordem if ordem in self.ORDENACOES else "nome"
+
+    def get_base_queryset(self):
+        """Produtos visíveis com ?dias= e ?q= aplicados: a base da lista e das facetas."""
+        qs = Produtos.objects.visiveis_para(self.request.user)
+        # ?dias=N: apenas produtos movimentados nos últimos N dias
+        dias = self.request.GET.get("dias", "").strip()
+        if dias:
+            try:
+                dias_int = int(dias)
+            except ValueError:
+                dias_int = None
+            if dias_int is not None and dias_int > 0:
+                qs = qs.filter(ultima_movimentacao_em__gte=timezone.now() - timedelta(days=dias_int))
+        # índice full-text (busca.py); só o filtro, a relevância é anotada em get_queryset
+        return filtrar(qs, self.request.GET.get("q", "").strip())
+
+    def get_filtros(self):
+        if not hasattr(self, "_filtros"):
+            self._filtros = filtros_do_request(self.request.GET)
+        return self._filtros
+
+    def get_tabelas_permitidas(self):
+        """None para quem gerencia usuários (todas); senão os pks das tabelas permitidas."""
+        if usuario_pode_gerenciar_usuarios(self.request.user, request=self.request):
+            return None
+        return contexto_do_request(self.request).tabelas_permitidas
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by("nome")
+        filtros = self.get_filtros()
+        tabela = filtros.get("tabela")
+        if tabela and tabela != SEM:
+            permitidas = self.get_tabelas_permitidas()
+            if permitidas is not None and int(tabela) not in permitidas:
+                messages.warning(self.request, "Você não tem permissão para ver essa tabela de produtos.")
+                return Produtos.objects.none()
+        qs = (
+            aplicar_filtros(self.get_base_queryset(), filtros)
+            .select_related("categoria")
+            .order_by(*self.ORDENACOES[self.get_ordenacao()])
+        )
         q = self.request.GET.get("q", "").strip()
         if q:
-            qs = qs.filter(nome__icontains=q)
-        categoria_pk = self.request.GET.get("categoria")
-        if categoria_pk:
-            qs = qs.filter(categoria__pk=categoria_pk)
-
-        tabela_pk = self.request.GET.get("tabela")
-        if tabela_pk:
-            from django.apps import apps as _apps
-            try:
-                TabelaProdutos = _apps.get_model("inventario_v1", "TabelaProdutos")
-            except Exception:
-                TabelaProdutos = None
-
-            if TabelaProdutos is not None:
-                try:
-                    tabela_pk_int = int(tabela_pk)
-                except Exception:
-                    tabela_pk_int = None
-                if tabela_pk_int is not None:
-                    if not usuario_pode_gerenciar_usuarios(self.request.user):
-                        try:
-                            perfil = getattr(self.request.user, "perfil", None)
-                            if perfil is None or not perfil.tabelas_permitidas.filter(pk=tabela_pk_int).exists():
-                                messages.warning(self.request, "Você não tem permissão para ver essa tabela de produtos.")
-                                return Produtos.objects.none()
-                        except Exception:
-                            return Produtos.objects.none()
-                    qs = qs.filter(tabelas__pk=tabela_pk_int)
+            # sem ?ordem= explícito, os mais relevantes vêm primeiro
+            qs = ranquear(qs, q, ordenar="ordem" not in self.request.GET)
         return qs
 
+    def get_facetas(self):
+        contagens = contar_facetas(self.get_base_queryset(), self.get_filtros(), self.get_tabelas_permitidas())
+        return facetas_para_exibir(contagens, self.get_filtros(), self.request.GET)
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["ordem"] = self.get_ordenacao()
+        ctx["dias"] = self.request.GET.get("dias", "")
+        ctx["filtros"] = self.get_filtros()
+        ctx["facetas"] = self.get_facetas()
+        ctx["query_sem_pagina"] = query_sem_pagina(self.request.GET)
+        return ctx
+
+
+class ProdutosFacetas(ProdutosLista):
+    """GET com os mesmos parâmetros da lista -> {"facetas": [...]} (ver facetas.py)."""
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({"facetas": self.get_facetas()})
+
 
 class ProdutosAdicionar(LoginRequiredMixin, CreateView):
     model = Produtos
@@ -133,6 +189,9 @@ class ProdutosEditar(LoginRequiredMixin, UpdateView):
         messages.success(self.request, "Produto atualizado com sucesso.")
         return redirect(self.get_success_url())
 
+    def get_queryset(self):
+        return Produtos.objects.visiveis_para(self.request.user)
+
 
 class ProdutosRemover(LoginRequiredMixin, DeleteView):
     model = Produtos
@@ -140,6 +199,9 @@ class ProdutosRemover(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy("inventario_v1:produtos_lista")
     form_class = ConfirmForm
 
+    def get_queryset(self):
+        return Produtos.objects.visiveis_para(self.request.user)
+
     def form_valid(self, form):
         obj = self.get_object()
         usuarioAtual.info("Produto excluído: %s por %s", obj, self.request.user)
@@ -153,6 +215,8 @@ class CategoriasLista(LoginRequiredMixin, ListView):
     template_name = "inventario_v1/categorias_lista.html"
     context_object_name = "categorias"
     paginate_by = 30
+    paginator_class = PaginadorContagemCacheada
+    max_consultas = 5
 
     def get_queryset(self):
         return super().get_queryset().order_by("nome")
@@ -194,25 +258,65 @@ class CategoriaRemover(LoginRequiredMixin, DeleteView):
         return super().form_valid(form)
 
 
+class ProdutosAutocomplete(LoginRequiredMixin, View):
+    """
+    GET ?q=&limite= -> {"resultados": [{id, texto}]} com os produtos visíveis para o
+    usuário (até `limite`, no máximo LIMITE_AUTOCOMPLETE_MAXIMO), buscados pelo índice
+    full-text. Alimenta os campos de produto dos formulários de movimentação.
+    """
+    max_consultas = 5
+
+    def get(self, request):
+        try:
+            limite = int(request.GET.get("limite", LIMITE_AUTOCOMPLETE))
+        except ValueError:
+            limite = LIMITE_AUTOCOMPLETE
+        limite = min(max(limite, 1), LIMITE_AUTOCOMPLETE_MAXIMO)
+        qs = Produtos.objects.visiveis_para(request.user).order_by("nome")
+        q = request.GET.get("q", "").strip()
+        if q:
+            qs = buscar(qs, q)
+        resultados = [{"id": pk, "texto": nome} for pk, nome in qs.values_list("pk", "nome")[:limite]]
+        return JsonResponse({"resultados": resultados})
+
+
 # Movimentações
-class MovimentacoesLista(LoginRequiredMixin, ListView):
+class MovimentacoesLista(LoginRequiredMixin, FragmentoMixin, ListView):
     model = Movimentacao
     template_name = "inventario_v1/movimentacoes_lista.html"
+    fragmento_template_name = "inventario_v1/_movimentacoes_lista_fragmento.html"
     context_object_name = "movimentacoes"
     paginate_by = 30
+    # só "anterior/próxima": sem COUNT sobre o histórico inteiro
+    paginator_class = PaginadorSondado
     ordering = ["-criado_em"]
+    max_consultas = 6
 
     def get_queryset(self):
-        qs = super().get_queryset().select_related("produto", "usuario").order_by("-criado_em")
-        produto_pk = self.request.GET.get("produto")
-        if produto_pk:
+        qs = (
+            super().get_queryset()
+            .filter(produto__in=Produtos.objects.visiveis_para(self.request.user))
+            .select_related("produto", "usuario")
+            .order_by("-criado_em")
+        )
+        produto_pk = self.request.GET.get("produto", "").strip()
+        if produto_pk.isdigit():
             qs = qs.filter(produto__pk=produto_pk)
         return qs
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx["products_list"] = Produtos.objects.all().order_by("nome")
-        ctx["selected_prod"] = self.request.GET.get("produto", "")
+        # o filtro por produto usa autocomplete (ProdutosAutocomplete); só o selecionado é carregado
+        selecionado = self.request.GET.get("produto", "").strip()
+        ctx["selected_prod"] = selecionado
+        ctx["query_sem_pagina"] = query_sem_pagina(self.request.GET)
+        ctx["selected_prod_nome"] = ""
+        # o nome só aparece no formulário de filtro, que não faz parte do fragmento
+        if selecionado.isdigit() and not self.eh_fragmento():
+            ctx["selected_prod_nome"] = (
+                Produtos.objects.visiveis_para(self.request.user).filter(pk=selecionado).values_list("nome", flat=True).first()
+                or ""
+            )
         return ctx
 
 
@@ -229,6 +333,11 @@ class MovimentacaoAdicionar(LoginRequiredMixin, CreateView):
             initial["produto"] = produto_pk
         return initial
 
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        form.fields["produto"].queryset = Produtos.objects.visiveis_para(self.request.user)
+        return form
+
     def form_valid(self, form):
         mov = form.save(commit=False)
         mov.usuario = self.request.user
@@ -250,6 +359,14 @@ class MovimentacaoRemover(LoginRequiredMixin, DeleteView):
     template_name = "inventario_v1/movimentacoes_remover.html"
     success_url = reverse_lazy("inventario_v1:movimentacoes_lista")
     form_class = ConfirmForm
+    # a confirmação; o POST reverte o estoque dentro de uma transação
+    max_consultas = {"GET": 5}
+
+    def get_queryset(self):
+        # só movimentações de produtos visíveis; __str__ usa o nome do produto
+        return Movimentacao.objects.select_related("produto").filter(
+            produto__in=Produtos.objects.visiveis_para(self.request.user)
+        )
 
     def form_valid(self, form):
         obj = self.get_object()
@@ -268,15 +385,15 @@ class ProdutosDescricao(LoginRequiredMixin, ListView):
     model = Movimentacao
     template_name = "inventario_v1/produtos_descricao.html"
     context_object_name = "movimentacoes"
+    max_consultas = 6
 
     def get_queryset(self):
-        produto_pk = self.kwargs.get("pk")
-        produto = get_object_or_404(Produtos, pk=produto_pk)
-        return produto.movimentacoes.select_related("usuario").order_by("-criado_em")
+        self.produto = get_object_or_404(Produtos.objects.visiveis_para(self.request.user), pk=self.kwargs.get("pk"))
+        return self.produto.movimentacoes.select_related("usuario").order_by("-criado_em")
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx["produto"] = get_object_or_404(Produtos, pk=self.kwargs.get("pk"))
+        ctx["produto"] = self.produto
         return ctx
 
 
@@ -285,16 +402,17 @@ class UsuariosLista(LoginRequiredMixin, ListView):
     model = apps.get_model("auth", "User")
     template_name = "inventario_v1/usuarios_lista.html"
     context_object_name = "perfis"
+    max_consultas = 5
 
     def get_queryset(self):
-        if usuario_pode_gerenciar_usuarios(self.request.user):
+        if usuario_pode_gerenciar_usuarios(self.request.user, request=self.request):
             return PerfilUsuario.objects.select_related("usuario").all().order_by("usuario__username")
         perfil, _ = PerfilUsuario.objects.get_or_create(usuario=self.request.user)
         return PerfilUsuario.objects.filter(pk=perfil.pk)
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx["can_manage_users"] = usuario_pode_gerenciar_usuarios(self.request.user)
+        ctx["can_manage_users"] = usuario_pode_gerenciar_usuarios(self.request.user, request=self.request)
         return ctx
 
 
@@ -306,18 +424,18 @@ class UsuariosEditar(LoginRequiredMixin, UpdateView):
 
     def get_object(self, queryset=None):
         pk = self.kwargs.get("pk")
-        if pk and usuario_pode_gerenciar_usuarios(self.request.user):
+        if pk and usuario_pode_gerenciar_usuarios(self.request.user, request=self.request):
             return get_object_or_404(PerfilUsuario, pk=pk)
         perfil, _ = PerfilUsuario.objects.get_or_create(usuario=self.request.user)
         return perfil
 
     def get_form(self, form_class=None):
         form = super().get_form(form_class)
-        can_manage = usuario_pode_gerenciar_usuarios(self.request.user)
+        can_manage = usuario_pode_gerenciar_usuarios(self.request.user, request=self.request)
         editing_pk = self.kwargs.get("pk")
         editing_other = False
         try:
-            editing_other = bool(editing_pk and int(editing_pk) != getattr(self.request.user, "perfil", None).pk)
+            editing_other = bool(editing_pk and int(editing_pk) != contexto_do_request(self.request).perfil.pk)
         except Exception:
             editing_other = False
 
@@ -446,6 +564,9 @@ class UsuariosEditar(LoginRequiredMixin, UpdateView):
 # Relatórios e Registro (mantidos)
 class Relatorios(LoginRequiredMixin, View):
     template_name = "inventario_v1/relatorios.html"
+    # inclui gerar o relatório quando não está no cache (consultas agrupadas)
+    max_consultas = 6
+
     def get(self, request):
         param_tabelas = request.GET.get("tabelas", "")
         usuario = request.GET.get("usuario", "") or None
@@ -463,7 +584,7 @@ class Relatorios(LoginRequiredMixin, View):
             contexto = {"gerado_em": None, "url_html": "", "url_json": "", "arquivos": [], "diretorio_saida": None}
             return render(request, self.template_name, contexto)
         try:
-            resultado = gerar_relatorio(pks_tabelas=pks_tabelas, usuario=usuario)
+            resultado = gerar_relatorio(pks_tabelas=pks_tabelas, usuario=usuario, visivel_para=request.user)
         except Exception as exc:
             usuarioAtual.exception("Erro ao gerar relatório: %s", exc)
             messages.error(request, f"Erro ao gerar relatório: {exc}")
@@ -1,12 +1,15 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
-from .models import Produtos, Movimentacao, Categoria, PerfilUsuario, TabelaProdutos
+
+from inventario_comum.admin_duplicatas import DuplicatasAdminMixin
+
+from .models import ArquivoRelatorio, Produtos, Movimentacao, Categoria, PerfilUsuario, TabelaProdutos
 
 User = get_user_model()
 
 
 @admin.register(Produtos)
-class ProdutosAdmin(admin.ModelAdmin):
+class ProdutosAdmin(DuplicatasAdminMixin, admin.ModelAdmin):
     list_display = ("id", "nome", "tabela", "categoria", "quantidade", "preco", "criado_em")
     search_fields = ("nome", "categoria__nome", "tabela__nome")
     readonly_fields = ("criado_em", "atualizado_em")
@@ -36,4 +39,19 @@ class TabelaProdutosAdmin(admin.ModelAdmin):
 @admin.register(PerfilUsuario)
 class PerfilUsuarioAdmin(admin.ModelAdmin):
     list_display = ("id", "usuario", "papel", "criado_em")
-    search_fields = ("usuario__username", "papel")
\ No newline at end of file
+    search_fields = ("usuario__username", "papel")
+
+
+@admin.register(ArquivoRelatorio)
+class ArquivoRelatorioAdmin(admin.ModelAdmin):
+    # somente leitura: gravado por relatorios.gerar_relatorio e indexar_relatorios
+    list_display = ("nome", "pasta", "dono", "escopo", "tamanho", "gerado_em")
+    search_fields = ("nome", "dono__username")
+    list_filter = ("compartilhado",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class InventarioV1Config(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventario_v2'
+
+    def ready(self):
+        # registra os receivers de invalidação do cache de permissões
+        from . import signals  # noqa: F401
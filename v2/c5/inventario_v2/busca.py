@@ -0,0 +1,203 @@
+"""
+Busca textual de produtos (nome, descrição e categoria) com índice full-text.
+
+No SQLite o índice é uma tabela virtual FTS5 (rowid = pk do produto, tokenizer
+unicode61 sem acentos e índice de prefixos); no Postgres é uma tabela com um
+tsvector por produto e índice GIN. Os textos são gravados já normalizados
+(minúsculos, sem acentos), então "pecas" encontra "Peças" nos dois bancos, e
+cada termo da busca casa por prefixo ("perif" -> "Periféricos").
+
+O índice é mantido pelos receivers em signals.py, na mesma conexão/transação do
+save/delete do produto. Escritas que não disparam signals (bulk_create, update)
+precisam de `python manage.py reindexar_busca`. Em outros bancos a busca cai para
+icontains em nome/descrição/categoria.
+"""
+import re
+
+from django.db import connection as conexao_padrao
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from inventario_comum.texto import normalizar
+
+TABELA_BUSCA = "inventario_v2_produtos_busca"
+TABELA_PRODUTOS = "inventario_v2_produtos"
+
+# pesos de relevância por coluna: nome, descrição, categoria
+PESOS = (10.0, 1.0, 4.0)
+LOTE_INDEXACAO = 1000
+# quantos resultados recebem posição de relevância; o restante vem depois, na ordenação normal
+LIMITE_RANKING = 200
+
+
+def suportado(connection=None):
+    return (connection or conexao_padrao).vendor in ("sqlite", "postgresql")
+
+
+def termos(texto):
+    return re.findall(r"\w+", normalizar(texto))
+
+
+def criar_estrutura(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_BUSCA} USING fts5("
+                "nome, descricao, categoria, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        elif connection.vendor == "postgresql":
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABELA_BUSCA} ("
+                f"produto_id bigint PRIMARY KEY REFERENCES {TABELA_PRODUTOS} (id) ON DELETE CASCADE, "
+                "documento tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {TABELA_BUSCA}_documento_idx ON {TABELA_BUSCA} USING GIN (documento)"
+            )
+
+
+def remover_estrutura(connection):
+    if suportado(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABELA_BUSCA}")
+
+
+def indexar_linhas(linhas, connection=None):
+    """
+    Grava/atualiza no índice as linhas (pk, nome, descricao, nome_da_categoria).
+    """
+    connection = connection or conexao_padrao
+    if not suportado(connection):
+        return
+    linhas = [(pk, normalizar(nome), normalizar(descricao), normalizar(categoria)) for pk, nome, descricao, categoria in linhas]
+    if not linhas:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            # tabelas virtuais não aceitam UPSERT: remove e insere de novo
+            cursor.executemany(f"DELETE FROM {TABELA_BUSCA} WHERE rowid = %s", [(linha[0],) for linha in linhas])
+            cursor.executemany(
+                f"INSERT INTO {TABELA_BUSCA} (rowid, nome, descricao, categoria) VALUES (%s, %s, %s, %s)", linhas
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {TABELA_BUSCA} (produto_id, documento) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'C') "
+                "|| setweight(to_tsvector('simple', %s), 'B')) "
+                "ON CONFLICT (produto_id) DO UPDATE SET documento = EXCLUDED.documento",
+                linhas,
+            )
+
+
+def remover_do_indice(pks, connection=None):
+    connection = connection or conexao_padrao
+    pks = list(pks)
+    if not pks or not suportado(connection):
+        return
+    coluna = "rowid" if connection.vendor == "sqlite" else "produto_id"
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABELA_BUSCA} WHERE {coluna} = %s", [(pk,) for pk in pks])
+
+
+def limpar_indice(connection=None):
+    connection = connection or conexao_padrao
+    if suportado(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABELA_BUSCA}")
+
+
+def indexar_em_lotes(linhas, connection=None, lote=LOTE_INDEXACAO):
+    """Indexa um iterável (possivelmente grande) de linhas em lotes; retorna o total."""
+    total = 0
+    pendentes = []
+    for linha in linhas:
+        pendentes.append(linha)
+        if len(pendentes) >= lote:
+            indexar_linhas(pendentes, connection=connection)
+            total += len(pendentes)
+            pendentes = []
+    indexar_linhas(pendentes, connection=connection)
+    return total + len(pendentes)
+
+
+def indexar_produtos(produtos_qs, lote=LOTE_INDEXACAO):
+    """Reindexa os produtos do queryset; retorna quantos foram gravados."""
+    linhas = produtos_qs.order_by("pk").values_list("pk", "nome", "descricao", "categoria__nome")
+    return indexar_em_lotes(linhas.iterator(chunk_size=lote), lote=lote)
+
+
+def _consulta_fts(termos_busca, vendor):
+    if vendor == "sqlite":
+        # cada termo entre aspas (sem operadores FTS5) e com * para casar por prefixo
+        return " ".join(f'"{t}"*' for t in termos_busca)
+    return " & ".join(f"{t}:*" for t in termos_busca)
+
+
+def _sql_busca(vendor):
+    """(SQL dos ids que casam, SQL dos ids mais relevantes com LIMIT)."""
+    if vendor == "sqlite":
+        pesos = ", ".join(str(p) for p in PESOS)
+        base = f"SELECT rowid FROM {TABELA_BUSCA} WHERE {TABELA_BUSCA} MATCH %s"
+        return base, f"{base} ORDER BY bm25({TABELA_BUSCA}, {pesos}) LIMIT %s"
+    base = f"SELECT produto_id FROM {TABELA_BUSCA} WHERE documento @@ to_tsquery('simple', %s)"
+    return base, f"{base} ORDER BY ts_rank(documento, to_tsquery('simple', %s)) DESC LIMIT %s"
+
+
+def filtrar(qs, texto):
+    """
+    Só o filtro da busca: produtos do queryset em que todos os termos de `texto`
+    casam. É um IN sobre o índice (conjunto completo, compõe com visibilidade,
+    facetas e paginação) e não calcula relevância.
+    """
+    termos_busca = termos(texto)
+    if not termos_busca:
+        return qs
+    vendor = conexao_padrao.vendor
+    if vendor in ("sqlite", "postgresql"):
+        sql_ids, _ = _sql_busca(vendor)
+        return qs.filter(pk__in=RawSQL(sql_ids, (_consulta_fts(termos_busca, vendor),)))
+    for termo in texto.split():
+        qs = qs.filter(Q(nome__icontains=termo) | Q(descricao__icontains=termo) | Q(categoria__nome__icontains=termo))
+    return qs
+
+
+def ranquear(qs, texto, ordenar=True):
+    """
+    Anota `relevancia` (0 = mais relevante) num queryset já filtrado por
+    filtrar(); com ordenar=True a relevância passa a ser o primeiro critério da
+    ordenação atual.
+
+    A relevância vem de uma consulta separada que ordena só os LIMITE_RANKING
+    melhores resultados no índice. Ranquear cada linha com uma subconsulta
+    correlacionada reavaliaria o MATCH por linha e não escala.
+    """
+    termos_busca = termos(texto)
+    if not termos_busca:
+        return qs
+    vendor = conexao_padrao.vendor
+    if vendor in ("sqlite", "postgresql"):
+        consulta = _consulta_fts(termos_busca, vendor)
+        _, sql_ranking = _sql_busca(vendor)
+        parametros = (consulta,) if vendor == "sqlite" else (consulta, consulta)
+        with conexao_padrao.cursor() as cursor:
+            cursor.execute(sql_ranking, (*parametros, LIMITE_RANKING))
+            melhores = [linha[0] for linha in cursor.fetchall()]
+        relevancia = Case(
+            *(When(pk=pk, then=Value(posicao)) for posicao, pk in enumerate(melhores)),
+            default=Value(LIMITE_RANKING),
+            output_field=IntegerField(),
+        )
+    else:
+        relevancia = Value(0, output_field=IntegerField())
+    qs = qs.annotate(relevancia=relevancia)
+    if ordenar:
+        qs = qs.order_by("relevancia", *(qs.query.order_by or qs.model._meta.ordering))
+    return qs
+
+
+def buscar(qs, texto, ordenar=True):
+    """
+    Filtra o queryset de Produtos pelos termos de `texto` (todos precisam casar) e
+    anota `relevancia`; ver filtrar() e ranquear().
+    """
+    return ranquear(filtrar(qs, texto), texto, ordenar=ordenar)
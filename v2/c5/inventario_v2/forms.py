@@ -1,6 +1,9 @@
 from django import forms
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm
+
+from inventario_comum.autocomplete import campo_autocomplete
+
 from .models import Produtos, Movimentacao, Categoria, PerfilUsuario, TabelaProdutos
 
 User = get_user_model()
@@ -16,6 +19,7 @@ class MovimentacaoFormulario(forms.ModelForm):
     class Meta:
         model = Movimentacao
         fields = ["produto", "tipo", "quantidade", "descricao"]
+        widgets = {"produto": campo_autocomplete("inventario_v2:produtos_autocomplete", "opcoes-produto")}
 
     def clean(self):
         cleaned = super().clean()
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from inventario_v2.relatorios import indexar_pasta, pasta_relatorios
+
+
+class Command(BaseCommand):
+    help = (
+        "Sincroniza o manifesto de relatórios (ArquivoRelatorio) com MEDIA_ROOT/relatorios.\n"
+        "Necessário para arquivos que não vieram de gerar_relatorio (cópias, relatórios antigos).\n"
+        "Uso: python manage.py indexar_relatorios"
+    )
+
+    def handle(self, *args, **options):
+        pasta = pasta_relatorios()
+        novos, atualizados, removidos = indexar_pasta(pasta)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Manifesto de {pasta}: {novos} novo(s), {atualizados} atualizado(s), {removidos} removido(s)."
+            )
+        )
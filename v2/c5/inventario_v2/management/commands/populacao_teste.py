@@ -328,4 +328,10 @@ class Command(BaseCommand):
                     continue
 
         self.stdout.write(self.style.SUCCESS(f"-> Finalizado: {mov_created} movimentações criadas."))
+        # a limpeza roda com signals mutados: reconstrói o índice de busca por inteiro
+        try:
+            call_command("reindexar_busca", stdout=self.stdout)
+        except Exception as exc:
+            self.stdout.write(self.style.WARNING(f"  - Índice de busca não reconstruído: {exc}"))
+
         self.stdout.write(self.style.SUCCESS("-> População de teste concluída."))
\ No newline at end of file
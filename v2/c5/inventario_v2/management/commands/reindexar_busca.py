@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from inventario_v2 import busca
+from inventario_v2.models import Produtos
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói o índice full-text de produtos (nome, descrição e categoria) usado pela busca.\n"
+        "Necessário após escritas que não disparam signals (bulk_create, update, importações).\n"
+        "Uso: python manage.py reindexar_busca [--lote N]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=busca.LOTE_INDEXACAO, help="Produtos por lote de escrita")
+
+    def handle(self, *args, **options):
+        if not busca.suportado(connection):
+            raise CommandError(f"Busca full-text não suportada no banco '{connection.vendor}' (usa icontains).")
+        lote = max(1, int(options.get("lote") or busca.LOTE_INDEXACAO))
+        # numa transação: buscas concorrentes continuam vendo o índice antigo até o commit
+        with transaction.atomic():
+            busca.limpar_indice()
+            total = busca.indexar_produtos(Produtos.objects.all(), lote=lote)
+        self.stdout.write(self.style.SUCCESS(f"Índice de busca reconstruído com {total} produto(s)."))
@@ -0,0 +1,84 @@
+# Índice full-text de produtos (FTS5 no SQLite, tsvector + GIN no Postgres).
+# DDL e carga inicial congelados aqui: mudanças futuras em busca.py não alteram esta migração.
+
+import unicodedata
+
+from django.db import migrations
+
+TABELA_BUSCA = "inventario_v2_produtos_busca"
+TABELA_PRODUTOS = "inventario_v2_produtos"
+LOTE = 1000
+
+
+def _normalizar(texto):
+    decomposto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def _gravar(cursor, vendor, linhas):
+    linhas = [(pk, _normalizar(nome), _normalizar(descricao), _normalizar(categoria)) for pk, nome, descricao, categoria in linhas]
+    if not linhas:
+        return
+    if vendor == "sqlite":
+        cursor.executemany(
+            f"INSERT INTO {TABELA_BUSCA} (rowid, nome, descricao, categoria) VALUES (%s, %s, %s, %s)", linhas
+        )
+    else:
+        cursor.executemany(
+            f"INSERT INTO {TABELA_BUSCA} (produto_id, documento) VALUES (%s, "
+            "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'C') "
+            "|| setweight(to_tsvector('simple', %s), 'B')) "
+            "ON CONFLICT (produto_id) DO UPDATE SET documento = EXCLUDED.documento",
+            linhas,
+        )
+
+
+def criar_indice(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ("sqlite", "postgresql"):
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_BUSCA} USING fts5("
+                "nome, descricao, categoria, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        else:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABELA_BUSCA} ("
+                f"produto_id bigint PRIMARY KEY REFERENCES {TABELA_PRODUTOS} (id) ON DELETE CASCADE, "
+                "documento tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {TABELA_BUSCA}_documento_idx ON {TABELA_BUSCA} USING GIN (documento)"
+            )
+
+        Produtos = apps.get_model("inventario_v2", "Produtos")
+        linhas = Produtos.objects.using(connection.alias).order_by("pk").values_list(
+            "pk", "nome", "descricao", "categoria__nome"
+        )
+        lote = []
+        for linha in linhas.iterator(chunk_size=LOTE):
+            lote.append(linha)
+            if len(lote) >= LOTE:
+                _gravar(cursor, connection.vendor, lote)
+                lote = []
+        _gravar(cursor, connection.vendor, lote)
+
+
+def remover_indice(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor in ("sqlite", "postgresql"):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABELA_BUSCA}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario_v2', '0003_alter_movimentacao_options_alter_produtos_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
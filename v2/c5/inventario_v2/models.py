@@ -79,6 +79,25 @@ class PerfilUsuario(models.Model):
         return f"{self.usuario.username} — {self.get_papel_display()}"
 
 
+class ProdutosQuerySet(models.QuerySet):
+    def visiveis_para(self, usuario):
+        """
+        Produtos que `usuario` pode ver: todos para superuser/staff/ADMIN; para os demais,
+        produtos sem tabela ou de tabelas que ele possui/acessa. As tabelas vêm do
+        cache de permissões, então o filtro é um único IN sem JOIN nem DISTINCT.
+        """
+        from .permissoes import permissoes_efetivas
+
+        if not usuario or not getattr(usuario, "is_authenticated", False):
+            return self.none()
+        if usuario.is_superuser or usuario.is_staff:
+            return self.all()
+        permissoes = permissoes_efetivas(usuario)
+        if permissoes["papel"] == PerfilUsuario.ROLE_ADMIN:
+            return self.all()
+        return self.filter(models.Q(tabela__isnull=True) | models.Q(tabela_id__in=permissoes["tabelas"]))
+
+
 class Produtos(models.Model):
     nome = models.CharField("Nome", max_length=200)
     descricao = models.TextField("Descrição", blank=True)
@@ -89,6 +108,8 @@ class Produtos(models.Model):
     criado_em = models.DateTimeField("Criado em", auto_now_add=True)
     atualizado_em = models.DateTimeField("Atualizado em", auto_now=True)
 
+    objects = ProdutosQuerySet.as_manager()
+
     class Meta:
         ordering = ["nome"]
 
@@ -172,4 +193,48 @@ class Movimentacao(models.Model):
         super().delete(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.get_tipo_display()} de {self.quantidade} — {self.produto.nome}"
\ No newline at end of file
+        return f"{self.get_tipo_display()} de {self.quantidade} — {self.produto.nome}"
+
+
+class ArquivoRelatorioQuerySet(models.QuerySet):
+    def visiveis_para(self, usuario):
+        """Staff vê todos; os demais, os próprios relatórios e os compartilhados (gerais)."""
+        if not usuario or not getattr(usuario, "is_authenticated", False):
+            return self.none()
+        if usuario.is_superuser or usuario.is_staff:
+            return self.all()
+        return self.filter(models.Q(dono=usuario) | models.Q(compartilhado=True))
+
+
+class ArquivoRelatorio(models.Model):
+    """
+    Manifesto dos relatórios gerados: uma linha por arquivo (pasta, nome), gravada
+    por relatorios.gerar_relatorio ao terminar. A página de relatórios consulta só
+    esta tabela; arquivos copiados à mão entram com `manage.py indexar_relatorios`.
+    """
+    pasta = models.CharField("Pasta", max_length=500)
+    nome = models.CharField("Nome", max_length=255)
+    dono = models.ForeignKey(
+        settings.AUTH_USER_MODEL, verbose_name="Dono", null=True, blank=True,
+        on_delete=models.SET_NULL, related_name="arquivos_relatorio",
+    )
+    # "todos" ou pks das tabelas, separados por vírgula; vazio quando desconhecido
+    escopo = models.TextField("Escopo", blank=True)
+    compartilhado = models.BooleanField("Compartilhado", default=False)
+    tamanho = models.PositiveBigIntegerField("Tamanho (bytes)", default=0)
+    gerado_em = models.DateTimeField("Gerado em")
+    criado_em = models.DateTimeField("Criado em", auto_now_add=True)
+
+    objects = ArquivoRelatorioQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["pasta", "nome"], name="arquivo_relatorio_unico"),
+        ]
+        # listagem da página: pasta, mais recentes primeiro
+        indexes = [
+            models.Index(fields=["pasta", "-gerado_em", "nome"], name="arquivo_relatorio_recentes_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.pasta}/{self.nome}"
@@ -1,37 +1,118 @@
+"""
+Relatórios gerados e o manifesto deles.
+
+Cada arquivo gerado é gravado no manifesto (models.ArquivoRelatorio) com dono,
+escopo (tabelas), tamanho e data. RelatoriosIndex lista o manifesto com uma
+consulta paginada, sem ler MEDIA_ROOT/relatorios. Arquivos que chegam à pasta
+por outro caminho entram com `manage.py indexar_relatorios`, que também remove
+do manifesto o que sumiu do disco.
+"""
 from __future__ import annotations
 
+from datetime import datetime, timezone as dt_timezone
 import json
 from pathlib import Path
 from typing import Optional, Dict, Any
 
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.utils import timezone
 
+from .models import ArquivoRelatorio
+
+
+def pasta_relatorios() -> Path:
+    """MEDIA_ROOT/relatorios, absoluta, como é guardada no manifesto."""
+    media_root = getattr(settings, "MEDIA_ROOT", None)
+    if not media_root:
+        raise RuntimeError("MEDIA_ROOT not configured; pass out_dir or set settings.MEDIA_ROOT")
+    return (Path(media_root) / "relatorios").resolve()
+
+
+def _modificado_em(info) -> datetime:
+    return datetime.fromtimestamp(info.st_mtime, tz=dt_timezone.utc)
+
+
+def registrar_arquivos(pasta, nomes, dono=None, escopo: str = "") -> None:
+    """
+    Grava no manifesto os arquivos `nomes` recém-gerados em `pasta` (tamanho e
+    data lidos do disco). Sem dono, o relatório é geral e todos o veem.
+    """
+    pasta = Path(pasta).resolve()
+    linhas = []
+    for nome in nomes:
+        info = (pasta / nome).stat()
+        linhas.append(
+            ArquivoRelatorio(
+                pasta=str(pasta), nome=nome, dono=dono, escopo=escopo, compartilhado=dono is None,
+                tamanho=info.st_size, gerado_em=_modificado_em(info),
+            )
+        )
+    ArquivoRelatorio.objects.bulk_create(
+        linhas,
+        update_conflicts=True,
+        unique_fields=["pasta", "nome"],
+        update_fields=["dono", "escopo", "compartilhado", "tamanho", "gerado_em"],
+    )
+
+
+def indexar_pasta(pasta) -> tuple:
+    """
+    Sincroniza o manifesto com o conteúdo de `pasta`: arquivos novos entram como
+    gerais (compartilhados), os conhecidos têm tamanho e data atualizados e os
+    que sumiram saem. Devolve (novos, atualizados, removidos).
+    """
+    pasta = Path(pasta).resolve()
+    no_disco = {}
+    if pasta.is_dir():
+        for arquivo in pasta.iterdir():
+            if arquivo.is_file() and not arquivo.name.startswith("."):
+                no_disco[arquivo.name] = arquivo.stat()
+    conhecidos = {a.nome: a for a in ArquivoRelatorio.objects.filter(pasta=str(pasta))}
+
+    novos, atualizados = [], []
+    for nome, info in no_disco.items():
+        if nome in conhecidos:
+            arquivo = conhecidos[nome]
+            arquivo.tamanho, arquivo.gerado_em = info.st_size, _modificado_em(info)
+            atualizados.append(arquivo)
+        else:
+            novos.append(
+                ArquivoRelatorio(
+                    pasta=str(pasta), nome=nome, compartilhado=True,
+                    tamanho=info.st_size, gerado_em=_modificado_em(info),
+                )
+            )
+    sumidos = [nome for nome in conhecidos if nome not in no_disco]
+    with transaction.atomic():
+        ArquivoRelatorio.objects.filter(pasta=str(pasta), nome__in=sumidos).delete()
+        ArquivoRelatorio.objects.bulk_create(novos)
+        ArquivoRelatorio.objects.bulk_update(atualizados, ["tamanho", "gerado_em"])
+    return len(novos), len(atualizados), len(sumidos)
+
 
 def gerar_relatorio(pks_tabelas: Optional[list] = None, usuario: Optional[object] = None, out_dir: Optional[str] = None) -> Dict[str, Any]:
     """
     Função simples de geração de relatórios usada como fallback pelos testes.
     - Cria um diretório MEDIA_ROOT/relatorios (ou out_dir se informado)
     - Gera um arquivo JSON de exemplo (resumo) com timestamp
+    - Registra o arquivo no manifesto (ArquivoRelatorio) com dono e tabelas
     - Retorna um dicionário contendo 'diretorio_saida' (string path)
 
     Observação: esta implementação é propositalmente simples — você pode estender
     para produzir CSV/PNG/PDF conforme necessidade do app.
     """
-    if out_dir:
-        base = Path(out_dir)
-    else:
-        media_root = getattr(settings, "MEDIA_ROOT", None)
-        if not media_root:
-            raise RuntimeError("MEDIA_ROOT not configured; pass out_dir or set settings.MEDIA_ROOT")
-        base = Path(media_root) / "relatorios"
+    base = Path(out_dir) if out_dir else pasta_relatorios()
 
     base.mkdir(parents=True, exist_ok=True)
 
     # usar timezone.now() (aware) em vez de datetime.utcnow() para evitar DeprecationWarning
     now_dt = timezone.now()
     now_stamp = now_dt.strftime("%Y%m%dT%H%M%S")
-    filename = f"relatorio_summary_{now_stamp}.json"
+    dono = usuario if isinstance(usuario, get_user_model()) and usuario.pk else None
+    # relatório de um usuário não pode sobrescrever o geral (nem o de outro) gerado no mesmo segundo
+    filename = f"relatorio_summary_usuario{dono.pk}_{now_stamp}.json" if dono else f"relatorio_summary_{now_stamp}.json"
     filepath = base / filename
 
     summary = {
@@ -44,4 +125,7 @@ def gerar_relatorio(pks_tabelas: Optional[list] = None, usuario: Optional[object
     with filepath.open("w", encoding="utf-8") as fh:
         json.dump(summary, fh, ensure_ascii=False, indent=2)
 
-    return {"diretorio_saida": str(base), "arquivo": str(filepath)}
\ No newline at end of file
+    escopo = ",".join(str(pk) for pk in pks_tabelas) if pks_tabelas else "todos"
+    registrar_arquivos(base, [filename], dono=dono, escopo=escopo)
+
+    return {"diretorio_saida": str(base), "arquivo": str(filepath)}
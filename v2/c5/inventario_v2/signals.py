@@ -0,0 +1,131 @@
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from inventario_comum.paginacao import ajustar_contador, invalidar_contagens
+
+from . import busca
+from .facetas import invalidar_facetas
+from .models import Categoria, PerfilUsuario, Produtos, TabelaProdutos
+from .permissoes import invalidar_permissoes
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+# --- invalidação do cache de permissões (ver permissoes.py) ---
+
+
+@receiver(m2m_changed, sender=TabelaProdutos.acessos.through)
+def tabela_acessos_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        # instance é o usuário (user.tabelas_acesso.add/remove/clear)
+        invalidar_permissoes(instance.pk)
+    elif pk_set:
+        for usuario_pk in pk_set:
+            invalidar_permissoes(usuario_pk)
+    else:
+        # post_clear direto: não sabemos quais usuários perderam acesso
+        invalidar_permissoes()
+
+
+@receiver(post_save, sender=TabelaProdutos)
+@receiver(post_delete, sender=TabelaProdutos)
+def tabela_changed(sender, instance, **kwargs):
+    # troca de owner ou exclusão afeta usuários que não conhecemos aqui
+    invalidar_permissoes()
+
+
+@receiver(post_save, sender=PerfilUsuario)
+@receiver(post_delete, sender=PerfilUsuario)
+def perfil_changed(sender, instance, **kwargs):
+    invalidar_permissoes(instance.usuario_id)
+
+
+@receiver(post_save, sender=User)
+def usuario_criado(sender, instance, created=False, **kwargs):
+    # protege contra reaproveitamento de pk (ex.: SQLite após exclusões)
+    if created:
+        invalidar_permissoes(instance.pk)
+
+
+# --- índice full-text de produtos (ver busca.py); roda na mesma transação do save/delete ---
+
+_PRODUTOS_DA_CATEGORIA_REMOVIDA = {}
+
+
+@receiver(post_save, sender=Produtos)
+def produto_salvo_busca(sender, instance, **kwargs):
+    busca.indexar_produtos(Produtos.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Produtos)
+def produto_removido_busca(sender, instance, **kwargs):
+    busca.remover_do_indice([instance.pk])
+
+
+@receiver(post_save, sender=Categoria)
+def categoria_salva_busca(sender, instance, created=False, **kwargs):
+    # renomear a categoria muda o texto indexado de todos os seus produtos
+    if not created:
+        busca.indexar_produtos(instance.produtos.all())
+
+
+@receiver(pre_delete, sender=Categoria)
+def categoria_pre_delete_busca(sender, instance, **kwargs):
+    _PRODUTOS_DA_CATEGORIA_REMOVIDA[instance.pk] = list(instance.produtos.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Categoria)
+def categoria_removida_busca(sender, instance, **kwargs):
+    pks = _PRODUTOS_DA_CATEGORIA_REMOVIDA.pop(instance.pk, None) or []
+    if pks:
+        busca.indexar_produtos(Produtos.objects.filter(pk__in=pks))
+
+
+# --- invalidação das contagens de facetas (ver facetas.py) ---
+
+
+@receiver(post_save, sender=Produtos)
+@receiver(post_delete, sender=Produtos)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_save, sender=TabelaProdutos)
+@receiver(post_delete, sender=TabelaProdutos)
+def dados_produtos_changed(sender, **kwargs):
+    # movimentações salvam o produto, então também passam por aqui
+    invalidar_facetas()
+
+
+# --- contagens dos paginadores (ver inventario_comum/paginacao.py) ---
+
+
+def _do_app(sender):
+    meta = getattr(sender, "_meta", None)
+    return meta is not None and meta.app_label == "inventario_v2"
+
+
+@receiver(post_save, dispatch_uid="inventario_v2_contagem_salvo")
+def contagem_salvo(sender, instance, created=False, **kwargs):
+    if _do_app(sender):
+        invalidar_contagens()
+        if created:
+            ajustar_contador(sender, 1)
+
+
+@receiver(post_delete, dispatch_uid="inventario_v2_contagem_removido")
+def contagem_removido(sender, instance, **kwargs):
+    if _do_app(sender):
+        invalidar_contagens()
+        ajustar_contador(sender, -1)
+
+
+@receiver(m2m_changed, dispatch_uid="inventario_v2_contagem_m2m")
+def contagem_m2m(sender, action, **kwargs):
+    # tabelas__acessos muda a visibilidade, e portanto as contagens filtradas
+    if action.startswith("post_") and _do_app(sender):
+        invalidar_contagens()
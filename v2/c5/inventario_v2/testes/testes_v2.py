@@ -207,7 +207,8 @@ def test_gerar_relatorio_command_creates_files(tmp_path, settings):
 @pytest.mark.django_db
 def test_report_view_shows_generated_reports(client, django_user_model, tmp_path, settings):
     """
-    Garante que a view de relatórios lista arquivos na pasta MEDIA_ROOT/relatorios.
+    Garante que a view de relatórios lista arquivos na pasta MEDIA_ROOT/relatorios
+    (indexados no manifesto, que é o que a view consulta).
     Usa a rota inventario_v2:relatorios_index como preferida.
     """
     settings.MEDIA_ROOT = str(tmp_path / "media")
@@ -231,6 +232,7 @@ def test_report_view_shows_generated_reports(client, django_user_model, tmp_path
     try:
         dummy_png = reports_dir / "report_dummy.png"
         dummy_png.write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR")
+        call_command("indexar_relatorios")
 
         # tentar rota preferida inventario_v2:relatorios_index
         url_candidates = ("inventario_v2:relatorios_index", "inventario_v1:relatorios")
@@ -0,0 +1,392 @@
+# Testes de desempenho/escala para inventario_v2 (permissões, consultas e relatórios).
+import json
+from io import StringIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from inventario_comum import duplicatas
+from inventario_comum.consultas import OrcamentoConsultasExcedido
+from inventario_v2 import views
+from inventario_v2.facetas import contar_facetas
+from inventario_v2.models import Categoria, Movimentacao, PerfilUsuario, Produtos, TabelaProdutos
+from inventario_v2.permissoes import permissoes_efetivas
+
+User = get_user_model()
+
+
+@pytest.mark.django_db
+def test_permissoes_efetivas_cacheadas_e_invalidadas(django_assert_num_queries):
+    user = User.objects.create_user(username="perm_cache_v2", password="pwd")
+    outro = User.objects.create_user(username="dono_v2", password="pwd")
+    PerfilUsuario.objects.create(usuario=user, papel=PerfilUsuario.ROLE_OPERATOR)
+    tabela = TabelaProdutos.objects.create(nome="T_cache_v2", owner=outro)
+
+    assert permissoes_efetivas(user)["tabelas"] == frozenset()
+    with django_assert_num_queries(0):
+        assert permissoes_efetivas(user)["papel"] == PerfilUsuario.ROLE_OPERATOR
+
+    tabela.acessos.add(user)
+    assert permissoes_efetivas(user)["tabelas"] == frozenset({tabela.pk})
+
+    user.tabelas_acesso.clear()
+    assert permissoes_efetivas(user)["tabelas"] == frozenset()
+
+    tabela.owner = user
+    tabela.save()
+    assert permissoes_efetivas(user)["tabelas"] == frozenset({tabela.pk})
+
+    PerfilUsuario.objects.filter(usuario=user).update(papel=PerfilUsuario.ROLE_ADMIN)
+    # update() não dispara sinais; save() sim
+    perfil = PerfilUsuario.objects.get(usuario=user)
+    perfil.save()
+    assert permissoes_efetivas(user)["papel"] == PerfilUsuario.ROLE_ADMIN
+
+
+@pytest.mark.django_db
+def test_visiveis_para_restringe_lista_e_api(client):
+    user = User.objects.create_user(username="vis_v2", password="pwd")
+    dono = User.objects.create_user(username="vis_dono_v2", password="pwd")
+    PerfilUsuario.objects.create(usuario=user, papel=PerfilUsuario.ROLE_OPERATOR)
+    propria = TabelaProdutos.objects.create(nome="T_vis_propria", owner=user)
+    compartilhada = TabelaProdutos.objects.create(nome="T_vis_comp", owner=dono)
+    alheia = TabelaProdutos.objects.create(nome="T_vis_alheia", owner=dono)
+    compartilhada.acessos.add(user)
+    visiveis = {
+        Produtos.objects.create(nome="Avulso", quantidade=1, preco="1.00"),
+        Produtos.objects.create(nome="Proprio", quantidade=1, preco="1.00", tabela=propria),
+        Produtos.objects.create(nome="Comp", quantidade=1, preco="1.00", tabela=compartilhada),
+    }
+    oculto = Produtos.objects.create(nome="Oculto", quantidade=1, preco="1.00", tabela=alheia)
+
+    assert set(Produtos.objects.visiveis_para(user)) == visiveis
+    client.force_login(user)
+    resp = client.get(reverse("inventario_v2:produtos_lista"))
+    assert set(resp.context["produtos"]) == visiveis
+    resp = client.get(reverse("inventario_v2:api_produto_movimentacoes"), {"produto": oculto.pk})
+    assert resp.status_code == 404
+
+    # movimentações de produtos ocultos não podem ser vistas nem removidas
+    escondida = Movimentacao.objects.create(produto=oculto, tipo=Movimentacao.TIPO_ENTRADA, quantidade=1, usuario=dono)
+    remover = reverse("inventario_v2:movimentacoes_remover", kwargs={"pk": escondida.pk})
+    assert client.get(reverse("inventario_v2:movimentacoes_detalhe", kwargs={"pk": escondida.pk})).status_code == 404
+    assert client.get(remover).status_code == 404
+    assert client.post(remover).status_code == 404
+    assert Movimentacao.objects.filter(pk=escondida.pk).exists()
+    visivel = Movimentacao.objects.create(
+        produto=next(iter(visiveis)), tipo=Movimentacao.TIPO_ENTRADA, quantidade=1, usuario=user
+    )
+    assert client.get(reverse("inventario_v2:movimentacoes_detalhe", kwargs={"pk": visivel.pk})).status_code == 200
+    assert Produtos.objects.visiveis_para(dono).count() == 3
+
+
+@pytest.mark.django_db
+def test_busca_full_text_sem_acentos_e_ranqueada(client):
+    from inventario_v2.busca import buscar
+
+    ferragens = Categoria.objects.create(nome="Ferragens")
+    porca = Produtos.objects.create(nome="Porca M8", quantidade=1, preco="1.00", categoria=ferragens)
+    Produtos.objects.create(nome="Peças avulsas", descricao="inclui porca", quantidade=1, preco="1.00")
+
+    def nomes(texto):
+        return [p.nome for p in buscar(Produtos.objects.all(), texto)]
+
+    assert nomes("porca") == ["Porca M8", "Peças avulsas"]
+    assert nomes("PECA") == ["Peças avulsas"]
+    assert nomes("ferrag") == ["Porca M8"]
+    ferragens.nome = "Fixadores"
+    ferragens.save()
+    assert nomes("fixa") == ["Porca M8"]
+    porca.delete()
+    assert nomes("fixa") == []
+
+    admin = User.objects.create_user(username="busca_v2", password="pwd", is_superuser=True)
+    client.force_login(admin)
+    resp = client.get(reverse("inventario_v2:produtos_lista"), {"q": "pecas"})
+    assert [p.nome for p in resp.context["produtos"]] == ["Peças avulsas"]
+
+
+@pytest.mark.django_db
+def test_autocomplete_de_produtos_e_formulario_sem_lista_completa(client):
+    user = User.objects.create_user(username="auto_v2", password="pwd")
+    PerfilUsuario.objects.create(usuario=user, papel=PerfilUsuario.ROLE_OPERATOR)
+    alheia = TabelaProdutos.objects.create(nome="T_auto_alheia")
+    for i in range(25):
+        Produtos.objects.create(nome=f"Cabo {i:02d}", quantidade=5, preco="1.00")
+    escondido = Produtos.objects.create(nome="Cabo restrito", quantidade=5, preco="1.00", tabela=alheia)
+    client.force_login(user)
+
+    url = reverse("inventario_v2:produtos_autocomplete")
+    assert len(client.get(url, {"q": "cabo"}).json()["resultados"]) == 20
+    assert client.get(url, {"q": "restrito"}).json()["resultados"] == []
+    assert len(client.get(url, {"q": "cabo", "limite": "3"}).json()["resultados"]) == 3
+
+    resp = client.get(reverse("inventario_v2:movimentacoes_adicionar"))
+    assert "Cabo 24" not in resp.content.decode()
+    resp = client.post(
+        reverse("inventario_v2:movimentacoes_adicionar"),
+        {"produto": escondido.pk, "tipo": Movimentacao.TIPO_ENTRADA, "quantidade": 1},
+    )
+    assert resp.status_code == 200 and "produto" in resp.context["form"].errors
+
+
+def _povoar(inicio, fim):
+    """Linhas [inicio, fim) de cada lista, em bulk (sem signals)."""
+    usuarios = User.objects.bulk_create(User(username=f"orc{i:04d}") for i in range(inicio, fim))
+    PerfilUsuario.objects.bulk_create(PerfilUsuario(usuario=u) for u in usuarios)
+    Categoria.objects.bulk_create(Categoria(nome=f"OrcC{i:04d}") for i in range(inicio, fim))
+    tabelas = TabelaProdutos.objects.bulk_create(
+        TabelaProdutos(nome=f"OrcT{i:04d}", owner=u) for i, u in zip(range(inicio, fim), usuarios)
+    )
+    produtos = Produtos.objects.bulk_create(
+        Produtos(nome=f"OrcP{i:04d}", quantidade=i, tabela=t) for i, t in zip(range(inicio, fim), tabelas)
+    )
+    detalhe = Produtos.objects.get(nome="OrcP0000")
+    Movimentacao.objects.bulk_create(
+        Movimentacao(produto=p, usuario=u, tipo=Movimentacao.TIPO_ENTRADA, quantidade=1)
+        for p, u in zip([detalhe] * len(usuarios) + produtos, usuarios * 2)
+    )
+    return detalhe
+
+
+@pytest.mark.django_db
+def test_listas_e_detalhes_com_consultas_constantes(client, settings, monkeypatch):
+    settings.MIDDLEWARE = ["inventario_comum.middleware.OrcamentoConsultasMiddleware", *settings.MIDDLEWARE]
+    settings.ORCAMENTO_CONSULTAS_MODO = "erro"
+    user = User.objects.create_user(username="orc_admin_v2", password="pwd")
+    PerfilUsuario.objects.create(usuario=user, papel=PerfilUsuario.ROLE_ADMIN)
+    detalhe = _povoar(0, 10)
+    movimentacao = detalhe.movimentacoes.first()
+    client.force_login(user)
+    urls = [
+        reverse("inventario_v2:tabelas_lista"),
+        reverse("inventario_v2:produtos_lista"),
+        reverse("inventario_v2:produtos_lista") + "?q=orcp",
+        reverse("inventario_v2:movimentacoes_lista"),
+        reverse("inventario_v2:movimentacoes_detalhe", kwargs={"pk": movimentacao.pk}),
+        reverse("inventario_v2:movimentacoes_remover", kwargs={"pk": movimentacao.pk}),
+        reverse("inventario_v2:produto_movimentacoes", kwargs={"produto_pk": detalhe.pk}),
+        reverse("inventario_v2:categorias_lista"),
+        reverse("inventario_v2:usuarios_lista"),
+        reverse("inventario_v2:relatorios_index"),
+        reverse("inventario_v2:relatorio_produto", kwargs={"produto_pk": detalhe.pk}),
+        reverse("inventario_v2:produtos_autocomplete") + "?q=orc",
+        reverse("inventario_v2:api_produto_movimentacoes") + f"?produto={detalhe.pk}",
+    ]
+
+    def consultas():
+        contagens = []
+        for url in urls:
+            with CaptureQueriesContext(connection) as ctx:
+                assert client.get(url).status_code == 200, url
+            contagens.append(len(ctx))
+        return contagens
+
+    consultas()  # aquece o cache de permissões
+    poucas = consultas()
+    _povoar(10, 1000)
+    assert consultas() == poucas
+
+    monkeypatch.setattr(views.ProdutosLista, "max_consultas", 2)
+    with pytest.raises(OrcamentoConsultasExcedido):
+        client.get(urls[1])
+    settings.ORCAMENTO_CONSULTAS_MODO = "log"
+    assert client.get(urls[1]).status_code == 200
+
+
+@pytest.mark.django_db
+def test_facetas_contam_por_dimensao_cacheiam_e_invalidam(client, django_assert_num_queries):
+    user = User.objects.create_user(username="facetas_v2", password="pwd")
+    outro = User.objects.create_user(username="facetas_outro_v2", password="pwd")
+    PerfilUsuario.objects.create(usuario=user, papel=PerfilUsuario.ROLE_OPERATOR)
+    minha = TabelaProdutos.objects.create(nome="T_fac_minha", owner=user)
+    alheia = TabelaProdutos.objects.create(nome="T_fac_alheia", owner=outro)
+    ferragens = Categoria.objects.create(nome="Ferragens")
+    for nome, categoria, tabela, quantidade, preco in [
+        ("Prego", ferragens, minha, 0, "0.50"),
+        ("Parafuso", ferragens, minha, 5, "1.00"),
+        ("Martelo", ferragens, None, 30, "45.00"),
+        ("Tinta", None, minha, 8, "120.00"),
+        ("Serra", ferragens, alheia, 3, "60.00"),
+    ]:
+        Produtos.objects.create(nome=nome, categoria=categoria, tabela=tabela, quantidade=quantidade, preco=preco)
+
+    def totais(facetas, dimensao):
+        faceta = next(f for f in facetas if f["dimensao"] == dimensao)
+        return {o["rotulo"]: o["total"] for o in faceta["opcoes"] if o["total"]}
+
+    client.force_login(user)
+    url = reverse("inventario_v2:produtos_lista")
+    facetas = client.get(url).context["facetas"]
+    # a tabela alheia não aparece: seus produtos não são visíveis
+    assert totais(facetas, "tabela") == {"T_fac_minha": 3, "Sem tabela": 1}
+    assert totais(facetas, "categoria") == {"Ferragens": 3, "Sem categoria": 1}
+
+    resp = client.get(url, {"tabela": minha.pk, "preco": "ate-10"})
+    assert [p.nome for p in resp.context["produtos"]] == ["Parafuso", "Prego"]
+    facetas = resp.context["facetas"]
+    assert totais(facetas, "tabela") == {"T_fac_minha": 2}
+    assert totais(facetas, "preco") == {"Até R$ 10": 2, "R$ 50 a R$ 200": 1}
+    assert totais(facetas, "estoque") == {"Sem estoque": 1, "Estoque baixo (até 10)": 1}
+
+    base = Produtos.objects.visiveis_para(user)
+    contar_facetas(base, {"estoque": "baixo"})
+    with django_assert_num_queries(0):
+        contar_facetas(base, {"estoque": "baixo"})
+
+    Movimentacao.objects.create(produto=Produtos.objects.get(nome="Prego"), tipo=Movimentacao.TIPO_ENTRADA, quantidade=4)
+    json_facetas = client.get(reverse("inventario_v2:produtos_facetas"), {"tabela": minha.pk}).json()["facetas"]
+    assert totais(json_facetas, "estoque") == {"Estoque baixo (até 10)": 3}
+
+
+@pytest.mark.django_db
+def test_paginadores_sem_count_repetido(client, django_capture_on_commit_callbacks):
+    cache.clear()
+    user = User.objects.create_user(username="pag_admin_v2", password="pwd")
+    PerfilUsuario.objects.create(usuario=user, papel=PerfilUsuario.ROLE_ADMIN)
+    tabela = TabelaProdutos.objects.create(nome="T_pag", owner=user)
+    Produtos.objects.bulk_create(Produtos(nome=f"Pag{i:02d}", quantidade=i, tabela=tabela) for i in range(25))
+    produto = Produtos.objects.get(nome="Pag00")
+    Movimentacao.objects.bulk_create(
+        Movimentacao(produto=produto, usuario=user, tipo=Movimentacao.TIPO_ENTRADA, quantidade=1) for _ in range(30)
+    )
+    client.force_login(user)
+
+    def contagens(url, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = client.get(url, params)
+        return resp, sum("__count" in q["sql"] for q in ctx.captured_queries)
+
+    url = reverse("inventario_v2:produtos_lista")
+    resp, counts = contagens(url)
+    assert (resp.context["paginator"].count, counts) == (25, 1)
+    resp, counts = contagens(url, page=2)
+    assert (len(resp.context["produtos"]), counts) == (5, 0)
+    assert 'href="?page=1"' in resp.content.decode()
+
+    # o contador mantido acompanha inserções sem novo COUNT
+    with django_capture_on_commit_callbacks(execute=True):
+        Produtos.objects.create(nome="Pag_novo", quantidade=1, tabela=tabela)
+    resp, counts = contagens(url)
+    assert (resp.context["paginator"].count, counts) == (26, 0)
+
+    # a lista filtrada conta uma vez por versão dos dados; os links de página preservam o filtro
+    resp, counts = contagens(url, tabela=tabela.pk, page=2)
+    assert (resp.context["paginator"].count, counts) == (26, 1)
+    assert f"?tabela={tabela.pk}&page=1" in resp.content.decode()
+    assert contagens(url, tabela=tabela.pk)[1] == 0
+
+    url = reverse("inventario_v2:produto_movimentacoes", kwargs={"produto_pk": produto.pk})
+    resp, counts = contagens(url)
+    assert (len(resp.context["movimentacoes"]), counts) == (30, 0)
+    assert resp.context["page_obj"].has_next() is False
+    url = reverse("inventario_v2:movimentacoes_lista")
+    resp, counts = contagens(url)
+    page_obj = resp.context["page_obj"]
+    assert (counts, page_obj.has_next(), page_obj.paginator.num_pages) == (0, True, None)
+    assert contagens(url, page=2)[0].context["page_obj"].start_index() == 26
+    assert client.get(url, {"page": 3}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_fragmentos_das_listas_sem_layout(client):
+    user = User.objects.create_user(username="frag_v2", password="pwd")
+    PerfilUsuario.objects.create(usuario=user, papel=PerfilUsuario.ROLE_ADMIN)
+    tabela = TabelaProdutos.objects.create(nome="T_frag", owner=user)
+    for i in range(25):
+        produto = Produtos.objects.create(nome=f"Frag{i:02d}", quantidade=1, tabela=tabela)
+    Movimentacao.objects.create(produto=produto, usuario=user, tipo=Movimentacao.TIPO_ENTRADA, quantidade=1)
+    client.force_login(user)
+
+    for nome in ("produtos_lista", "movimentacoes_lista"):
+        url = reverse(f"inventario_v2:{nome}")
+        with CaptureQueriesContext(connection) as pagina:
+            completa = client.get(url)
+        with CaptureQueriesContext(connection) as fragmento:
+            resp = client.get(url, HTTP_X_FRAGMENTO="1")
+        html = resp.content.decode()
+        assert "<table" in html and "<html" not in html
+        assert len(html) < len(completa.content) and len(fragmento) <= len(pagina)
+        assert "X-Fragmento" in resp["Vary"] and "X-Fragmento" in completa["Vary"]
+
+    # o <select> de tabelas fica fora do fragmento: sem a consulta dele
+    url = reverse("inventario_v2:produtos_lista")
+    assert "tabelas" in client.get(url).context and "tabelas" not in client.get(url, HTTP_X_FRAGMENTO="1").context
+    html = client.get(url, {"fragmento": "1", "tabela": tabela.pk}).content.decode()
+    assert "Frag00" in html and "fragmento=" not in html and f"?tabela={tabela.pk}&page=2" in html
+
+
+@pytest.mark.django_db
+def test_duplicatas_agrupam_produtos_e_aparecem_no_admin(client, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    for nome, descricao, quantidade in [
+        ("Parafuso M6", "Parafuso de aço inox", 10),
+        ("Parafuso M-6 inox", "", 5),
+        ("PARAFUSO  m6", "", 1),
+        ("Parafuso M8", "", 7),
+        ("Porca M6", "", 3),
+        ("Teclado USB", "Teclado membrana", 2),
+        ("Teclado USB", "Teclado membrana", 4),
+        ("Mouse Óptico", "", 1),
+    ]:
+        Produtos.objects.create(nome=nome, descricao=descricao, quantidade=quantidade)
+
+    grupos = duplicatas.detectar_duplicatas(Produtos.objects.all())
+    nomes = [sorted(p["nome"] for p in g["produtos"]) for g in grupos]
+    # números diferentes (M6 x M8) não são duplicatas
+    assert nomes == [["PARAFUSO  m6", "Parafuso M-6 inox", "Parafuso M6"], ["Teclado USB", "Teclado USB"]]
+    assert grupos[0]["quantidade_total"] == 16 and 0.6 <= grupos[0]["similaridade"] < 1
+
+    saida = StringIO()
+    call_command("detectar_duplicatas", "--json", stdout=saida)
+    assert json.loads(saida.getvalue()) == grupos
+    admin = User.objects.create_user(username="dup_admin_v2", password="pwd", is_staff=True, is_superuser=True)
+    client.force_login(admin)
+    resp = client.get(reverse("admin:inventario_v2_produtos_duplicatas"))
+    assert resp.status_code == 200 and "Parafuso M-6 inox" in resp.content.decode()
+
+
+@pytest.mark.django_db
+def test_indice_de_relatorios_lista_o_manifesto_paginado(client, settings, monkeypatch, tmp_path, django_assert_num_queries):
+    from pathlib import Path
+
+    from inventario_v2.models import ArquivoRelatorio
+    from inventario_v2.relatorios import gerar_relatorio
+
+    settings.MEDIA_ROOT = str(tmp_path)
+    dono = User.objects.create_user(username="rel_manifesto_v2", password="pwd")
+    outro = User.objects.create_user(username="rel_manifesto_v2_outro", password="pwd")
+    geral = Path(gerar_relatorio()["arquivo"])
+    proprio = Path(gerar_relatorio(pks_tabelas=[3, 1], usuario=dono)["arquivo"])
+    registro = ArquivoRelatorio.objects.get(nome=proprio.name)
+    assert registro.dono == dono and registro.escopo == "3,1" and registro.tamanho == proprio.stat().st_size
+    ArquivoRelatorio.objects.bulk_create(
+        [
+            ArquivoRelatorio(pasta=registro.pasta, nome=f"antigo_{i:03d}.json", compartilhado=True, gerado_em=registro.gerado_em)
+            for i in range(60)
+        ]
+    )
+
+    # a página só consulta o manifesto: nada de listar a pasta
+    monkeypatch.setattr(Path, "iterdir", lambda self: pytest.fail("a página leu a pasta"))
+    client.force_login(outro)
+    with django_assert_num_queries(4):
+        resposta = client.get(reverse("inventario_v2:relatorios_index"))
+    assert resposta.context["paginator"].count == 61 and len(resposta.context["relatorios_files"]) == 50
+    listados = resposta.content.decode() + client.get(reverse("inventario_v2:relatorios_index"), {"page": 2}).content.decode()
+    assert geral.name in listados and proprio.name not in listados
+    client.force_login(dono)
+    assert client.get(reverse("inventario_v2:relatorios_index")).context["paginator"].count == 62
+    monkeypatch.undo()
+
+    # indexar_relatorios remove do manifesto o que sumiu e inclui o que foi copiado
+    geral.unlink()
+    (tmp_path / "relatorios" / "copiado.json").write_text("{}", encoding="utf-8")
+    call_command("indexar_relatorios", stdout=StringIO())
+    nomes = set(ArquivoRelatorio.objects.values_list("nome", flat=True))
+    assert geral.name not in nomes and "copiado.json" in nomes and "antigo_000.json" not in nomes
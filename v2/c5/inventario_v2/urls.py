@@ -14,6 +14,8 @@ urlpatterns = [
     path("produtos/adicionar/", views.ProdutosAdicionar.as_view(), name="produtos_adicionar"),
     path("produtos/<int:pk>/editar/", views.ProdutosEditar.as_view(), name="produtos_editar"),
     path("produtos/<int:pk>/remover/", views.ProdutosRemover.as_view(), name="produtos_remover"),
+    path("produtos/autocomplete/", views.api_produtos_autocomplete, name="produtos_autocomplete"),
+    path("produtos/facetas/", views.ProdutosFacetas.as_view(), name="produtos_facetas"),
 
     # movimentações
     path("movimentacoes/", views.MovimentacaoLista.as_view(), name="movimentacoes_lista"),
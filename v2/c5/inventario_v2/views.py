@@ -1,5 +1,4 @@
 from datetime import timedelta
-from pathlib import Path
 import logging
 
 from django.conf import settings
@@ -7,7 +6,7 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth import get_user_model, login
-from django.db.models import Sum, Q
+from django.db.models import Sum
 from django.db.models.functions import TruncDate
 from django.http import JsonResponse, HttpResponseForbidden
 from django.shortcuts import get_object_or_404, redirect
@@ -22,6 +21,10 @@ from django.views.generic import (
     TemplateView,
 )
 
+from inventario_comum.consultas import orcamento_consultas
+from inventario_comum.fragmentos import FragmentoMixin
+from inventario_comum.paginacao import PaginadorContagemCacheada, PaginadorSondado, query_sem_pagina
+
 from .forms import (
     ProdutosFormulario,
     MovimentacaoFormulario,
@@ -30,11 +33,18 @@ from .forms import (
     TabelaProdutosFormulario,
     PerfilUsuarioFormulario,
 )
-from .models import Categoria, Movimentacao, Produtos, PerfilUsuario, TabelaProdutos
+from .models import ArquivoRelatorio, Categoria, Movimentacao, Produtos, PerfilUsuario, TabelaProdutos
+from .busca import buscar, filtrar, ranquear
+from .facetas import aplicar_filtros, contar_facetas, facetas_para_exibir, filtros_do_request
+from .permissoes import permissoes_efetivas, tabelas_permitidas_ids
+from .relatorios import pasta_relatorios
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+LIMITE_AUTOCOMPLETE = 20
+LIMITE_AUTOCOMPLETE_MAXIMO = 50
+
 
 # -------------------
 # Controle de acesso
@@ -44,8 +54,8 @@ def usuario_eh_admin(usuario):
         return False
     if usuario.is_superuser:
         return True
-    perfil = getattr(usuario, "perfil", None)
-    if perfil and perfil.papel == PerfilUsuario.ROLE_ADMIN:
+    # papel vem do cache versionado de permissões (sem consulta na maioria dos requests)
+    if permissoes_efetivas(usuario)["papel"] == PerfilUsuario.ROLE_ADMIN:
         return True
     return False
 
@@ -58,12 +68,14 @@ class TabelaProdutosLista(LoginRequiredMixin, ListView):
     template_name = "inventario_v2/tabelas_lista.html"
     context_object_name = "tabelas"
     paginate_by = 50
+    paginator_class = PaginadorContagemCacheada
+    max_consultas = 7
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by("nome")
+        qs = super().get_queryset().select_related("owner").order_by("nome")
         if usuario_eh_admin(self.request.user):
             return qs
-        return qs.filter(Q(owner=self.request.user) | Q(acessos=self.request.user)).distinct()
+        return qs.filter(pk__in=tabelas_permitidas_ids(self.request.user))
 
 
 class TabelaProdutosAdicionar(LoginRequiredMixin, CreateView):
@@ -96,37 +108,60 @@ class TabelaProdutosRemover(LoginRequiredMixin, DeleteView):
 # -------------------
 # Produtos (CRUD) - com controle por tabela
 # -------------------
-class ProdutosLista(LoginRequiredMixin, ListView):
+class ProdutosLista(LoginRequiredMixin, FragmentoMixin, ListView):
     model = Produtos
     template_name = "inventario_v2/produtos_lista.html"
+    fragmento_template_name = "inventario_v2/_produtos_lista_fragmento.html"
     context_object_name = "produtos"
     paginate_by = 20
+    paginator_class = PaginadorContagemCacheada
+    # 4 consultas de facetas quando o cache está frio
+    max_consultas = 12
+
+    def get_base_queryset(self):
+        """Produtos visíveis com ?q= aplicado: a base da lista e das facetas."""
+        # índice full-text (busca.py); só o filtro, a relevância é anotada em get_queryset
+        return filtrar(Produtos.objects.visiveis_para(self.request.user), self.request.GET.get("q", "").strip())
+
+    def get_filtros(self):
+        if not hasattr(self, "_filtros"):
+            self._filtros = filtros_do_request(self.request.GET)
+        return self._filtros
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by("nome")
+        qs = aplicar_filtros(self.get_base_queryset(), self.get_filtros()).select_related("tabela").order_by("nome")
         q = self.request.GET.get("q", "").strip()
         if q:
-            qs = qs.filter(nome__icontains=q)
-        tabela = self.request.GET.get("tabela")
-        if usuario_eh_admin(self.request.user):
-            if tabela:
-                return qs.filter(tabela__id=tabela)
-            return qs
-        allowed_tabelas = TabelaProdutos.objects.filter(Q(owner=self.request.user) | Q(acessos=self.request.user)).distinct()
-        qs = qs.filter(tabela__in=allowed_tabelas)
-        if tabela:
-            qs = qs.filter(tabela__id=tabela)
+            # nome, descrição e categoria, mais relevantes primeiro
+            qs = ranquear(qs, q)
         return qs
 
+    def get_facetas(self):
+        contagens = contar_facetas(self.get_base_queryset(), self.get_filtros())
+        return facetas_para_exibir(contagens, self.get_filtros(), self.request.GET)
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
+        ctx["filtros"] = self.get_filtros()
+        ctx["facetas"] = self.get_facetas()
+        ctx["query_sem_pagina"] = query_sem_pagina(self.request.GET)
+        if self.eh_fragmento():
+            # as tabelas só alimentam o <select> do formulário, fora do fragmento
+            return ctx
         if usuario_eh_admin(self.request.user):
             ctx["tabelas"] = TabelaProdutos.objects.all().order_by("nome")
         else:
-            ctx["tabelas"] = TabelaProdutos.objects.filter(Q(owner=self.request.user) | Q(acessos=self.request.user)).distinct()
+            ctx["tabelas"] = TabelaProdutos.objects.filter(pk__in=tabelas_permitidas_ids(self.request.user))
         return ctx
 
 
+class ProdutosFacetas(ProdutosLista):
+    """GET com os mesmos parâmetros da lista -> {"facetas": [...]} (ver facetas.py)."""
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({"facetas": self.get_facetas()})
+
+
 class ProdutosAdicionar(LoginRequiredMixin, CreateView):
     model = Produtos
     form_class = ProdutosFormulario
@@ -136,7 +171,7 @@ class ProdutosAdicionar(LoginRequiredMixin, CreateView):
     def get_form(self, form_class=None):
         form = super().get_form(form_class)
         if not usuario_eh_admin(self.request.user):
-            allowed = TabelaProdutos.objects.filter(Q(owner=self.request.user) | Q(acessos=self.request.user)).distinct()
+            allowed = TabelaProdutos.objects.filter(pk__in=tabelas_permitidas_ids(self.request.user))
             form.fields["tabela"].queryset = allowed
         return form
 
@@ -150,25 +185,47 @@ class ProdutosEditar(LoginRequiredMixin, UpdateView):
     def get_form(self, form_class=None):
         form = super().get_form(form_class)
         if not usuario_eh_admin(self.request.user):
-            allowed = TabelaProdutos.objects.filter(Q(owner=self.request.user) | Q(acessos=self.request.user)).distinct()
+            allowed = TabelaProdutos.objects.filter(pk__in=tabelas_permitidas_ids(self.request.user))
             form.fields["tabela"].queryset = allowed
         return form
 
+    def get_queryset(self):
+        return Produtos.objects.visiveis_para(self.request.user)
+
 
 class ProdutosRemover(LoginRequiredMixin, DeleteView):
     model = Produtos
     template_name = "inventario_v2/produtos_remover.html"
     success_url = reverse_lazy("inventario_v2:produtos_lista")
 
+    def get_queryset(self):
+        return Produtos.objects.visiveis_para(self.request.user)
+
 
 # -------------------
 # Movimentações (CRUD)
 # -------------------
-class MovimentacaoLista(LoginRequiredMixin, ListView):
+class MovimentacaoLista(LoginRequiredMixin, FragmentoMixin, ListView):
     model = Movimentacao
     template_name = "inventario_v2/movimentacao_lista.html"
+    fragmento_template_name = "inventario_v2/_movimentacao_lista_fragmento.html"
     context_object_name = "movimentacoes"
     paginate_by = 25
+    # só "anterior/próxima": sem COUNT sobre o histórico inteiro
+    paginator_class = PaginadorSondado
+    max_consultas = 7
+
+    def get_queryset(self):
+        return (
+            super().get_queryset()
+            .filter(produto__in=Produtos.objects.visiveis_para(self.request.user))
+            .select_related("produto", "usuario")
+        )
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["query_sem_pagina"] = query_sem_pagina(self.request.GET)
+        return ctx
 
 
 class MovimentacaoAdicionar(LoginRequiredMixin, CreateView):
@@ -186,9 +243,11 @@ class MovimentacaoAdicionar(LoginRequiredMixin, CreateView):
 
     def get_form(self, form_class=None):
         form = super().get_form(form_class)
+        visiveis = Produtos.objects.visiveis_para(self.request.user)
+        form.fields["produto"].queryset = visiveis
         produto_pk = self.request.GET.get("produto") or self.request.POST.get("produto")
         if produto_pk:
-            form.fields["produto"].queryset = Produtos.objects.filter(pk=produto_pk)
+            form.fields["produto"].queryset = visiveis.filter(pk=produto_pk)
             form.fields["produto"].initial = produto_pk
         return form
 
@@ -214,12 +273,24 @@ class MovimentacaoDetalhe(LoginRequiredMixin, DetailView):
     model = Movimentacao
     template_name = "inventario_v2/movimentacao_detalhe.html"
     context_object_name = "movimentacao"
+    max_consultas = 6
+
+    def get_queryset(self):
+        return Movimentacao.objects.select_related("produto", "usuario").filter(
+            produto__in=Produtos.objects.visiveis_para(self.request.user)
+        )
 
 
 class MovimentacaoRemover(LoginRequiredMixin, DeleteView):
     model = Movimentacao
     template_name = "inventario_v2/movimentacao_remover.html"
 
+    def get_queryset(self):
+        # só movimentações de produtos visíveis; __str__ usa o nome do produto
+        return Movimentacao.objects.select_related("produto").filter(
+            produto__in=Produtos.objects.visiveis_para(self.request.user)
+        )
+
     def post(self, request, *args, **kwargs):
         obj = self.get_object()
         produto_pk = getattr(obj, "produto_id", None)
@@ -239,19 +310,18 @@ class ProdutoMovimentacoes(LoginRequiredMixin, ListView):
     template_name = "inventario_v2/produto_movimentacoes.html"
     context_object_name = "movimentacoes"
     paginate_by = 50
+    paginator_class = PaginadorSondado
+    max_consultas = 9
 
     def get_queryset(self):
-        produto_pk = self.kwargs.get("produto_pk")
-        produto = get_object_or_404(Produtos, pk=produto_pk)
-        tabela = produto.tabela
-        if tabela:
-            if not usuario_eh_admin(self.request.user) and self.request.user not in list(tabela.acessos.all()) and tabela.owner != self.request.user:
-                return Movimentacao.objects.none()
-        return produto.movimentacoes.all()
+        self.produto = get_object_or_404(Produtos, pk=self.kwargs.get("produto_pk"))
+        if not Produtos.objects.visiveis_para(self.request.user).filter(pk=self.produto.pk).exists():
+            return Movimentacao.objects.none()
+        return self.produto.movimentacoes.select_related("usuario")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["produto"] = get_object_or_404(Produtos, pk=self.kwargs.get("produto_pk"))
+        context["produto"] = self.produto
         return context
 
 
@@ -263,6 +333,8 @@ class CategoriaLista(LoginRequiredMixin, ListView):
     template_name = "inventario_v2/categorias_lista.html"
     context_object_name = "categorias"
     paginate_by = 50
+    paginator_class = PaginadorContagemCacheada
+    max_consultas = 7
 
 
 class CategoriaAdicionar(LoginRequiredMixin, CreateView):
@@ -331,10 +403,11 @@ class UsuariosLista(UsuariosBaseAdmin, ListView):
     template_name = "inventario_v2/usuarios_lista.html"
     context_object_name = "usuarios"
     paginate_by = 50
+    max_consultas = 7
 
     # ensure deterministic ordering to avoid UnorderedObjectListWarning
     def get_queryset(self):
-        return super().get_queryset().order_by("username")
+        return super().get_queryset().select_related("perfil").order_by("username")
 
 
 class UsuariosEditar(UsuariosBaseAdmin, UpdateView):
@@ -362,39 +435,38 @@ class UsuariosRemover(UsuariosBaseAdmin, DeleteView):
 # -------------------
 # Relatórios (mantidos)
 # -------------------
-class RelatoriosIndex(LoginRequiredMixin, TemplateView):
+class RelatoriosIndex(LoginRequiredMixin, ListView):
+    """Relatórios gerados, do manifesto (ArquivoRelatorio): uma consulta paginada, sem ler a pasta."""
     template_name = "inventario_v2/relatorios_index.html"
+    context_object_name = "relatorios_files"
+    paginate_by = 50
+    max_consultas = 6
+
+    def get_queryset(self):
+        if not getattr(settings, "MEDIA_ROOT", None):
+            return ArquivoRelatorio.objects.none()
+        return (
+            ArquivoRelatorio.objects.visiveis_para(self.request.user)
+            .filter(pasta=str(pasta_relatorios()))
+            .order_by("-gerado_em", "nome")
+            .only("nome", "tamanho", "gerado_em")
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["produtos"] = Produtos.objects.all().order_by("nome")
         context["categorias"] = Categoria.objects.all().order_by("nome")
-
-        rel_files = []
-        media_root = getattr(settings, "MEDIA_ROOT", None)
-        media_url = getattr(settings, "MEDIA_URL", "/media/")
-        if media_root:
-            rel_dir = Path(media_root) / "relatorios"
-            if rel_dir.exists():
-                for p in sorted(rel_dir.iterdir()):
-                    if p.is_file():
-                        rel_files.append(
-                            {
-                                "name": p.name,
-                                "url": f"{media_url.rstrip('/')}/relatorios/{p.name}",
-                            }
-                        )
-        context["relatorios_files"] = rel_files
+        context["relatorios_url"] = f"{getattr(settings, 'MEDIA_URL', '/media/').rstrip('/')}/relatorios/"
         return context
 
 
 class RelatorioProduto(LoginRequiredMixin, TemplateView):
     template_name = "inventario_v2/relatorio_produto.html"
+    max_consultas = 6
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         produto_pk = self.kwargs.get("produto_pk")
-        produto = get_object_or_404(Produtos, pk=produto_pk)
+        produto = get_object_or_404(Produtos.objects.visiveis_para(self.request.user), pk=produto_pk)
         context["produto"] = produto
         end = timezone.now().date()
         start = end - timedelta(days=30)
@@ -404,6 +476,28 @@ class RelatorioProduto(LoginRequiredMixin, TemplateView):
 
 
 @login_required
+@orcamento_consultas(7)
+def api_produtos_autocomplete(request):
+    """
+    GET ?q=&limite= -> {"resultados": [{id, texto}]} com os produtos visíveis para o
+    usuário (até `limite`, no máximo LIMITE_AUTOCOMPLETE_MAXIMO), buscados pelo índice
+    full-text. Alimenta os seletores de produto (movimentações e relatórios).
+    """
+    try:
+        limite = int(request.GET.get("limite", LIMITE_AUTOCOMPLETE))
+    except ValueError:
+        limite = LIMITE_AUTOCOMPLETE
+    limite = min(max(limite, 1), LIMITE_AUTOCOMPLETE_MAXIMO)
+    qs = Produtos.objects.visiveis_para(request.user).order_by("nome")
+    q = request.GET.get("q", "").strip()
+    if q:
+        qs = buscar(qs, q)
+    resultados = [{"id": pk, "texto": nome} for pk, nome in qs.values_list("pk", "nome")[:limite]]
+    return JsonResponse({"resultados": resultados})
+
+
+@login_required
+@orcamento_consultas(7)
 def api_produto_movimentacoes(request):
     produto_pk = request.GET.get("produto")
     if not produto_pk:
@@ -426,6 +520,9 @@ def api_produto_movimentacoes(request):
     if start > end:
         return JsonResponse({"error": "start cannot be after end date."}, status=400)
 
+    if not Produtos.objects.visiveis_para(request.user).filter(pk=produto_pk).exists():
+        return JsonResponse({"error": "Produto não encontrado."}, status=404)
+
     qs = (
         Movimentacao.objects.filter(
             produto_id=produto_pk,